@@ -34,6 +34,10 @@ setup(
     namespace_packages=['vecnet', ],
     scripts=['scripts/om_expand.cmd', 'scripts/om_expand'],
     install_requires=[],
+    extras_require={
+        # Faster parsing and lookups in scenario files (see vecnet.openmalaria.scenario.backend)
+        "lxml": ["lxml"],
+    },
     classifiers=[
         "Development Status :: 4 - Beta",
         "License :: OSI Approved :: Mozilla Public License 2.0 (MPL 2.0)",
@@ -25,23 +25,96 @@
 # else:
 #     __version__ = _dist.version
 
+import os
+from functools import partial
+from multiprocessing import Pool
 from xml.etree import ElementTree
 import StringIO
 from xml.etree.ElementTree import ParseError
 
 
-def get_schema_version_from_xml(xml):
+# Longest string that is checked for being a file name
+_MAX_PATH = 4096
+# Size of pieces fed to the parser while looking for the root tag
+_CHUNK_SIZE = 4096
+
+
+def _is_filename(xml):
+    """ Check if the string is a name of existing file rather than content of xml document.
+    Strings without "<" are never valid xml documents """
+    return len(xml) <= _MAX_PATH and "<" not in xml and "\0" not in xml and os.path.isfile(xml)
+
+
+class _SchemaVersionTarget(object):
+    """ XMLParser target that keeps schemaVersion of the root element instead of building the tree """
+    def __init__(self):
+        self.version = None
+        self.root = False
+
+    def start(self, tag, attrib):
+        if not self.root:
+            self.root = True
+            self.version = attrib.get("schemaVersion", None)
+
+    def end(self, tag):
+        pass
+
+    def data(self, data):
+        pass
+
+    def close(self):
+        return self.version
+
+
+def get_schema_version_from_xml(xml, validate=False):
     """ Get schemaVersion attribute from OpenMalaria scenario file
-    xml - open file or content of xml document to be processed
+    xml - open file, name of the file or content of xml document to be processed.
+    A string without "<" that names an existing file is read from that file, other strings are xml content.
+    validate - check that the whole document is well-formed (returns None if it is not, like ElementTree.parse)
+
+    By default parsing stops at the root tag, so the rest of a truncated or malformed document is not checked.
+    The tree is never built.
     """
+    fp = None
+    if isinstance(xml, bytearray):
+        xml = str(xml)
     if isinstance(xml, (str, unicode)):
-        xml = StringIO.StringIO(xml)
+        if _is_filename(xml):
+            xml = fp = open(xml, "rb")
+        else:
+            xml = StringIO.StringIO(xml)
+    target = _SchemaVersionTarget()
+    parser = ElementTree.XMLParser(target=target)
     try:
-        tree = ElementTree.parse(xml)
+        while validate or not target.root:
+            data = xml.read(_CHUNK_SIZE)
+            if not data:
+                return parser.close()
+            parser.feed(data)
+        return target.version
     except ParseError:
         # Not an XML file
         return None
-    root = tree.getroot()
-    return root.attrib.get('schemaVersion', None)
+    finally:
+        if fp is not None:
+            fp.close()
+
+
+def get_schema_versions_from_xml(xml_list, processes=None, validate=False):
+    """ Get schemaVersion attribute from a list of OpenMalaria scenario files
+    xml_list - list of filenames or contents of xml documents to be processed
+    processes - number of worker processes. None - use all CPUs, 1 - do not start a pool
+    validate - see get_schema_version_from_xml
+
+    Returns the list of schema versions in the same order as xml_list
+    """
+    if processes == 1 or len(xml_list) < 2:
+        return [get_schema_version_from_xml(xml, validate) for xml in xml_list]
+    pool = Pool(processes)
+    try:
+        return pool.map(partial(get_schema_version_from_xml, validate=validate), xml_list)
+    finally:
+        pool.close()
+        pool.join()
 
 from .experiment import ExperimentSpecification
\ No newline at end of file
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Compact storage of generated scenarios.
+
+Instead of a copy of the xml for every scenario, the archive (a SQLite database) keeps the experiment specification
+once and a short record for every scenario: selected arms, sampled values and the seed. Scenarios are materialized on
+demand by applying the record to the base scenario, the result is identical to the scenario generated by
+ExperimentSpecification.scenarios.
+
+    ScenarioArchive.create("experiment1.sqlite", ExperimentSpecification(fp), generate_seed=True)
+
+    archive = ScenarioArchive("experiment1.sqlite")
+    print len(archive), archive.xml(700000)
+    scenario = archive[700000]            # experiment.Scenario object, scenario.parameters has arms and samples
+    om_scenario = archive.scenario(700000)  # scenario.Scenario object
+
+Values of "file://" arms are stored in the archive, so the archive doesn't depend on external files.
+"""
+import copy
+import itertools
+import json
+import sqlite3
+
+from .experiment import ExperimentSpecification, RangeSweep, Scenario
+from .scenario.scenario import Scenario as OMScenario
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS scenarios (
+    id INTEGER PRIMARY KEY,
+    arms TEXT NOT NULL,
+    sample TEXT,
+    seed INTEGER
+);
+"""
+
+
+def _inline_files(experiment):
+    """
+    Copy of experiment specification with contents of "file://" arm values instead of file names
+    """
+    experiment = copy.deepcopy(experiment)
+    # Base scenario is already loaded from basefile
+    experiment.pop("basefile", None)
+    for sweep in experiment.get("sweeps", {}).values():
+        if RangeSweep.is_range(sweep):
+            continue
+        for arm in sweep.values():
+            for placeholder, value in arm.items():
+                if isinstance(value, (str, unicode)) and value[0:7] == "file://":
+                    with open(value[7:], "r") as fp:
+                        arm[placeholder] = fp.read()
+    return experiment
+
+
+class ScenarioArchive(object):
+    """
+    Scenarios stored as records of an experiment. Scenarios are numbered from 1, in the same order as generated by
+    ExperimentSpecification.scenarios (and om_expand).
+    """
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.executescript(SCHEMA)
+        meta = dict(self.connection.execute("SELECT key, value FROM meta"))
+        if "experiment" not in meta:
+            raise ValueError("%s is not a scenario archive" % path)
+        self.experiment = ExperimentSpecification(json.loads(meta["experiment"]))
+        self.sweep_names = json.loads(meta["sweep_names"])
+
+    @classmethod
+    def create(cls, path, experiment, generate_seed=False, chunk_size=10000):
+        """
+        Store all scenarios of the experiment (ExperimentSpecification object).
+        If the archive already exists, it should be created from the same experiment, and stored scenarios are not
+        generated again (an interrupted create can be resumed).
+        :rtype: ScenarioArchive
+        """
+        connection = sqlite3.connect(path)
+        try:
+            connection.executescript(SCHEMA)
+            stored = json.dumps(_inline_files(experiment.experiment), sort_keys=True)
+            existing = connection.execute("SELECT value FROM meta WHERE key = 'experiment'").fetchone()
+            if existing is not None and existing[0] != stored:
+                raise ValueError("%s was created for a different experiment" % path)
+            sweep_names = experiment.combinations()[0]
+            with connection:
+                connection.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                                       [("experiment", stored), ("sweep_names", json.dumps(sweep_names))])
+
+            count = connection.execute("SELECT COUNT(*) FROM scenarios").fetchone()[0]
+            last = connection.execute("SELECT seed FROM scenarios ORDER BY id DESC LIMIT 1").fetchone()
+            last_seed = None if last is None else last[0]
+            scenarios = experiment.scenarios(generate_seed=generate_seed, start=count,
+                                             seed_start=None if last_seed is None else last_seed + 1)
+            sample_names = sorted(experiment.experiment.get("sampling", {}).get("parameters", {}))
+            index = count
+            while True:
+                rows = []
+                for scenario in itertools.islice(scenarios, chunk_size):
+                    index += 1
+                    arms = [scenario.parameters[sweep_name] for sweep_name in sweep_names]
+                    sample = [scenario.parameters[name] for name in sample_names]
+                    rows.append((index, json.dumps(arms), json.dumps(sample) if sample else None, scenario.seed))
+                if not rows:
+                    break
+                with connection:
+                    connection.executemany("INSERT INTO scenarios VALUES (?, ?, ?, ?)", rows)
+        finally:
+            connection.close()
+        return cls(path)
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM scenarios").fetchone()[0]
+
+    def _record(self, index):
+        row = self.connection.execute("SELECT arms, sample, seed FROM scenarios WHERE id = ?", (index, )).fetchone()
+        if row is None:
+            raise IndexError("scenario %s is not in the archive" % index)
+        return row
+
+    def _materialize(self, arms, sample, seed):
+        arms = json.loads(arms)
+        parameters = dict(zip(self.sweep_names, arms))
+        xml = self.experiment._apply_combination(self.experiment.experiment["base"], self.sweep_names, arms)
+        if sample is not None:
+            sample_names = sorted(self.experiment.experiment["sampling"]["parameters"])
+            sample = dict(zip(sample_names, json.loads(sample)))
+            xml = self.experiment._apply_sample(xml, sample)
+            parameters.update(sample)
+        scenario = Scenario(xml, parameters)
+        if seed is not None:
+            scenario.seed = seed
+            scenario.xml = xml.replace("@seed@", str(seed))
+        return scenario
+
+    def __getitem__(self, index):
+        """
+        Scenario number index (starting from 1)
+        :rtype: experiment.Scenario
+        """
+        return self._materialize(*self._record(index))
+
+    def xml(self, index):
+        return self[index].xml
+
+    def scenario(self, index):
+        """
+        :rtype: scenario.Scenario
+        """
+        return OMScenario(self.xml(index))
+
+    def __iter__(self):
+        """
+        Iterate over all scenarios in order (experiment.Scenario objects)
+        """
+        for arms, sample, seed in self.connection.execute("SELECT arms, sample, seed FROM scenarios ORDER BY id"):
+            yield self._materialize(arms, sample, seed)
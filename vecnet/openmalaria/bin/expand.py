@@ -10,36 +10,121 @@
 # License (MPL), version 2.0.  If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import os
 import sys
+import json
 import argparse
+import sqlite3
 
+from vecnet.openmalaria.archive import ScenarioArchive
 from vecnet.openmalaria.experiment import ExperimentSpecification
+from vecnet.openmalaria.work_queue import WorkQueue
 
 
-def main(filename, generate_seed=False):
+def publish(exp, queue_path, generate_seed=False):
+    queue = WorkQueue(queue_path)
+    try:
+        published = len(queue)
+        added = queue.publish(exp.scenarios(generate_seed=generate_seed), complete=True)
+    finally:
+        queue.close()
+    if published:
+        print "%s scenarios were already in %s" % (published, queue_path)
+    print "%s scenarios added to %s" % (added, queue_path)
+    return 0
+
+
+CHECKPOINT_FILE = "scenarios.checkpoint"
+
+
+def write_checkpoint(filename, scenarios, seed, csvfile):
+    """
+    Save position of the expansion: number of generated scenarios, the last seed and the end of scenarios.csv.
+    Checkpoint is replaced atomically, so it is never incomplete.
+    """
+    csvfile.flush()
+    os.fsync(csvfile.fileno())
+    checkpoint = {"experiment": os.path.abspath(filename), "scenarios": scenarios, "seed": seed,
+                  "csv_offset": csvfile.tell()}
+    with open(CHECKPOINT_FILE + ".tmp", "w") as fp:
+        json.dump(checkpoint, fp)
+        fp.flush()
+        os.fsync(fp.fileno())
+    if os.name == "nt" and os.path.exists(CHECKPOINT_FILE):
+        # os.rename doesn't replace existing files on Windows
+        os.remove(CHECKPOINT_FILE)
+    os.rename(CHECKPOINT_FILE + ".tmp", CHECKPOINT_FILE)
+
+
+def read_checkpoint(filename):
+    try:
+        with open(CHECKPOINT_FILE) as fp:
+            checkpoint = json.load(fp)
+    except (IOError, ValueError) as e:
+        raise RuntimeError("Can't read %s: %s" % (CHECKPOINT_FILE, e))
+    if checkpoint["experiment"] != os.path.abspath(filename):
+        raise RuntimeError("%s was created for %s" % (CHECKPOINT_FILE, checkpoint["experiment"]))
+    return checkpoint
+
+
+def archive(exp, archive_path, generate_seed=False):
+    scenario_archive = ScenarioArchive.create(archive_path, exp, generate_seed=generate_seed)
+    print "%s scenarios stored in %s" % (len(scenario_archive), archive_path)
+    scenario_archive.close()
+    return 0
+
+
+def main(filename, generate_seed=False, queue=None, resume=False, checkpoint_interval=1000, archive_path=None):
 
     with open(filename) as fp:
         exp = ExperimentSpecification(fp)
 
-    i = 1
-    keys = exp.experiment["sweeps"].keys()
-    csvfile = open("scenarios.csv", "w")
-    # Write "header" of csv file
-    csvfile.write("filename")
-    for key in keys:
-        csvfile.write("," + key)
-    csvfile.write("\n")
+    if queue is not None:
+        return publish(exp, queue, generate_seed)
+    if archive_path is not None:
+        return archive(exp, archive_path, generate_seed)
 
-    for scenario in exp.scenarios(generate_seed=generate_seed):
+    keys = exp.experiment.get("sweeps", {}).keys()
+    if "sampling" in exp.experiment:
+        keys += sorted(exp.experiment["sampling"]["parameters"])
+    if resume:
+        # Continue after the last checkpoint, rows written after it are overwritten
+        checkpoint = read_checkpoint(filename)
+        i = checkpoint["scenarios"] + 1
+        seed = checkpoint["seed"]
+        csvfile = open("scenarios.csv", "r+")
+        csvfile.seek(checkpoint["csv_offset"])
+        csvfile.truncate()
+        scenarios = exp.scenarios(generate_seed=generate_seed, start=checkpoint["scenarios"],
+                                  seed_start=None if seed is None else seed + 1)
+    else:
+        i = 1
+        seed = None
+        csvfile = open("scenarios.csv", "w")
+        # Write "header" of csv file
+        csvfile.write("filename")
+        for key in keys:
+            csvfile.write("," + key)
+        csvfile.write("\n")
+        scenarios = exp.scenarios(generate_seed=generate_seed)
+
+    for scenario in scenarios:
         with open("scenario%s.xml" % i, "w") as fp:
             fp.write(scenario.xml)
         # Write parameters values used to generate this scenario
         csvfile.write("scenario%s.xml" % i)
         for key in keys:
-            csvfile.write("," + scenario.parameters.pop(key))
+            csvfile.write("," + str(scenario.parameters.pop(key)))
         csvfile.write("\n")
+        if scenario.seed is not None:
+            seed = scenario.seed
+        if checkpoint_interval and i % checkpoint_interval == 0:
+            write_checkpoint(filename, i, seed, csvfile)
         i += 1
     csvfile.close()
+    if os.path.exists(CHECKPOINT_FILE):
+        # Expansion is complete
+        os.remove(CHECKPOINT_FILE)
     print "%s scenarios generated" % (i-1)
     return 0
 
@@ -49,12 +134,27 @@ if __name__ == "__main__":
     parser.add_argument("--seed",
                         help="Automatically replace @seed@ placeholder with a seed number",
                         action="store_true")
+    parser.add_argument("--queue",
+                        help="Add scenarios to SQLite work queue instead of writing scenario files "
+                             "(resumes if the queue already has scenarios)")
+    parser.add_argument("--resume",
+                        help="Continue interrupted expansion from the last checkpoint (%s)" % CHECKPOINT_FILE,
+                        action="store_true")
+    parser.add_argument("--checkpoint-interval", type=int, default=1000,
+                        help="Save checkpoint every N scenarios (0 - no checkpoints, default 1000)")
+    parser.add_argument("--archive",
+                        help="Store scenarios in a compact archive (see vecnet.openmalaria.archive) instead of writing "
+                             "scenario files (resumes if the archive already has scenarios)")
     args = parser.parse_args()
 
     try:
         status = main(filename=args.exp_spec_name,
-                      generate_seed=args.seed)
-    except (RuntimeError, IOError) as e:
+                      generate_seed=args.seed,
+                      queue=args.queue,
+                      resume=args.resume,
+                      checkpoint_interval=args.checkpoint_interval,
+                      archive_path=args.archive)
+    except (RuntimeError, IOError, ValueError, sqlite3.Error) as e:
         print "Error: %s" % e
         status = 1
     sys.exit(status)
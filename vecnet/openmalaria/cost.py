@@ -0,0 +1,157 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Predicted cost (simulation time) of scenarios, for dispatching expensive scenarios first.
+
+Simulation time is proportional to the number of simulated human-timesteps (population size * time step of the last
+survey), and grows with the number of vector species and interventions:
+
+    cost = c0 + (c1 + c2 * vector species + c3 * interventions) * popSize * last survey time step
+
+Default coefficients give relative costs. CostEstimator.calibrate fits the coefficients to durations of past
+simulations, after that costs are in seconds.
+
+    estimator = CostEstimator()
+    estimator.calibrate([(result.scenario, result.duration) for result in previous_results if result.ok])
+    scenarios = list(experiment.scenarios(generate_seed=True))
+    ordered = [scenarios[i] for i in longest_first(estimator.costs(scenarios))]
+    bins = balanced_bins(estimator.costs(scenarios), workers=8)  # list of lists of scenario indices
+"""
+import heapq
+
+from .scenario.scenario import Scenario
+
+
+def scenario_features(scenario):
+    """
+    Size of the scenario: (popSize, time step of the last survey, number of vector species, number of interventions)
+    scenario is scenario.Scenario, experiment.Scenario or xml string
+    """
+    if not isinstance(scenario, Scenario):
+        scenario = Scenario(getattr(scenario, "xml", scenario))
+    survey_times = scenario.monitoring.survey_times
+    timesteps = max(survey_times) if survey_times else 0
+    vectors = 0
+    if scenario.entomology.et.find("vector") is not None:
+        vectors = len(scenario.entomology.vectors)
+    interventions = 0
+    if scenario.et.find("interventions") is not None:
+        interventions = len(scenario.interventions.human) + len(scenario.interventions.vectorPop)
+    return scenario.demography.popSize, timesteps, vectors, interventions
+
+
+def _regressors(features):
+    population, timesteps, vectors, interventions = features
+    size = float(population) * timesteps
+    return [1.0, size, size * vectors, size * interventions]
+
+
+def _solve(matrix, vector):
+    """
+    Solve linear system by Gaussian elimination with partial pivoting, None if the matrix is singular
+    """
+    n = len(vector)
+    rows = [list(row) + [value] for row, value in zip(matrix, vector)]
+    for column in range(n):
+        pivot = max(range(column, n), key=lambda row: abs(rows[row][column]))
+        if abs(rows[pivot][column]) < 1e-12 * max(1.0, max(abs(value) for value in rows[pivot][:n])):
+            return None
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        for row in range(column + 1, n):
+            factor = rows[row][column] / rows[column][column]
+            for k in range(column, n + 1):
+                rows[row][k] -= factor * rows[column][k]
+    solution = [0.0] * n
+    for row in reversed(range(n)):
+        solution[row] = (rows[row][n] - sum(rows[row][k] * solution[k] for k in range(row + 1, n))) / rows[row][row]
+    return solution
+
+
+class CostEstimator(object):
+    """
+    Linear model of simulation time, see module documentation.
+    coefficients - (c0, c1, c2, c3)
+    """
+    DEFAULT_COEFFICIENTS = (0.0, 1.0, 0.5, 0.1)
+
+    def __init__(self, coefficients=DEFAULT_COEFFICIENTS):
+        self.coefficients = tuple(coefficients)
+
+    def estimate(self, scenario):
+        """
+        Predicted cost of the scenario (never negative)
+        """
+        return self.estimate_features(scenario_features(scenario))
+
+    def estimate_features(self, features):
+        return max(0.0, sum(c * x for c, x in zip(self.coefficients, _regressors(features))))
+
+    def costs(self, scenarios):
+        """
+        List of predicted costs of scenarios
+        """
+        return [self.estimate(scenario) for scenario in scenarios]
+
+    def calibrate(self, timings):
+        """
+        Fit coefficients to durations of past simulations.
+        timings - list of (scenario, duration) pairs
+        If there are not enough different scenarios to fit all coefficients, current coefficients are scaled.
+        """
+        self.calibrate_features([(scenario_features(scenario), duration) for scenario, duration in timings])
+
+    def calibrate_features(self, timings):
+        """
+        The same as calibrate, timings is a list of (scenario_features(scenario), duration) pairs
+        """
+        if not timings:
+            raise ValueError("No timings to calibrate the model")
+        rows = [_regressors(features) for features, duration in timings]
+        durations = [float(duration) for features, duration in timings]
+        coefficients = None
+        if len(timings) >= len(self.coefficients):
+            # Least squares, normal equations
+            n = len(self.coefficients)
+            matrix = [[sum(row[i] * row[j] for row in rows) for j in range(n)] for i in range(n)]
+            vector = [sum(row[i] * duration for row, duration in zip(rows, durations)) for i in range(n)]
+            coefficients = _solve(matrix, vector)
+        if coefficients is None:
+            predictions = [sum(c * x for c, x in zip(self.coefficients, row)) for row in rows]
+            norm = sum(prediction * prediction for prediction in predictions)
+            if norm == 0:
+                raise ValueError("Can't calibrate the model, all predicted costs are zero")
+            scale = sum(prediction * duration for prediction, duration in zip(predictions, durations)) / norm
+            coefficients = [c * scale for c in self.coefficients]
+        self.coefficients = tuple(coefficients)
+
+
+def longest_first(costs):
+    """
+    Indices of scenarios ordered by decreasing cost (scenarios with the same cost keep their order)
+    """
+    return sorted(range(len(costs)), key=lambda index: -costs[index])
+
+
+def balanced_bins(costs, workers):
+    """
+    Split scenarios between workers so that total costs of the workers are close (longest processing time first).
+    :returns: list of `workers` lists of scenario indices, every list is ordered longest first
+    """
+    if workers < 1:
+        raise ValueError("Number of workers should be positive")
+    bins = [[] for worker in range(workers)]
+    # (total cost, worker)
+    loads = [(0.0, worker) for worker in range(workers)]
+    for index in longest_first(costs):
+        load, worker = heapq.heappop(loads)
+        bins[worker].append(index)
+        heapq.heappush(loads, (load + costs[index], worker))
+    return bins
@@ -9,16 +9,22 @@
 # License (MPL), version 2.0.  If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import itertools
 import json
+import math
+import operator
 import re
 import os
 from .helpers import prime_numbers
+from .sampling import placeholder, sample_parameters
 
 
 class Scenario:
     def __init__(self, xml, parameters=None):
         self.xml = xml
         self.parameters = parameters
+        # Value of @seed@ placeholder if it was generated by ExperimentSpecification.scenarios
+        self.seed = None
 
     def __str__(self):
         return self.xml
@@ -27,6 +33,282 @@ class Scenario:
         return self.xml
 
 
+class RangeSweep(object):
+    """
+    Sweep with arms generated from a numeric range. Arms are generated on demand, so the size of the sweep doesn't
+    affect loading time of the experiment specification.
+
+        "sweeps": {
+            "eir": {"range": {"placeholder": "@eir@", "start": 5, "stop": 500, "step": 5}},
+            "coverage": {"range": {"placeholder": "@coverage@", "linspace": [0, 1], "count": 11, "format": "%.2f"}},
+            "larvae": {"range": {"placeholder": "@larvae@", "logspace": [0.1, 1000], "count": 50, "format": "%.4g",
+                                 "name": "larvae %s"}}
+        }
+
+    "start", "stop", "step" - the same as python range function (stop value is not included), floats are allowed
+    "linspace" or "logspace" - [first, last] and "count", count values evenly spaced on linear or logarithmic scale
+    "format" - format of the value substituted in the scenario, "%s" by default
+    "name" - format of arm names (formatted value is substituted), "%s" by default
+    """
+    def __init__(self, definition):
+        self.placeholder = definition["placeholder"]
+        self.format = definition.get("format", "%s")
+        self.name = definition.get("name", "%s")
+        if "linspace" in definition or "logspace" in definition:
+            self.scale = "log" if "logspace" in definition else "linear"
+            first, last = definition["logspace" if self.scale == "log" else "linspace"]
+            self.count = int(definition["count"])
+            if self.scale == "log":
+                if first <= 0 or last <= 0:
+                    raise ValueError("logspace range should be positive")
+                first, last = math.log(first), math.log(last)
+            self.start = float(first)
+            self.step = (last - first) / float(self.count - 1) if self.count > 1 else 0.0
+        else:
+            self.scale = None
+            self.start = definition.get("start", 0)
+            self.step = definition.get("step", 1)
+            if self.step == 0:
+                raise ValueError("step should not be zero")
+            # Number of values is calculated arithmetically, with tolerance for float rounding errors
+            steps = (definition["stop"] - self.start) / float(self.step)
+            self.count = max(0, int(math.ceil(steps - 1e-9 * max(1.0, abs(steps)))))
+
+    @staticmethod
+    def is_range(sweep):
+        """
+        Returns True if sweep definition from experiment specification is a range
+        """
+        return isinstance(sweep.get("range"), dict) and "placeholder" in sweep["range"]
+
+    def __len__(self):
+        return self.count
+
+    def value(self, index):
+        """
+        Value of index-th arm
+        """
+        if not 0 <= index < self.count:
+            raise IndexError("range index out of range")
+        # Calculated from start every time to avoid accumulation of rounding errors
+        value = self.start + index * self.step
+        if self.scale == "log":
+            value = math.exp(value)
+        return value
+
+    def arm_name(self, index):
+        return self.name % (self.format % self.value(index))
+
+    def __iter__(self):
+        """
+        Iterate over arm names
+        """
+        for index in xrange(self.count):
+            yield self.arm_name(index)
+
+    def keys(self):
+        return list(self)
+
+    def _estimate(self, arm_name):
+        """
+        Index of the arm calculated from the value in arm_name, None if the value can't be parsed, -1 if arm_name
+        doesn't match the name format
+        """
+        if self.name.count("%s") != 1 or self.name.count("%") != 1 or not self.step:
+            return None
+        prefix, suffix = self.name.split("%s")
+        if len(arm_name) < len(prefix) + len(suffix) or not (arm_name.startswith(prefix) and
+                                                             arm_name.endswith(suffix)):
+            return -1
+        try:
+            value = float(arm_name[len(prefix):len(arm_name) - len(suffix)])
+            if self.scale == "log":
+                value = math.log(value)
+        except (ValueError, OverflowError):
+            return None
+        return int(round((value - self.start) / self.step))
+
+    def index(self, arm_name):
+        """
+        Index of the arm, None if there is no such arm.
+        The index is calculated from the value in the arm name, arms are scanned only if the value can't be parsed
+        (i.e. a custom format is used).
+        :raises: ValueError if several arms have this name
+        """
+        estimate = self._estimate(arm_name)
+        if estimate is None:
+            candidates = xrange(self.count)
+        elif estimate < 0:
+            return None
+        else:
+            # Formatted value may be rounded, check neighbours of the estimate
+            candidates = xrange(max(0, estimate - 2), min(self.count, estimate + 3))
+        for index in candidates:
+            if self.arm_name(index) == arm_name:
+                # Values are monotonic, so arms with the same name are next to each other
+                if index + 1 < self.count and self.arm_name(index + 1) == arm_name:
+                    raise ValueError("Duplicate arm name %s, use more precise format" % arm_name)
+                return index
+        return None
+
+    def __contains__(self, arm_name):
+        return self.index(arm_name) is not None
+
+    def __getitem__(self, arm_name):
+        """
+        Arm definition in the same format as an explicitly defined arm: {placeholder: value}
+        """
+        index = self.index(arm_name)
+        if index is None:
+            raise KeyError(arm_name)
+        return {self.placeholder: self.format % self.value(index)}
+
+
+class _Arms(object):
+    """
+    Arms of a fully factorial sweep as single-arm combinations
+    """
+    def __init__(self, sweep):
+        self.sweep = sweep
+
+    def __iter__(self):
+        for arm_name in self.sweep:
+            yield [arm_name]
+
+    def __len__(self):
+        return len(self.sweep)
+
+
+class _Check(object):
+    """
+    Checks a partial combination against constraints
+    """
+    def __init__(self, sweep_names, constraints):
+        self.sweep_names = sweep_names
+        self.constraints = constraints
+
+    def __call__(self, combination):
+        return all(constraint(self.sweep_names, combination) for constraint in self.constraints)
+
+
+def _product(sequences, checks=None, depth=0, prefix=()):
+    """
+    Generator. Cartesian product of sequences of combinations (lists of arm names), yields concatenated combinations.
+    The first sequence changes slowest.
+    checks - list of functions, checks[i](partial combination) is called after an item of i-th sequence is added.
+    If it returns False, all combinations starting with this partial combination are skipped.
+    """
+    if depth == len(sequences):
+        yield list(prefix)
+        return
+    for item in sequences[depth]:
+        combination = prefix + tuple(item)
+        if checks is not None and not checks[depth](combination):
+            continue
+        for result in _product(sequences, checks, depth + 1, combination):
+            yield result
+
+
+class Constraint(object):
+    """
+    Constraint on combinations of arms, defined in "constraints" section of experiment specification:
+
+        "constraints": [
+            {"exclude": {"itn": ["itn 0"], "irs": ["irs 80", "irs 90"]}},
+            {"include": {"model": "model1"}},
+            {"exclude": ["@itn_coverage@", "<", "@irs_coverage@"]},
+            {"include": ["@eir@", ">=", 10]}
+        ]
+
+    A dictionary sweep name -> arm name(s) matches combinations where every listed sweep has one of the listed arms.
+    A list [operand, operator, operand] compares values of placeholders in the selected arms (or constants),
+    numbers are compared as numbers. If none of the selected arms defines a placeholder, the constraint is ignored.
+    "exclude" removes matching combinations, "include" removes combinations that don't match.
+    """
+    OPERATORS = {
+        "<": operator.lt,
+        "<=": operator.le,
+        ">": operator.gt,
+        ">=": operator.ge,
+        "==": operator.eq,
+        "!=": operator.ne,
+    }
+
+    def __init__(self, definition, experiment):
+        """
+        definition - item of "constraints" list
+        experiment - ExperimentSpecification object
+        """
+        if len(definition) != 1 or definition.keys()[0] not in ("include", "exclude"):
+            raise ValueError("Constraint should have either include or exclude key: %s" % definition)
+        self.include = "include" in definition
+        self.experiment = experiment
+        condition = definition.values()[0]
+        self.arms = None
+        self.comparison = None
+        if isinstance(condition, dict):
+            self.arms = {}
+            for sweep_name, arm_names in condition.items():
+                if isinstance(arm_names, (str, unicode)):
+                    arm_names = [arm_names]
+                self.arms[sweep_name] = set(arm_names)
+            self.sweeps = set(self.arms)
+        else:
+            if len(condition) != 3 or condition[1] not in self.OPERATORS:
+                raise ValueError("Invalid comparison %s, supported operators: %s" %
+                                 (condition, ", ".join(sorted(self.OPERATORS))))
+            self.comparison = (condition[0], self.OPERATORS[condition[1]], condition[2])
+            self.sweeps = set()
+            for operand in (condition[0], condition[2]):
+                if self._is_placeholder(operand):
+                    sweeps = experiment.sweeps_defining(operand)
+                    if not sweeps:
+                        raise ValueError("Placeholder %s is not defined in any sweep" % operand)
+                    self.sweeps.update(sweeps)
+        for sweep_name in self.sweeps:
+            if sweep_name not in experiment.experiment.get("sweeps", {}):
+                raise ValueError("Unknown sweep %s in constraint" % sweep_name)
+
+    @staticmethod
+    def _is_placeholder(operand):
+        return isinstance(operand, (str, unicode)) and re.match("^@.*@$", operand) is not None
+
+    def _value(self, operand, sweep_names, combination):
+        if not self._is_placeholder(operand):
+            return operand
+        for sweep_name, arm_name in zip(sweep_names, combination):
+            # The first sweep wins, the same as in ExperimentSpecification._apply_combination
+            arm = self.experiment.sweep(sweep_name)[arm_name]
+            if operand in arm:
+                return arm[operand]
+        return None
+
+    def matches(self, sweep_names, combination):
+        if self.arms is not None:
+            arms = dict(zip(sweep_names, combination))
+            return all(arms[sweep_name] in arm_names for sweep_name, arm_names in self.arms.items())
+        left, compare, right = self.comparison
+        left = self._value(left, sweep_names, combination)
+        right = self._value(right, sweep_names, combination)
+        if left is None or right is None:
+            return None
+        try:
+            left, right = float(left), float(right)
+        except ValueError:
+            pass
+        return compare(left, right)
+
+    def __call__(self, sweep_names, combination):
+        """
+        Returns False if the combination (list of arm names, one for every sweep in sweep_names) violates the
+        constraint
+        """
+        matches = self.matches(sweep_names, combination)
+        if matches is None:
+            return True
+        return matches == self.include
+
+
 class ExperimentSpecification:
     """
     OpenMalaria experiment specification is a json file. This class is an SDK for working with that file format.
@@ -43,6 +325,7 @@ class ExperimentSpecification:
             raise TypeError("experiment should be either string or dict")
 
         self.experiment = experiment
+        self._range_sweeps = {}
         if "name" in self.experiment:
             self.name = self.experiment["name"]
         else:
@@ -62,8 +345,40 @@ class ExperimentSpecification:
     def __str__(self):
         return self.name
 
+    def sweep(self, sweep_name):
+        """
+        Arms of the sweep - dictionary arm name -> arm, or RangeSweep object for range sweeps.
+        Both support len(), iteration over arm names and lookup by arm name.
+        """
+        sweep = self.experiment["sweeps"][sweep_name]
+        if not RangeSweep.is_range(sweep):
+            return sweep
+        if sweep_name not in self._range_sweeps:
+            self._range_sweeps[sweep_name] = RangeSweep(sweep["range"])
+        return self._range_sweeps[sweep_name]
+
+    def sweeps_defining(self, placeholder):
+        """
+        Names of sweeps that have at least one arm with the placeholder
+        """
+        sweep_names = []
+        for sweep_name in self.experiment.get("sweeps", {}):
+            sweep = self.sweep(sweep_name)
+            if isinstance(sweep, RangeSweep):
+                if sweep.placeholder == placeholder:
+                    sweep_names.append(sweep_name)
+            elif any(placeholder in arm for arm in sweep.values()):
+                sweep_names.append(sweep_name)
+        return sweep_names
+
+    def constraints(self):
+        """
+        List of Constraint objects defined in the experiment specification
+        """
+        return [Constraint(definition, self) for definition in self.experiment.get("constraints", [])]
+
     def _apply_changes(self, scenario, sweep_name, arm_name):
-        arm = self.experiment["sweeps"][sweep_name][arm_name]
+        arm = self.sweep(sweep_name)[arm_name]
         for param_change in arm:
             # arm substitution string should start and end with an @
             if re.match("^@.*@$", param_change) is None:
@@ -80,6 +395,15 @@ class ExperimentSpecification:
             scenario = scenario.replace(param_change, param_value)
         return scenario
 
+    def _apply_sample(self, scenario, sample):
+        for name, value in sample.items():
+            parameter = self.experiment["sampling"]["parameters"][name]
+            # repr keeps all digits of a float (str rounds to 12 significant digits), so the scenario has exactly
+            # the value recorded in Scenario.parameters
+            text = repr(value) if isinstance(value, float) else str(value)
+            scenario = scenario.replace(placeholder(name, parameter), text)
+        return scenario
+
     def _apply_combination(self, scenario, sweeps_applied, combination):
         for i in range(0, len(sweeps_applied)):
             # Apply sweeps in order defined by user
@@ -88,12 +412,34 @@ class ExperimentSpecification:
             scenario = self._apply_changes(scenario, sweep, arm)
         return scenario
 
-    def scenarios(self, generate_seed=False):
+    def combinations(self):
         """
-        Generator function. Spits out scenarios for this experiment
+        Combinations of arms defined by "sweeps", "combinations" and "constraints" sections
+        :returns: (list of sweep names, generator of combinations - lists of arm names in the same order as sweeps)
+        """
+        sweep_names, sequences, checks = self._sequences()
+        return sweep_names, _product(sequences, checks)
+
+    def __len__(self):
+        """
+        Number of scenarios, calculated without generating them. Only combinations of sweeps used in constraints
+        are enumerated, other sweeps just multiply the count.
+        """
+        sweep_names, sequences, checks = self._sequences()
+        # Sequences after the last one with constraints don't affect validity of combinations
+        depth = max([i + 1 for i in range(len(sequences)) if checks[i].constraints] or [0])
+        count = sum(1 for combination in _product(sequences[:depth], checks[:depth]))
+        for sequence in sequences[depth:]:
+            count *= len(sequence)
+        if "sampling" in self.experiment:
+            count *= len(sample_parameters(self.experiment["sampling"]))
+        return count
+
+    def _sequences(self):
+        """
+        Returns (list of sweep names, list of sequences of combinations for _product, list of checks for _product)
         """
-        seed = prime_numbers(1000)
-        sweeps_all = self.experiment["sweeps"].keys()
+        sweeps_all = self.experiment.get("sweeps", {}).keys()
         if "combinations" in self.experiment:
             if isinstance(self.experiment["combinations"], list):
                 # For backward compatibility with experiments1-4s
@@ -132,44 +478,89 @@ class ExperimentSpecification:
         # print "fully fact: %s" % sweeps_fully_factorial
         
         # 2) produce a list of all combinations of fully factorial sweeps
-        # First sets of "combinations": the fully-factorial sweeps
+        # First sets of "combinations": the fully-factorial sweeps. Arms are not listed here, range sweeps
+        # generate them during enumeration
         for sweep in sweeps_fully_factorial:
-            all_combinations.append(([sweep], [[x] for x in self.experiment["sweeps"][sweep].keys()]))
-        
+            all_combinations.append(([sweep], _Arms(self.sweep(sweep))))
+
         # 3) take the dot (inner) product of the list above (fully factorial arm combinations)
         #   with the first combinations list, that with the second combination list, ...
-        # step-by-step reduce the list of combinations to a single item
-        # (dot-product of each list of combinations)
-        # this could use a lot of memory...
-        red_iter = 0
-        # print "all combinations:", red_iter, all_combinations
-        while len(all_combinations) > 1:
-            comb1 = all_combinations[0]
-            comb2 = all_combinations[1]
-            new_sweeps = comb1[0] + comb2[0]
-            new_combinations = [x+y for x in comb1[1] for y in comb2[1]]
-            all_combinations = [(new_sweeps, new_combinations)] + all_combinations[2:]
-            red_iter += 1
-            # print "all combinations:", red_iter, all_combinations
-        
+        # Combinations are generated lazily, so memory usage doesn't depend on the number of scenarios
+        sweep_names = []
+        for combinations_sweeps, combinations in all_combinations:
+            sweep_names += combinations_sweeps
+        sequences = [combinations for combinations_sweeps, combinations in all_combinations]
+
+        # Every constraint is checked as soon as arms of all its sweeps are selected, so combinations violating it
+        # are skipped without enumerating the rest of the sweeps
+        checks = [[] for sequence in sequences]
+        # depth_sweeps[i] - sweeps with selected arms after an item of i-th sequence is added
+        depth_sweeps = []
+        selected = set()
+        for combinations_sweeps, combinations in all_combinations:
+            selected = selected.union(combinations_sweeps)
+            depth_sweeps.append(selected)
+        for constraint in self.constraints():
+            for depth in range(len(sequences)):
+                if constraint.sweeps <= depth_sweeps[depth]:
+                    checks[depth].append(constraint)
+                    break
+            else:
+                raise ValueError("Constraint uses sweeps that are not in the experiment: %s" % constraint.sweeps)
+
+        return sweep_names, sequences, [_Check(sweep_names, constraints) for constraints in checks]
+
+    def scenarios(self, generate_seed=False, start=0, seed_start=None):
+        """
+        Generator function. Spits out scenarios for this experiment
+        If experiment has "sampling" section, every combination of sweeps is combined with every sample
+        (see vecnet.openmalaria.sampling)
+        Combinations violating constraints (see Constraint class) are skipped
+
+        start - number of scenarios to skip, used to resume an interrupted enumeration. Skipped scenarios are not
+        generated.
+        seed_start - seeds are prime numbers starting from seed_start. When resuming after a scenario with seed S, use
+        seed_start=S + 1 to continue the same sequence. By default seeds start from 1000, and seeds of skipped
+        scenarios are calculated (slow for large start values).
+        """
+        if seed_start is None:
+            seed = prime_numbers(1000)
+            if generate_seed:
+                for i in xrange(start):
+                    seed.next()
+        else:
+            seed = prime_numbers(seed_start)
+        sweep_names, combinations = self.combinations()
         # 4) write out the document for each in (3), which should specify one arm for each
         #   sweep with no repetition of combinations
-        sweep_names = all_combinations[0][0]
-        combinations = all_combinations[0][1]
-        for combination in combinations:
-            scenario = Scenario(self._apply_combination(self.experiment["base"], sweep_names, combination))
-            scenario.parameters = dict(zip(sweep_names, combination))
+        if "sampling" in self.experiment:
+            samples = sample_parameters(self.experiment["sampling"])
+        else:
+            samples = [{}]
+        if not samples:
+            return
+        skip_combinations, skip_samples = divmod(start, len(samples))
+        for combination in itertools.islice(combinations, skip_combinations, None):
+            xml = self._apply_combination(self.experiment["base"], sweep_names, combination)
+            for sample in samples[skip_samples:]:
+                scenario = Scenario(self._apply_sample(xml, sample))
+                scenario.parameters = dict(zip(sweep_names, combination))
+                scenario.parameters.update(sample)
 
-            if generate_seed:
-                # Replace seed if requested by the user
-                if "@seed@" in scenario.xml:
-                    scenario.xml = scenario.xml.replace("@seed@", str(seed.next()))
-                else:
-                    raise(RuntimeError("@seed@ placeholder is not found"))
-            yield scenario
+                if generate_seed:
+                    # Replace seed if requested by the user
+                    if "@seed@" in scenario.xml:
+                        scenario.seed = seed.next()
+                        scenario.xml = scenario.xml.replace("@seed@", str(scenario.seed))
+                    else:
+                        raise(RuntimeError("@seed@ placeholder is not found"))
+                yield scenario
+            skip_samples = 0
     
     def add_sweep(self, sweep_name):
         self.experiment["sweeps"][sweep_name] = {}
 
     def add_arm(self, sweep, arm_name, parameters):
+        if RangeSweep.is_range(self.experiment["sweeps"][sweep]):
+            raise TypeError("Can't add arms to range sweep %s" % sweep)
         self.experiment["sweeps"][sweep][arm_name] = parameters
@@ -12,6 +12,8 @@
 Helper functions for OpenMalaria Health System
 Please refer to https://docs.google.com/document/d/1-R-0s0vELuUJ-xuQabjwe1BhKCLYqC4-DBxvC0Z0oeI/edit for design notes
 """
+from bisect import bisect_right
+from collections import OrderedDict
 
 # Using dictionary instead of list to simplify debugging.
 probability_list = {
@@ -120,30 +122,216 @@ probability_list = {
     100: 0.9984184
 }
 
+# Probabilities sorted by percentage (0..100). Probability increases with percentage, so this list is sorted too.
+probabilities = [probability_list[percentage] for percentage in sorted(probability_list)]
 
-def get_prob_from_percentage(perc):
+
+class _LRUCache(object):
+    def __init__(self, size):
+        self.size = size
+        self.items = OrderedDict()
+
+    def get(self, key):
+        value = self.items.pop(key, None)
+        if value is not None:
+            self.items[key] = value
+        return value
+
+    def put(self, key, value):
+        if self.size <= 0:
+            return
+        self.items[key] = value
+        if len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+
+class Interpolator(object):
+    """
+    Interpolation of a table of points with strictly increasing x and y values.
+    method is "linear" (piecewise-linear) or "cubic" (monotone cubic Hermite spline, Fritsch-Carlson slopes).
+    Both methods pass through the table points and are monotone, so the interpolation can be inverted.
+
+    Interpolator and its inverse accept a number or a sequence of numbers (a list is returned in this case).
+    Results for numbers are kept in LRU cache of cache_size items.
+    """
+    def __init__(self, x, y, method="linear", cache_size=1024):
+        self.x = [float(value) for value in x]
+        self.y = [float(value) for value in y]
+        if len(self.x) != len(self.y) or len(self.x) < 2:
+            raise ValueError("x and y should have the same length, at least 2 points")
+        for values in (self.x, self.y):
+            if any(a >= b for a, b in zip(values, values[1:])):
+                raise ValueError("x and y values should be strictly increasing")
+        if method not in ("linear", "cubic"):
+            raise ValueError("Unknown interpolation method %s" % method)
+        self.method = method
+        self.slopes = self._slopes() if method == "cubic" else None
+        self._cache = _LRUCache(cache_size)
+        self._inverse_cache = _LRUCache(cache_size)
+
+    def _slopes(self):
+        x, y = self.x, self.y
+        h = [b - a for a, b in zip(x, x[1:])]
+        d = [(y[k + 1] - y[k]) / h[k] for k in range(len(h))]
+        slopes = [d[0]]
+        for k in range(1, len(h)):
+            # Weighted harmonic mean of neighbouring secants keeps the spline monotone
+            w1 = 2 * h[k] + h[k - 1]
+            w2 = h[k] + 2 * h[k - 1]
+            slopes.append((w1 + w2) / (w1 / d[k - 1] + w2 / d[k]))
+        slopes.append(d[-1])
+        return slopes
+
+    def _evaluate(self, k, t):
+        # Value at x[k] + t * (x[k + 1] - x[k]), 0 <= t <= 1
+        y0, y1 = self.y[k], self.y[k + 1]
+        if t == 1:
+            return y1
+        if self.method == "linear":
+            return y0 + (y1 - y0) * t
+        h = self.x[k + 1] - self.x[k]
+        return ((1 + 2 * t) * (1 - t) ** 2 * y0 + t * (1 - t) ** 2 * h * self.slopes[k] +
+                t ** 2 * (3 - 2 * t) * y1 + t ** 2 * (t - 1) * h * self.slopes[k + 1])
+
+    @staticmethod
+    def _interval(values, value):
+        if not values[0] <= value <= values[-1]:
+            raise ValueError("%s is out of range [%s, %s]" % (value, values[0], values[-1]))
+        return min(bisect_right(values, value) - 1, len(values) - 2)
+
+    def _forward(self, x):
+        y = self._cache.get(x)
+        if y is None:
+            k = self._interval(self.x, x)
+            y = self._evaluate(k, (x - self.x[k]) / (self.x[k + 1] - self.x[k]))
+            self._cache.put(x, y)
+        return y
+
+    def _inverse(self, y):
+        x = self._inverse_cache.get(y)
+        if x is not None:
+            return x
+        k = self._interval(self.y, y)
+        if y == self.y[k]:
+            x = self.x[k]
+        elif self.method == "linear":
+            x = self.x[k] + (self.x[k + 1] - self.x[k]) * (y - self.y[k]) / (self.y[k + 1] - self.y[k])
+        else:
+            # The spline is monotone within the interval, solve by bisection
+            low, high = 0.0, 1.0
+            for i in range(60):
+                t = (low + high) / 2
+                if self._evaluate(k, t) < y:
+                    low = t
+                else:
+                    high = t
+            x = self.x[k] + (self.x[k + 1] - self.x[k]) * (low + high) / 2
+        self._inverse_cache.put(y, x)
+        return x
+
+    def __call__(self, x):
+        if isinstance(x, (int, long, float)):
+            return self._forward(x)
+        return [self._forward(value) for value in x]
+
+    def inverse(self, y):
+        if isinstance(y, (int, long, float)):
+            return self._inverse(y)
+        return [self._inverse(value) for value in y]
+
+
+# Percentage of people treated -> probability of being treated on a timestep
+treatment_probability = Interpolator(sorted(probability_list), probabilities)
+
+
+def get_prob_from_percentage(perc, interpolate=False):
     """
     Converted percentage of people treated to probability of being treated on a timestep
+    If interpolate is True, perc can be fractional and the probability is interpolated linearly
     """
-    assert isinstance(perc, int)
+    if interpolate:
+        assert isinstance(perc, (float, int))
+    else:
+        assert isinstance(perc, int)
     assert perc < 101
     assert perc >= 0
 
-    return probability_list[perc]
+    if not interpolate or perc == int(perc):
+        return probabilities[int(perc)]
+    return treatment_probability(perc)
 
 
-def get_percentage_from_prob(prob):
+def get_percentage_from_prob(prob, interpolate=False):
     """
     Converted probability of being treated to total percentage of clinical cases treated
+    Percentage is rounded down unless interpolate is True, in this case fractional percentage is returned
     """
     assert isinstance(prob, (float, int))
     prob = float(prob)
     assert prob >= 0
     assert prob <= 1
 
-    percentages = probability_list.keys()
-    percentages.sort()
-    for percentage in percentages:
-        if prob < probability_list[percentage]:
-            return percentage - 1
-    return 100
+    if interpolate and prob < probabilities[-1]:
+        return treatment_probability.inverse(prob)
+    # Number of percentages with probability <= prob
+    return bisect_right(probabilities, prob) - 1
+
+
+def get_probs_from_percentages(percentages, interpolate=False):
+    """
+    get_prob_from_percentage for a sequence of percentages
+    Percentages are validated once, the table has a row for every whole percentage, so values are looked up by index.
+    :rtype: list
+    """
+    percentages = list(percentages)
+    if not percentages:
+        return []
+    assert all(isinstance(perc, (float, int) if interpolate else int) for perc in percentages)
+    assert max(percentages) < 101
+    assert min(percentages) >= 0
+    if max(percentages) > 100:
+        raise ValueError("%s is out of range [0, 100]" % max(percentages))
+
+    result = []
+    for perc in percentages:
+        k = int(perc)
+        if perc == k:
+            result.append(probabilities[k])
+        else:
+            # Linear interpolation, the same as treatment_probability
+            y0 = probabilities[k]
+            result.append(y0 + (probabilities[k + 1] - y0) * (perc - k))
+    return result
+
+
+def get_percentages_from_probs(probs, interpolate=False):
+    """
+    get_percentage_from_prob for a sequence of probabilities
+    Probabilities are validated once and sorted, so the table is walked once for all of them instead of a bisect per
+    value.
+    :rtype: list
+    """
+    probs = list(probs)
+    if not probs:
+        return []
+    assert all(isinstance(prob, (float, int)) for prob in probs)
+    probs = [float(prob) for prob in probs]
+    assert min(probs) >= 0
+    assert max(probs) <= 1
+
+    result = [None] * len(probs)
+    # Number of percentages with probability <= prob, grows as probabilities are processed in increasing order
+    position = 0
+    for i in sorted(xrange(len(probs)), key=probs.__getitem__):
+        prob = probs[i]
+        while position < len(probabilities) and probabilities[position] <= prob:
+            position += 1
+        k = position - 1
+        if not interpolate or prob >= probabilities[-1]:
+            result[i] = k
+        elif prob == probabilities[k]:
+            result[i] = float(k)
+        else:
+            # Linear inverse interpolation, the same as treatment_probability.inverse
+            result[i] = k + (prob - probabilities[k]) / (probabilities[k + 1] - probabilities[k])
+    return result
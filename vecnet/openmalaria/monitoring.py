@@ -11,47 +11,64 @@
 """
 Helper functions for OpenMalaria Monitoring Section.
 """
+from array import array
 from xml.etree.ElementTree import ParseError
 from vecnet.openmalaria.scenario.monitoring import Monitoring
 
 
 TIMESTEPS_PER_YEAR = 73
+# Time step of the beginning of every month within a year
+MONTH_OFFSETS = (0, 6, 11, 18, 24, 30, 36, 42, 48, 54, 60, 66)
+
+# Kind of survey by time step within a year
+_SURVEY_KIND = ["custom"] * TIMESTEPS_PER_YEAR
+for _offset in MONTH_OFFSETS:
+    _SURVEY_KIND[_offset] = "monthly"
+_SURVEY_KIND[0] = "yearly"
+
+
+def classify_survey_time(time):
+    """
+    Returns "yearly" if survey is at the beginning of a year, "monthly" if it is at the beginning of a month,
+    "custom" otherwise
+    """
+    return _SURVEY_KIND[time % TIMESTEPS_PER_YEAR]
+
+
+def classify_survey_times(times):
+    """
+    Returns kind of the last survey that is not at the beginning of a year, "yearly" if there are no such surveys
+    """
+    for time in reversed(times):
+        kind = _SURVEY_KIND[time % TIMESTEPS_PER_YEAR]
+        if kind != "yearly":
+            return kind
+    return "yearly"
 
 
 def get_survey_times(monitoring, start_date):
-    monitor_type = "yearly"
     monitor_yrs = 0
     monitor_mos = 0
     monitor_start_date = 0
 
     times = monitoring.surveys
-    for time_interval in times:
-        if time_interval % TIMESTEPS_PER_YEAR != 0:
-            if (time_interval-6) % TIMESTEPS_PER_YEAR == 0 or (time_interval-11) % TIMESTEPS_PER_YEAR == 0 or (time_interval-18) % TIMESTEPS_PER_YEAR == 0 or \
-                (time_interval-24) % TIMESTEPS_PER_YEAR == 0 or (time_interval-30) % TIMESTEPS_PER_YEAR == 0 or (time_interval-36) % TIMESTEPS_PER_YEAR == 0 or \
-                (time_interval-42) % TIMESTEPS_PER_YEAR == 0 or (time_interval-48) % TIMESTEPS_PER_YEAR == 0 or (time_interval-54) % TIMESTEPS_PER_YEAR == 0 or \
-                (time_interval-60) % TIMESTEPS_PER_YEAR == 0 or (time_interval-66) % TIMESTEPS_PER_YEAR == 0:
-                monitor_type = "monthly"
-            else:
-                monitor_type = "custom"
+    monitor_type = classify_survey_times(times)
 
     if len(times) > 0:
         if monitor_type == "yearly":
-            monitor_yrs = (times[-1] / TIMESTEPS_PER_YEAR) - (times[0] / TIMESTEPS_PER_YEAR)
-            monitor_start_date = start_date + (times[0] / TIMESTEPS_PER_YEAR)
+            monitor_yrs = (times[-1] // TIMESTEPS_PER_YEAR) - (times[0] // TIMESTEPS_PER_YEAR)
+            monitor_start_date = start_date + (times[0] // TIMESTEPS_PER_YEAR)
         elif monitor_type == 'monthly':
             mos_index = 0
 
             for i in range(len(times)-1, -1, -1):
                 if times[i] % TIMESTEPS_PER_YEAR == 0:
-                    monitor_yrs = (times[i] / TIMESTEPS_PER_YEAR) - (times[0] / TIMESTEPS_PER_YEAR)
+                    monitor_yrs = (times[i] // TIMESTEPS_PER_YEAR) - (times[0] // TIMESTEPS_PER_YEAR)
                     mos_index = i
                     break
 
-            for i in range(mos_index, len(times) - 1):
-                monitor_mos += 1
-
-            monitor_start_date = start_date + (times[0] / TIMESTEPS_PER_YEAR)
+            monitor_mos = len(times) - 1 - mos_index
+            monitor_start_date = start_date + (times[0] // TIMESTEPS_PER_YEAR)
 
     monitor_info = {
         "type": monitor_type,
@@ -64,35 +81,25 @@ def get_survey_times(monitoring, start_date):
     return monitor_info
 
 
-def set_survey_times(sim_start_date, monitor_yrs, monitor_mos, monitor_start_date, output_measurement):
-    surveys_list = []
+def get_survey_timesteps(sim_start_date, monitor_yrs, monitor_mos, monitor_start_date, output_measurement):
+    """
+    Survey time steps for yearly or monthly monitoring
+    :rtype: array
+    """
     years_before_monitor_start = monitor_start_date - sim_start_date
 
     if output_measurement == "yearly":
-        for yr in range(years_before_monitor_start, years_before_monitor_start + monitor_yrs + 1):
-            surveys_list.append(str(TIMESTEPS_PER_YEAR * yr))
-    elif output_measurement == "monthly":
+        return array("l", range(TIMESTEPS_PER_YEAR * years_before_monitor_start,
+                                TIMESTEPS_PER_YEAR * (years_before_monitor_start + monitor_yrs + 1),
+                                TIMESTEPS_PER_YEAR))
+    if output_measurement == "monthly":
         total_months = ((years_before_monitor_start + monitor_yrs) * 12) + monitor_mos
         months_before_monitor_start = years_before_monitor_start * 12
+        return array("l", [TIMESTEPS_PER_YEAR * (month // 12) + MONTH_OFFSETS[month % 12]
+                           for month in range(months_before_monitor_start, total_months + 1)])
+    return array("l")
 
-        new_timestep = 0
-        month_count = 0
-        for month in range(months_before_monitor_start, total_months + 1):
-            timesteps_to_add_for_month = 0
-
-            if month_count % 12 == 0:  # Begin next year.
-                new_timestep = TIMESTEPS_PER_YEAR * (month / 12)
-                month_count = 0
-            elif month_count == 2:
-                timesteps_to_add_for_month = 5
-            elif month_count == 3:
-                timesteps_to_add_for_month = 7
-            else:
-                timesteps_to_add_for_month = 6
-
-            new_timestep += timesteps_to_add_for_month
-            month_count += 1
 
-            surveys_list.append(str(new_timestep))
-
-    return surveys_list
+def set_survey_times(sim_start_date, monitor_yrs, monitor_mos, monitor_start_date, output_measurement):
+    return [str(timestep) for timestep in get_survey_timesteps(sim_start_date, monitor_yrs, monitor_mos,
+                                                               monitor_start_date, output_measurement)]
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Adaptive number of replicates (seeds) per parameter set.
+
+Seeded scenarios are generated in batches. After every batch, the chosen output measure of every parameter set is
+aggregated, and parameter sets with 95% confidence interval of the mean narrower than target_width don't get new
+seeds. Scenarios of the experiment are enumerated again for every batch instead of being kept in memory, and the seed
+of a generated scenario is stored in Scenario.seed.
+
+    replicates = AdaptiveReplicates(ExperimentSpecification(fp), survey_measure(0), target_width=50,
+                                    batch_size=10, max_replicates=50)
+    for parameter_set in replicates.run(Runner("openMalaria", "/tmp/experiment1")):
+        print parameter_set.parameters, parameter_set.statistics.mean, parameter_set.statistics.count
+"""
+import math
+
+from .experiment import Scenario
+from .helpers import prime_numbers
+
+# Two-sided 95% critical values of Student's t-distribution for 1..30 degrees of freedom
+STUDENT_T_95 = (
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042,
+)
+NORMAL_95 = 1.960
+
+
+def survey_measure(measure_id, third_dimension=0, survey=None):
+    """
+    Returns function that extracts a survey measure from OutputParser object.
+    survey - survey number (starting from 1), sum over all surveys if None
+    """
+    def measure(output):
+        values = [value for timestep, value in output.survey_output_data[(measure_id, third_dimension)]]
+        if survey is None:
+            return sum(values)
+        return values[survey - 1]
+    return measure
+
+
+class RunningStatistics(object):
+    """
+    Mean and variance updated one value at a time (Welford's algorithm), values are not stored.
+    """
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+    @property
+    def variance(self):
+        """
+        Sample variance, None if there are less than 2 values
+        """
+        if self.count < 2:
+            return None
+        return self._m2 / (self.count - 1)
+
+    def confidence_interval_width(self):
+        """
+        Width of 95% confidence interval of the mean (t-distribution), None if there are less than 2 values
+        """
+        if self.count < 2:
+            return None
+        degrees = self.count - 1
+        t = STUDENT_T_95[degrees - 1] if degrees <= len(STUDENT_T_95) else NORMAL_95
+        return 2 * t * math.sqrt(self.variance / self.count)
+
+
+class ParameterSet(object):
+    """
+    Replicates of a scenario with the same parameters and different seeds.
+    parameters - parameters of the scenario (experiment.Scenario.parameters)
+    seeds - seeds issued so far
+    statistics - RunningStatistics of the measure
+    failures - number of failed simulations
+    """
+    def __init__(self, parameters):
+        self.parameters = parameters
+        self.seeds = []
+        self.statistics = RunningStatistics()
+        self.failures = 0
+        self.pending = 0
+        self.done = False
+
+    @property
+    def width(self):
+        return self.statistics.confidence_interval_width()
+
+
+class AdaptiveReplicates(object):
+    """
+    experiment - ExperimentSpecification, base scenario should have @seed@ placeholder
+    measure - function OutputParser -> number (see survey_measure)
+    target_width - parameter set is complete when width of confidence interval is not greater than target_width
+    relative - target_width is relative to the absolute value of the mean
+    batch_size - number of seeds added to an incomplete parameter set at once
+    min_replicates - parameter set is never complete with fewer results (batch_size by default)
+    max_replicates - maximum number of seeds per parameter set (failed simulations are counted too)
+    Seeds are taken from the same sequence of prime numbers as ExperimentSpecification.scenarios uses.
+    """
+    def __init__(self, experiment, measure, target_width, relative=False, batch_size=10, min_replicates=None,
+                 max_replicates=50):
+        self.experiment = experiment
+        self.measure = measure
+        self.target_width = target_width
+        self.relative = relative
+        self.batch_size = batch_size
+        self.min_replicates = batch_size if min_replicates is None else min_replicates
+        self.max_replicates = max_replicates
+        if self.min_replicates < 2:
+            raise ValueError("min_replicates should be at least 2")
+        self._seed = prime_numbers(1000)
+        self._parameter_sets = []
+        self._pending = {}
+
+    @property
+    def parameter_sets(self):
+        """
+        List of ParameterSet objects, one for every scenario of the experiment enumerated so far (all scenarios once
+        the first batch is generated)
+        """
+        return self._parameter_sets
+
+    def batches(self):
+        """
+        Generator. Seeded scenarios for every incomplete parameter set that has no pending simulations.
+        Scenarios of the experiment are generated one at a time, and seeds of a parameter set are issued together.
+        """
+        for position, scenario in enumerate(self.experiment.scenarios()):
+            if position == len(self._parameter_sets):
+                if "@seed@" not in scenario.xml:
+                    raise RuntimeError("@seed@ placeholder is not found")
+                self._parameter_sets.append(ParameterSet(scenario.parameters))
+            parameter_set = self._parameter_sets[position]
+            if parameter_set.done or parameter_set.pending:
+                continue
+            count = min(self.batch_size, self.max_replicates - len(parameter_set.seeds))
+            seeds = [self._seed.next() for i in range(count)]
+            parameter_set.seeds.extend(seeds)
+            parameter_set.pending += count
+            for seed in seeds:
+                self._pending[seed] = parameter_set
+            for seed in seeds:
+                seeded = Scenario(scenario.xml.replace("@seed@", str(seed)), dict(parameter_set.parameters))
+                seeded.seed = seed
+                yield seeded
+
+    def next_batch(self):
+        """
+        List of seeded scenarios for every incomplete parameter set that has no pending simulations.
+        Returns empty list when all parameter sets are complete.
+        """
+        return list(self.batches())
+
+    def add_result(self, scenario, output):
+        """
+        Record output of a seeded scenario (OutputParser object, None if the simulation failed)
+        """
+        parameter_set = self._pending.pop(scenario.seed)
+        parameter_set.pending -= 1
+        if output is None:
+            parameter_set.failures += 1
+        else:
+            parameter_set.statistics.add(self.measure(output))
+        if not parameter_set.pending:
+            parameter_set.done = self.is_complete(parameter_set)
+
+    def is_complete(self, parameter_set):
+        if len(parameter_set.seeds) >= self.max_replicates:
+            return True
+        if parameter_set.statistics.count < self.min_replicates:
+            return False
+        target_width = self.target_width
+        if self.relative:
+            target_width *= abs(parameter_set.statistics.mean)
+        return parameter_set.width <= target_width
+
+    def run(self, runner):
+        """
+        Simulate batches using runner.Runner until all parameter sets are complete. Batches are passed to the runner
+        as generators, so only scenarios being simulated are kept in memory.
+        :raises: ValueError if runner doesn't parse output (parse_output=False)
+        :returns: list of ParameterSet objects
+        """
+        if not runner.parse_output:
+            raise ValueError("Runner should be created with parse_output=True to measure outputs")
+        index = 1
+        while True:
+            count = 0
+            for result in runner.run(self.batches(), start=index):
+                count += 1
+                self.add_result(result.scenario, result.output if result.ok else None)
+            if not count:
+                return self.parameter_sets
+            index += count
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Persistent store of simulation outputs, so identical scenarios are not simulated twice.
+
+Outputs are stored in <directory>/<scenario hash>/ (output.txt and ctsout.txt). The hash is calculated from the parsed
+scenario, so it doesn't depend on formatting, whitespace or order of attributes, but it depends on every value in the
+scenario including the seed.
+
+If max_size is set, least recently used results are removed when total size of the store exceeds max_size bytes.
+The directory is scanned once, on the first put, after that the store keeps track of results it adds and uses. Results
+added by other processes sharing the directory are counted when the store is created again.
+
+    store = ResultStore("/data/openmalaria_results", max_size=10 * 1024 ** 3)
+    runner = Runner("openMalaria", "/tmp/experiment1", store=store)
+"""
+import binascii
+import collections
+import os
+import shutil
+import tempfile
+import threading
+
+from .output_parser import OutputParser
+from .scenario.diff import Digests
+from .scenario.scenario import Scenario
+
+OUTPUT_FILES = ("output.txt", "ctsout.txt")
+
+
+def scenario_hash(scenario):
+    """
+    Canonical hash of a scenario (scenario.Scenario, experiment.Scenario or xml string)
+    :rtype: str
+    """
+    root = getattr(scenario, "root", None)
+    if root is None:
+        root = Scenario(getattr(scenario, "xml", scenario)).root
+    return binascii.hexlify(Digests(root).digest(root))
+
+
+class ResultStore(object):
+    def __init__(self, directory, max_size=None):
+        self.directory = directory
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        # Key -> size of stored files, least recently used first. Loaded on first use
+        self._index = None
+        self._total = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, scenario):
+        """
+        Returns dictionary filename -> path of stored output files, None if the scenario is not in the store
+        """
+        key = scenario_hash(scenario)
+        path = self._path(key)
+        try:
+            # Mark as recently used
+            os.utime(path, None)
+        except OSError:
+            return None
+        files = {}
+        for filename in OUTPUT_FILES:
+            if os.path.exists(os.path.join(path, filename)):
+                files[filename] = os.path.join(path, filename)
+        if "output.txt" not in files:
+            # Incomplete entry (i.e. created by hand), treated as missing
+            return None
+        with self._lock:
+            if self._index is not None and key in self._index:
+                self._index[key] = self._index.pop(key)
+        return files
+
+    def __contains__(self, scenario):
+        return os.path.exists(os.path.join(self._path(scenario_hash(scenario)), "output.txt"))
+
+    def load(self, scenario):
+        """
+        Parse stored output of the scenario
+        :rtype: OutputParser
+        """
+        files = self.get(scenario)
+        if files is None:
+            return None
+        xml = getattr(scenario, "xml", scenario)
+        with open(files["output.txt"]) as survey_fp:
+            if "ctsout.txt" not in files:
+                return OutputParser(xml, survey_output_file=survey_fp)
+            with open(files["ctsout.txt"]) as cts_fp:
+                return OutputParser(xml, survey_output_file=survey_fp, cts_output_file=cts_fp)
+
+    def restore(self, scenario, workdir):
+        """
+        Copy stored output files to workdir. Returns False if the scenario is not in the store
+        """
+        files = self.get(scenario)
+        if files is None:
+            return False
+        for path in files.values():
+            shutil.copy(path, workdir)
+        return True
+
+    def put(self, scenario, workdir):
+        """
+        Store output files from workdir (output.txt is required, ctsout.txt is optional).
+        Stored output of the same scenario is replaced (i.e. if it can't be parsed and the scenario was simulated again)
+        """
+        key = scenario_hash(scenario)
+        if not os.path.exists(os.path.join(workdir, "output.txt")):
+            raise IOError("output.txt is not found in %s" % workdir)
+        # Copy to a temporary directory first, so incomplete results are never visible
+        temp_dir = tempfile.mkdtemp(dir=self.directory, prefix=".tmp")
+        for filename in OUTPUT_FILES:
+            if os.path.exists(os.path.join(workdir, filename)):
+                shutil.copy(os.path.join(workdir, filename), temp_dir)
+        size = self._entry_size(temp_dir)
+        with self._lock:
+            old_dir = None
+            if os.path.isdir(self._path(key)):
+                # Move the old entry aside, so the key always refers to a complete result
+                old_dir = tempfile.mkdtemp(dir=self.directory, prefix=".old")
+                os.rename(self._path(key), os.path.join(old_dir, key))
+            os.rename(temp_dir, self._path(key))
+            if old_dir is not None:
+                shutil.rmtree(old_dir, ignore_errors=True)
+            if self._index is not None:
+                self._total += size - self._index.pop(key, 0)
+                self._index[key] = size
+            self._evict(keep=key)
+        return key
+
+    def size(self):
+        """
+        Total size of stored files in bytes
+        """
+        return sum(size for mtime, size, key in self._entries())
+
+    @staticmethod
+    def _entry_size(path):
+        return sum(os.path.getsize(os.path.join(path, filename)) for filename in os.listdir(path))
+
+    def _entries(self):
+        entries = []
+        for key in os.listdir(self.directory):
+            path = self._path(key)
+            if key.startswith(".") or not os.path.isdir(path):
+                continue
+            try:
+                entries.append((os.path.getmtime(path), self._entry_size(path), key))
+            except OSError:
+                # Removed by another process
+                continue
+        return entries
+
+    def _evict(self, keep):
+        if self.max_size is None:
+            return
+        if self._index is None:
+            self._index = collections.OrderedDict((key, size) for mtime, size, key in sorted(self._entries()))
+            self._total = sum(self._index.values())
+        for key in list(self._index):
+            if self._total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self._path(key), ignore_errors=True)
+            self._total -= self._index.pop(key)
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Run OpenMalaria simulations locally.
+
+Every scenario is simulated in its own working directory (scenario1, scenario2, ... - the same names as used by
+om_expand). At most `processes` simulations are running at the same time.
+
+    runner = Runner("/opt/openmalaria/openMalaria", "/tmp/experiment1",
+                    resources=["/opt/openmalaria/densities.csv", "/opt/openmalaria/scenario_32.xsd"],
+                    processes=4, timeout=3600, retries=1)
+    for result in runner.run(ExperimentSpecification(fp).scenarios(generate_seed=True)):
+        if result.ok:
+            print result.index, result.output.survey_output_data
+        else:
+            print result.index, result.error
+"""
+import itertools
+import multiprocessing
+import os
+import Queue
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.pool import ThreadPool
+
+from .output_parser import OutputParser
+
+SCENARIO_FILE = "scenario.xml"
+SURVEY_OUTPUT_FILE = "output.txt"
+CTS_OUTPUT_FILE = "ctsout.txt"
+
+
+class SimulationResult(object):
+    """
+    Result of a single simulation.
+    index - number of the scenario (starting from 1)
+    scenario - experiment.Scenario or scenario xml
+    workdir - working directory of the simulation
+    returncode - exit code of the last attempt (None if the simulation timed out or couldn't be started)
+    attempts - number of times the simulation was started
+    error - description of the error, None if simulation finished successfully
+    output - OutputParser object, None if simulation failed
+    cached - True if outputs were taken from the result store instead of running the simulation
+    duration - wall time of the last attempt in seconds (None if the simulation wasn't started)
+    """
+    def __init__(self, index, scenario, workdir):
+        self.index = index
+        self.scenario = scenario
+        self.workdir = workdir
+        self.returncode = None
+        self.attempts = 0
+        self.error = None
+        self.output = None
+        self.cached = False
+        self.duration = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __str__(self):
+        return "scenario%s: %s" % (self.index, "ok" if self.ok else self.error)
+
+
+class Runner(object):
+    """
+    Runs simulations in a pool of processes.
+
+    executable - simulator executable (string) or command prefix (list, i.e. ["python", "openmalaria.py"])
+    workdir - directory where working directories of the simulations are created
+    arguments - command line arguments, "{scenario}" is replaced by the name of the scenario file
+    resources - files copied to every working directory (densities.csv, scenario xsd file etc.)
+    processes - maximum number of simulations running at the same time (number of CPUs by default)
+    timeout - maximum duration of a simulation in seconds (None - no limit)
+    retries - how many times a failed or timed out simulation is restarted
+    parse_output - pass output files to OutputParser
+    store - result_store.ResultStore. Scenarios found in the store are not simulated, new results are saved there
+    """
+    poll_interval = 0.05
+
+    def __init__(self, executable, workdir, arguments=("--scenario", "{scenario}"), resources=(), processes=None,
+                 timeout=None, retries=0, parse_output=True, store=None):
+        if isinstance(executable, (str, unicode)):
+            executable = [executable]
+        self.command = list(executable)
+        self.workdir = workdir
+        self.arguments = list(arguments)
+        self.resources = list(resources)
+        self.processes = processes
+        self.timeout = timeout
+        self.retries = retries
+        self.parse_output = parse_output
+        self.store = store
+        # Running simulator processes, killed if run() is stopped early
+        self._processes = set()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def run(self, scenarios, start=1):
+        """
+        Generator. Runs every scenario and yields SimulationResult in order of completion.
+        scenarios is an iterable of experiment.Scenario objects or xml strings
+        (i.e. ExperimentSpecification.scenarios())
+        start - number of the first scenario
+        Scenarios are taken from the iterable as simulations finish (at most 2 * processes are waiting), so a large
+        generator is never loaded into memory. If the generator is closed before all scenarios are simulated,
+        running simulations are killed.
+        """
+        if not os.path.isdir(self.workdir):
+            os.makedirs(self.workdir)
+        processes = self.processes or multiprocessing.cpu_count()
+        pool = ThreadPool(processes)
+        results = Queue.Queue()
+        tasks = enumerate(scenarios, start)
+        pending = 0
+        self._stopped.clear()
+        try:
+            for task in itertools.islice(tasks, 2 * processes):
+                pool.apply_async(self._run, (task, ), callback=results.put)
+                pending += 1
+            while pending:
+                result, exc_info = self._get(results)
+                pending -= 1
+                if exc_info is not None:
+                    raise exc_info[0], exc_info[1], exc_info[2]
+                for task in itertools.islice(tasks, 1):
+                    pool.apply_async(self._run, (task, ), callback=results.put)
+                    pending += 1
+                yield result
+        finally:
+            if pending:
+                self._stop()
+            pool.close()
+            pool.join()
+
+    @staticmethod
+    def _get(results):
+        # Queue.get without timeout can't be interrupted by KeyboardInterrupt in python 2
+        while True:
+            try:
+                return results.get(timeout=1)
+            except Queue.Empty:
+                pass
+
+    def _stop(self):
+        self._stopped.set()
+        with self._lock:
+            for process in self._processes:
+                try:
+                    process.kill()
+                except OSError:
+                    # Already finished
+                    pass
+
+    def _run(self, args):
+        """
+        Returns (SimulationResult, None), or (None, exc_info) if run_scenario raised an exception
+        """
+        index, scenario = args
+        try:
+            return self.run_scenario(index, scenario), None
+        except Exception:
+            return None, sys.exc_info()
+
+    def run_scenario(self, index, scenario):
+        """
+        Run a single scenario in <workdir>/scenario<index> directory
+        :rtype: SimulationResult
+        """
+        result = SimulationResult(index, scenario, os.path.join(self.workdir, "scenario%s" % index))
+        if self._stopped.is_set():
+            result.error = "Stopped"
+            return result
+        xml = getattr(scenario, "xml", scenario)
+        try:
+            self._prepare(result.workdir, xml)
+        except (IOError, OSError) as e:
+            result.error = "Can't create working directory: %s" % e
+            return result
+
+        if self.store is not None and self.store.restore(xml, result.workdir):
+            result.cached = True
+            result.error = self._check_output(result, xml)
+            if result.error is None:
+                return result
+            # Stored output is broken, run the simulation
+            result.cached = False
+
+        while result.attempts <= self.retries and not self._stopped.is_set():
+            result.attempts += 1
+            started = time.time()
+            result.returncode, result.error = self._execute(result.workdir)
+            result.duration = time.time() - started
+            if result.error is None:
+                result.error = self._check_output(result, xml)
+            if result.error is None:
+                if self.store is not None:
+                    self.store.put(xml, result.workdir)
+                break
+        return result
+
+    def _prepare(self, workdir, xml):
+        if not os.path.isdir(workdir):
+            os.makedirs(workdir)
+        for resource in self.resources:
+            shutil.copy(resource, workdir)
+        if isinstance(xml, unicode):
+            xml = xml.encode("utf-8")
+        with open(os.path.join(workdir, SCENARIO_FILE), "wb") as fp:
+            fp.write(xml)
+
+    def _execute(self, workdir):
+        """
+        Run the simulator, returns (exit code, error)
+        """
+        for filename in (SURVEY_OUTPUT_FILE, CTS_OUTPUT_FILE):
+            # Remove output of the previous attempt
+            if os.path.exists(os.path.join(workdir, filename)):
+                os.remove(os.path.join(workdir, filename))
+
+        command = self.command + [argument.replace("{scenario}", SCENARIO_FILE) for argument in self.arguments]
+        with open(os.path.join(workdir, "stdout.txt"), "wb") as stdout, \
+                open(os.path.join(workdir, "stderr.txt"), "wb") as stderr:
+            with self._lock:
+                if self._stopped.is_set():
+                    return None, "Stopped"
+                try:
+                    process = subprocess.Popen(command, cwd=workdir, stdout=stdout, stderr=stderr)
+                except OSError as e:
+                    return None, "Can't start %s: %s" % (command[0], e)
+                self._processes.add(process)
+            try:
+                # subprocess in python 2 doesn't support timeouts
+                started = time.time()
+                while process.poll() is None:
+                    if self.timeout is not None and time.time() - started > self.timeout:
+                        process.kill()
+                        process.wait()
+                        return None, "Timeout (%s seconds)" % self.timeout
+                    time.sleep(self.poll_interval)
+            finally:
+                with self._lock:
+                    self._processes.discard(process)
+        if self._stopped.is_set():
+            return None, "Stopped"
+        if process.returncode != 0:
+            return process.returncode, "Exit code %s" % process.returncode
+        return process.returncode, None
+
+    def _check_output(self, result, xml):
+        survey_output = os.path.join(result.workdir, SURVEY_OUTPUT_FILE)
+        cts_output = os.path.join(result.workdir, CTS_OUTPUT_FILE)
+        if not os.path.exists(survey_output):
+            return "%s is not found" % SURVEY_OUTPUT_FILE
+        if not self.parse_output:
+            return None
+        try:
+            with open(survey_output) as survey_fp:
+                if os.path.exists(cts_output):
+                    with open(cts_output) as cts_fp:
+                        result.output = OutputParser(xml, survey_output_file=survey_fp, cts_output_file=cts_fp)
+                else:
+                    result.output = OutputParser(xml, survey_output_file=survey_fp)
+        except Exception as e:
+            # OutputParser fails in many ways on truncated or malformed output
+            return "Can't parse output: %s" % e
+        return None
+
+
+def run_simulations(scenarios, executable, workdir, **kwargs):
+    """
+    Run all scenarios, returns list of SimulationResult sorted by scenario number
+    kwargs are passed to Runner
+    """
+    results = list(Runner(executable, workdir, **kwargs).run(scenarios))
+    results.sort(key=lambda result: result.index)
+    return results
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Space-filling sampling designs for experiments with continuous parameters.
+
+"sampling" section of experiment specification:
+
+    "sampling": {
+        "method": "lhs",         # "lhs" (Latin hypercube), "sobol" or "halton"
+        "samples": 100,
+        "seed": 1,               # optional (0 by default), used by "lhs" only
+        "parameters": {
+            "eir": {"min": 1, "max": 100, "scale": "log"},
+            "itn_coverage": {"min": 0.2, "max": 0.8},
+            "nets": {"min": 1000, "max": 5000, "type": "int", "placeholder": "@number_of_nets@"}
+        }
+    }
+
+Every parameter replaces "@<parameter name>@" placeholder (or "placeholder" if specified) in the base scenario.
+Samples are the same every time the experiment is expanded, so om_expand --resume and ScenarioArchive can continue an
+interrupted expansion.
+"""
+import math
+import random
+
+from .helpers import prime_numbers
+
+# Sobol direction numbers (Joe and Kuo, new-joe-kuo-6.21201) for dimensions 2..21: (s, a, m_1 .. m_s)
+SOBOL_DIRECTIONS = [
+    (1, 0, (1, )),
+    (2, 1, (1, 3)),
+    (3, 1, (1, 3, 1)),
+    (3, 2, (1, 1, 1)),
+    (4, 1, (1, 1, 3, 3)),
+    (4, 4, (1, 3, 5, 13)),
+    (5, 2, (1, 1, 5, 5, 17)),
+    (5, 4, (1, 1, 5, 5, 5)),
+    (5, 7, (1, 1, 7, 11, 19)),
+    (5, 11, (1, 1, 5, 1, 1)),
+    (5, 13, (1, 1, 1, 3, 11)),
+    (5, 14, (1, 3, 5, 5, 31)),
+    (6, 1, (1, 3, 3, 9, 7, 49)),
+    (6, 13, (1, 1, 1, 15, 21, 21)),
+    (6, 16, (1, 3, 1, 13, 27, 49)),
+    (6, 19, (1, 1, 1, 15, 7, 5)),
+    (6, 22, (1, 3, 1, 15, 13, 25)),
+    (6, 25, (1, 1, 5, 5, 19, 61)),
+    (7, 1, (1, 3, 7, 11, 23, 15, 103)),
+    (7, 4, (1, 3, 7, 13, 13, 15, 69)),
+]
+SOBOL_BITS = 32
+# Seed of "lhs" design if the experiment doesn't specify one
+DEFAULT_SEED = 0
+
+
+def latin_hypercube(samples, dimensions, seed=None):
+    """
+    Latin hypercube design: every dimension is split into `samples` equal intervals, and every interval contains
+    exactly one point
+    :returns: list of points (tuples of numbers in [0, 1))
+    """
+    rng = random.Random(seed)
+    columns = []
+    for dimension in range(dimensions):
+        strata = range(samples)
+        rng.shuffle(strata)
+        columns.append([(stratum + rng.random()) / samples for stratum in strata])
+    return zip(*columns) if columns else [()] * samples
+
+
+def _radical_inverse(index, base):
+    result = 0.0
+    fraction = 1.0 / base
+    while index > 0:
+        index, digit = divmod(index, base)
+        result += digit * fraction
+        fraction /= base
+    return result
+
+
+def halton(samples, dimensions):
+    """
+    Halton sequence (radical inverse in prime bases 2, 3, 5, ...). The first point (0, 0, ...) is skipped.
+    :returns: list of points (tuples of numbers in [0, 1))
+    """
+    primes = prime_numbers()
+    bases = [primes.next() for dimension in range(dimensions)]
+    return [tuple(_radical_inverse(index, base) for base in bases) for index in range(1, samples + 1)]
+
+
+def _sobol_directions(dimension):
+    if dimension == 0:
+        return [1 << (SOBOL_BITS - i) for i in range(1, SOBOL_BITS + 1)]
+    s, a, m = SOBOL_DIRECTIONS[dimension - 1]
+    directions = [m[i] << (SOBOL_BITS - i - 1) for i in range(s)]
+    for i in range(s, SOBOL_BITS):
+        value = directions[i - s] ^ (directions[i - s] >> s)
+        for k in range(1, s):
+            if (a >> (s - 1 - k)) & 1:
+                value ^= directions[i - k]
+        directions.append(value)
+    return directions
+
+
+def sobol(samples, dimensions):
+    """
+    Sobol sequence (up to 21 dimensions), starting with (0, 0, ...).
+    Use a power of 2 as a number of samples for the best uniformity.
+    :returns: list of points (tuples of numbers in [0, 1))
+    """
+    if dimensions > len(SOBOL_DIRECTIONS) + 1:
+        raise ValueError("Sobol sequence supports up to %s dimensions" % (len(SOBOL_DIRECTIONS) + 1))
+    directions = [_sobol_directions(dimension) for dimension in range(dimensions)]
+    scale = float(1 << SOBOL_BITS)
+    point = [0] * dimensions
+    points = []
+    for index in range(samples):
+        points.append(tuple(value / scale for value in point))
+        # Gray code: flip the direction number of the lowest zero bit of index
+        bit = 0
+        while (index >> bit) & 1:
+            bit += 1
+        for dimension in range(dimensions):
+            point[dimension] ^= directions[dimension][bit]
+    return points
+
+
+DESIGNS = {
+    "lhs": lambda samples, dimensions, seed: latin_hypercube(samples, dimensions, seed),
+    "halton": lambda samples, dimensions, seed: halton(samples, dimensions),
+    "sobol": lambda samples, dimensions, seed: sobol(samples, dimensions),
+}
+
+
+def scale_value(u, parameter):
+    """
+    Map a number from [0, 1) to parameter range.
+    parameter is a dictionary with "min", "max", optional "scale" ("linear" or "log") and "type" ("float" or "int")
+    """
+    low, high = float(parameter["min"]), float(parameter["max"])
+    is_int = parameter.get("type", "float") == "int"
+    if is_int:
+        # [min, max + 1) range, so max has the same chance as other integers after rounding down
+        high += 1
+    if parameter.get("scale", "linear") == "log":
+        value = math.exp(math.log(low) + u * (math.log(high) - math.log(low)))
+    else:
+        value = low + u * (high - low)
+    if is_int:
+        return min(int(math.floor(value)), int(high) - 1)
+    return value
+
+
+def sample_parameters(sampling):
+    """
+    Generate parameter values for "sampling" section of experiment specification
+    :returns: list of dictionaries parameter name -> value
+    """
+    method = sampling.get("method", "lhs")
+    if method not in DESIGNS:
+        raise ValueError("Unknown sampling method %s, supported methods: %s" % (method, ", ".join(sorted(DESIGNS))))
+    names = sorted(sampling["parameters"])
+    points = DESIGNS[method](int(sampling["samples"]), len(names), sampling.get("seed", DEFAULT_SEED))
+    return [dict((name, scale_value(u, sampling["parameters"][name])) for name, u in zip(names, point))
+            for point in points]
+
+
+def placeholder(name, parameter):
+    """
+    Placeholder replaced by the value of the parameter in the base scenario
+    """
+    return parameter.get("placeholder", "@%s@" % name)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+XML tree backends for the scenario object model.
+
+"lxml" backend is used by default if lxml package is installed, "etree" (xml.etree.ElementTree from the standard
+library) is used otherwise. The default can be overridden with VECNET_OPENMALARIA_BACKEND environment variable ("etree"
+or "lxml") or set_default_backend, and the backend can be selected for a particular scenario
+(Scenario(xml, backend="etree")).
+
+Sections don't keep a reference to the backend - it is determined by the type of the element they wrap, so new
+elements are always created by the same backend as the rest of the tree (use element.makeelement or fromstring(xml, et)
+in sections).
+
+Documents are always serialized by xml.etree serializer, so Scenario.xml is the same for all backends.
+"""
+import os
+import warnings
+from xml.etree import ElementTree
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+
+class EtreeBackend(object):
+    """
+    xml.etree.ElementTree backend
+    """
+    name = "etree"
+
+    def fromstring(self, xml):
+        return ElementTree.fromstring(xml)
+
+    def is_element(self, et):
+        return isinstance(et, ElementTree.Element)
+
+
+class LxmlBackend(object):
+    """
+    lxml backend. Comments and processing instructions are dropped while parsing, like xml.etree does.
+    """
+    name = "lxml"
+
+    def __init__(self):
+        self.parser = lxml_etree.XMLParser(remove_comments=True, remove_pis=True, huge_tree=True)
+
+    def fromstring(self, xml):
+        if isinstance(xml, unicode):
+            # lxml doesn't accept unicode strings with encoding declaration
+            xml = xml.encode("utf-8")
+        try:
+            return lxml_etree.fromstring(xml, self.parser)
+        except lxml_etree.XMLSyntaxError as e:
+            # Raise the same exception as xml.etree backend
+            raise ElementTree.ParseError(str(e))
+
+    def is_element(self, et):
+        return isinstance(et, lxml_etree._Element)
+
+
+backends = {"etree": EtreeBackend()}
+if lxml_etree is not None:
+    backends["lxml"] = LxmlBackend()
+
+# Environment variable with the name of the default backend
+BACKEND_VARIABLE = "VECNET_OPENMALARIA_BACKEND"
+
+
+def get_backend(backend=None):
+    """
+    Get backend by name. Returns default backend if backend is None
+    """
+    if backend is None:
+        return _default_backend
+    if not isinstance(backend, (str, unicode)):
+        return backend
+    try:
+        return backends[backend]
+    except KeyError:
+        raise ValueError("Unknown xml backend %s, available backends: %s" % (backend, ", ".join(backends)))
+
+
+def _environment_backend():
+    """
+    Backend selected by VECNET_OPENMALARIA_BACKEND environment variable. If the variable is not set or names an
+    unavailable backend, lxml is used if it is installed, etree otherwise.
+    """
+    name = os.environ.get(BACKEND_VARIABLE)
+    if name:
+        try:
+            return get_backend(name)
+        except ValueError as e:
+            warnings.warn("%s=%s is ignored: %s" % (BACKEND_VARIABLE, name, e), RuntimeWarning)
+    return backends["lxml"] if "lxml" in backends else backends["etree"]
+
+
+_default_backend = _environment_backend()
+
+
+def set_default_backend(backend):
+    """
+    Change default backend for all scenarios created afterwards
+    """
+    global _default_backend
+    _default_backend = get_backend(backend)
+
+
+def get_backend_of(et):
+    """
+    Get backend that created et element
+    """
+    for backend in backends.values():
+        if backend.is_element(et):
+            return backend
+    return _default_backend
+
+
+def fromstring(xml, et=None):
+    """
+    Parse xml snippet using the same backend as et element (or default backend if et is None)
+    """
+    if et is None:
+        return _default_backend.fromstring(xml)
+    return get_backend_of(et).fromstring(xml)
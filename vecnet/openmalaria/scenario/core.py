@@ -72,7 +72,7 @@ def tag_value_setter(tag, attrib):
             tag_elem = self.et.find(tag)
 
             if tag_elem is None:
-                et = ElementTree.fromstring("<{}></{}>".format(tag, tag))
+                et = self.et.makeelement(tag, {})
                 self.et.append(et)
                 tag_elem = self.et.find(tag)
 
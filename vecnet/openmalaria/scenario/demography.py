@@ -53,7 +53,7 @@ class Demography(Section):
         return "popSize", int
     @popSize.setter
     def popSize(self, value):
-        self.et.attrib["popSize"] = value
+        self.et.attrib["popSize"] = str(value)
 
     @property  # growthRate (double)
     @attribute
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Structural comparison of scenario files.
+
+Both trees are walked once. Every element gets a digest of its subtree (tag, attributes, text and digests of
+children), so identical branches are skipped without looking inside.
+
+Repeatable child elements are matched by an identifying attribute (see KEY_ATTRIBUTES): components by id, mosquito
+species by mosquito, timed deployments by time and so on. Other elements are matched by position ([n] step, counted
+among siblings with the same tag, as in XPath). Changes are reported with paths in the same format as used by
+vecnet.openmalaria.scenario.patch, so changed values can be applied with Scenario.apply_patch, for example
+    Change("changed", "interventions/human/deployment[@name='Nets']/timed/deploy[@time='730']/@coverage", "0.6", "0.7")
+    Change("added", "interventions/human/component[@id='DDT']", None, <Element component>)
+
+Whitespace around element text is ignored.
+"""
+import hashlib
+from collections import namedtuple
+
+from vecnet.openmalaria.scenario.backend import fromstring
+
+# Attributes used to match repeatable elements (tag -> attributes in order of preference)
+KEY_ATTRIBUTES = {
+    "anopheles": ("mosquito", ),
+    "anophelesParams": ("mosquito", ),
+    "component": ("id", ),
+    "deploy": ("time", "targetAgeYrs"),
+    "deployment": ("name", ),
+    "intervention": ("name", ),
+    "option": ("name", ),
+    "rate": ("time", ),
+    "timedDeployment": ("time", ),
+}
+
+
+class Change(namedtuple("Change", ["kind", "path", "old", "new"])):
+    """
+    Single difference between two scenarios.
+    kind - "changed", "added" or "removed"
+    path - path to element or attribute (@attribute is the last step)
+    old, new - old and new value of an attribute or text, or removed/added element (None if not applicable)
+    """
+    __slots__ = ()
+
+
+def _root(scenario):
+    if hasattr(scenario, "root"):
+        # vecnet.openmalaria.scenario.Scenario
+        return scenario.root
+    if hasattr(scenario, "parameters"):
+        # vecnet.openmalaria.experiment.Scenario
+        scenario = scenario.xml
+    if isinstance(scenario, (str, unicode)):
+        return fromstring(scenario)
+    return scenario
+
+
+def _text(element):
+    text = element.text
+    if text is None:
+        return ""
+    return text.strip()
+
+
+def _key(element):
+    for attribute in KEY_ATTRIBUTES.get(element.tag, ()):
+        value = element.get(attribute)
+        if value is not None:
+            return element.tag, attribute, value
+    return element.tag, None, None
+
+
+def _step(key, index, count):
+    tag, attribute, value = key
+    step = tag
+    if attribute is not None:
+        quote = "'" if "'" not in value else '"'
+        step += "[@%s=%s%s%s]" % (attribute, quote, value, quote)
+    if count > 1:
+        step += "[%s]" % index
+    return step
+
+
+def _join(path, step):
+    if not path:
+        return step
+    return path + "/" + step
+
+
+def _children(element):
+    """
+    Returns (ordered list of (key, group, index, child) for element's children, dictionary group -> count)
+    Keyed children are numbered among children with the same key, other children - among all children with the same
+    tag, so the position means the same as [n] step in patch paths.
+    """
+    keys = []
+    counts = {}
+    for child in element:
+        if not isinstance(child.tag, basestring):
+            # Comment or processing instruction
+            continue
+        key = _key(child)
+        group = key if key[1] is not None else key[0]
+        counts[group] = counts.get(group, 0) + 1
+        keys.append((key, group, counts[group], child))
+    return keys, counts
+
+
+def _steps(old, new):
+    """
+    Returns ordered lists of (step, child) for children of old and new elements.
+    [n] is added to steps of a group if it is repeated on either side, so an element keeps its step when copies of
+    it are added or removed.
+    """
+    old_keys, old_counts = _children(old)
+    new_keys, new_counts = _children(new)
+    counts = dict(old_counts)
+    for group, count in new_counts.items():
+        counts[group] = max(count, counts.get(group, 0))
+    return ([(_step(key, index, counts[group]), child) for key, group, index, child in old_keys],
+            [(_step(key, index, counts[group]), child) for key, group, index, child in new_keys])
+
+
+class Digests(object):
+    """
+    Cache of subtree digests for a single tree.
+    Elements are used as dictionary keys (not id(element)), so lxml proxy elements stay alive while cached.
+    """
+    def __init__(self, root):
+        self.root = root
+        self.digests = {}
+        self.digest(root)
+
+    def digest(self, element):
+        digest = self.digests.get(element)
+        if digest is not None:
+            return digest
+        sha = hashlib.sha1()
+        sha.update(repr((element.tag, sorted(element.attrib.items()), _text(element))))
+        for child in element:
+            if isinstance(child.tag, basestring):
+                sha.update(self.digest(child))
+        digest = sha.digest()
+        self.digests[element] = digest
+        return digest
+
+
+class Differ(object):
+    """
+    Compare scenarios against the same base scenario.
+    Digests of the base are calculated once, so comparing many scenarios takes time proportional to their size.
+
+    differ = Differ(base_scenario)
+    for scenario in scenarios:
+        changes = differ.compare(scenario)
+    """
+    def __init__(self, base):
+        self.base = Digests(_root(base))
+
+    def compare(self, scenario):
+        """
+        :returns: list of Change
+        """
+        other = Digests(_root(scenario))
+        changes = []
+        self._compare(self.base.root, other.root, "", other, changes)
+        return changes
+
+    def _compare(self, old, new, path, other, changes):
+        if self.base.digest(old) == other.digest(new):
+            return
+        if old.tag != new.tag:
+            changes.append(Change("removed", path, old, None))
+            changes.append(Change("added", path, None, new))
+            return
+
+        for name in sorted(set(old.attrib.keys()) | set(new.attrib.keys())):
+            old_value = old.get(name)
+            new_value = new.get(name)
+            if old_value == new_value:
+                continue
+            if old_value is None:
+                kind = "added"
+            elif new_value is None:
+                kind = "removed"
+            else:
+                kind = "changed"
+            changes.append(Change(kind, _join(path, "@" + name), old_value, new_value))
+
+        if _text(old) != _text(new):
+            changes.append(Change("changed", path, _text(old), _text(new)))
+
+        old_children, new_steps = _steps(old, new)
+        new_children = dict(new_steps)
+        for step, old_child in old_children:
+            new_child = new_children.pop(step, None)
+            if new_child is None:
+                changes.append(Change("removed", _join(path, step), old_child, None))
+            else:
+                self._compare(old_child, new_child, _join(path, step), other, changes)
+        for step, new_child in new_steps:
+            if step in new_children:
+                changes.append(Change("added", _join(path, step), None, new_child))
+
+
+def diff(old, new):
+    """
+    Compare two scenarios (Scenario objects, root elements or xml strings)
+    :returns: list of Change
+    """
+    return Differ(old).compare(new)
+
+
+def diff_many(base, scenarios):
+    """
+    Generator. Compare every scenario against base scenario, yields a list of Change for each scenario
+    """
+    differ = Differ(base)
+    for scenario in scenarios:
+        yield differ.compare(scenario)
@@ -8,12 +8,92 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License (MPL), version 2.0.  If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
-from xml.etree.ElementTree import Element
-from xml.etree import ElementTree
+import copy
+from array import array
+from collections import OrderedDict
+from math import cos, exp, log, sin, pi
+
+from vecnet.openmalaria.scenario.backend import fromstring
 from vecnet.openmalaria.scenario.core import Section, attribute, tag_value, section, attribute_setter, tag_value_setter
 
+DAYS_PER_YEAR = 365
+# Interventions that have anophelesParams section for every vector
+INTERVENTIONS_WITH_ANOPHELES_PARAMS = ("GVI", "ITN", "IRS")
+MONTHS_PER_YEAR = 12
+SMOOTHING_FUNCTIONS = ("none", "fourier")
+
+# Month of every day of the year (months are of equal length, 365/12 days)
+_DAY_MONTH = [day * MONTHS_PER_YEAR // DAYS_PER_YEAR for day in range(DAYS_PER_YEAR)]
+
+
+# OpenMalaria places the first month at angle 0 and the first day of the year pi * (1/12 - 1/365) later
+# (EIRRotateAngle in AnophelesModel)
+_DAY_ROTATION = pi * (1.0 / MONTHS_PER_YEAR - 1.0 / DAYS_PER_YEAR)
+
+
+def _harmonics(angles):
+    # Values of cos(kx), sin(kx) for k = 1, 2
+    table = []
+    for k in (1, 2):
+        table.append([cos(k * angle) for angle in angles])
+        table.append([sin(k * angle) for angle in angles])
+    return table
+
+_MONTH_HARMONICS = _harmonics([2 * pi * month / MONTHS_PER_YEAR for month in range(MONTHS_PER_YEAR)])
+_DAY_HARMONICS = _harmonics([2 * pi * day / DAYS_PER_YEAR - _DAY_ROTATION for day in range(DAYS_PER_YEAR)])
+
+
+def expand_monthly_values(monthly_values, smoothing="none"):
+    """
+    Convert 12 monthly values to 365 daily values.
+    none - step function, every month is 365/12 days long
+    fourier - the same smoothing as OpenMalaria uses: Fourier series with terms up to a2/b2 is fitted to logarithms of
+    the monthly values (discrete Fourier transform), and daily values are exponents of the series. Zero values are
+    replaced by 1% of the smallest positive value. OpenMalaria then scales the daily values to annualEIR.
+    :rtype: array
+    """
+    if len(monthly_values) != MONTHS_PER_YEAR:
+        raise ValueError("Expected %s monthly values, got %s" % (MONTHS_PER_YEAR, len(monthly_values)))
+    if smoothing == "none":
+        return array("d", [monthly_values[month] for month in _DAY_MONTH])
+    if smoothing != "fourier":
+        raise ValueError("Unknown smoothing function %s" % smoothing)
+    if min(monthly_values) < 0:
+        raise ValueError("Monthly values can't be negative")
+    positive = [value for value in monthly_values if value > 0]
+    if not positive:
+        return array("d", [0.0] * DAYS_PER_YEAR)
+    smallest = min(positive) * 0.01
+    log_values = [log(value if value > 0 else smallest) for value in monthly_values]
+    a0 = sum(log_values) / MONTHS_PER_YEAR
+    coefficients = [2.0 * sum(value * basis for value, basis in zip(log_values, row)) / MONTHS_PER_YEAR
+                    for row in _MONTH_HARMONICS]
+    a1, b1, a2, b2 = _DAY_HARMONICS
+    c_a1, c_b1, c_a2, c_b2 = coefficients
+    return array("d", [exp(a0 + c_a1 * a1[day] + c_b1 * b1[day] + c_a2 * a2[day] + c_b2 * b2[day])
+                       for day in range(DAYS_PER_YEAR)])
+
+
+def daily_to_timesteps(daily_values, days_per_timestep=5):
+    """
+    Average daily values over time steps (365 days -> 73 five-day time steps)
+    :rtype: array
+    """
+    return array("d", [sum(daily_values[start:start + days_per_timestep]) / float(days_per_timestep)
+                       for start in range(0, len(daily_values), days_per_timestep)])
+
 
 class Seasonality(Section):
+    """
+    Monthly values, daily and time step series are cached. The cache is reset by monthlyValues and smoothing
+    setters, changes made through other objects are not tracked.
+    """
+    def __init__(self, et):
+        super(Seasonality, self).__init__(et)
+        self._values = None
+        self._daily = None
+        self._timesteps = None
+
     @property  # input
     @attribute
     def input(self):
@@ -59,6 +139,12 @@ class Seasonality(Section):
         https://github.com/SwissTPH/openmalaria/wiki/GeneratedSchema32Doc#smoothing-function
         """
         return "monthlyValues", "smoothing", str
+    @smoothing.setter
+    def smoothing(self, value):
+        assert value in SMOOTHING_FUNCTIONS
+        self.et.find("monthlyValues").attrib["smoothing"] = value
+        self._daily = None
+        self._timesteps = None
 
     @property  # monthlyValues
     def monthlyValues(self):
@@ -70,10 +156,7 @@ class Seasonality(Section):
 
         https://github.com/SwissTPH/openmalaria/wiki/GeneratedSchema32Doc#list-of-monthly-values
         """
-        monthly_values = []
-        for value in self.et.find("monthlyValues").findall("value"):
-            monthly_values.append(float(value.text))
-        return monthly_values
+        return list(self.values)
     @monthlyValues.setter
     def monthlyValues(self, monthly_values):
         tag = self.et.find("monthlyValues")
@@ -81,9 +164,48 @@ class Seasonality(Section):
         for node in tag.findall("value"):
             tag.remove(node)
         for value in monthly_values:
-            element = Element("value")
+            element = tag.makeelement("value", {})
             element.text = str(value)
-            self.et.find("monthlyValues").append(element)
+            tag.append(element)
+        self._values = None
+        self._daily = None
+        self._timesteps = None
+
+    @property
+    def values(self):
+        """
+        Monthly values. Don't modify the returned array, use monthlyValues setter instead.
+        :rtype: array
+        """
+        if self._values is None:
+            self._values = array("d", [float(value.text)
+                                       for value in self.et.find("monthlyValues").findall("value")])
+        return self._values
+
+    @property
+    def daily(self):
+        """
+        Monthly values converted to 365 daily values using the smoothing function
+        :rtype: array
+        """
+        if self._daily is None:
+            try:
+                smoothing = self.smoothing
+            except AttributeError:
+                # smoothing attribute is optional, fourier is the default
+                smoothing = "fourier"
+            self._daily = expand_monthly_values(self.values, smoothing)
+        return self._daily
+
+    @property
+    def timesteps(self):
+        """
+        Daily values averaged over 73 five-day time steps
+        :rtype: array
+        """
+        if self._timesteps is None:
+            self._timesteps = daily_to_timesteps(self.daily)
+        return self._timesteps
 
 
 class Mosq(Section):
@@ -190,72 +312,144 @@ class Vector(Section):
 
 
 class Vectors():
+    """
+    Vectors defined in /scenario/entomology/vector section
+
+    Species are indexed on first use, the index is updated by add, add_many and __delitem__. Changes made through
+    other objects (i.e. renaming a Vector) are not tracked - use scenario.entomology.vectors again after such changes.
+    """
     def __init__(self, et):
         # assert isinstance(et, ElementTree)
         self.et = et
+        # mosquito -> Vector
+        self._vectors = None
 
-    def add(self, vector, InterventionAnophelesParams=None):
+    def _index(self):
+        if self._vectors is None:
+            self._vectors = OrderedDict()
+            for anopheles in self.et.findall("anopheles"):
+                self._vectors[anopheles.attrib["mosquito"]] = Vector(anopheles)
+        return self._vectors
+
+    def add(self, vector, InterventionAnophelesParams=None, interventions=None):
         """
         Add a vector to entomology section.
         vector is either ElementTree or xml snippet
 
         InterventionAnophelesParams is an anophelesParams section for every GVI, ITN and IRS intervention
-        already defined in the scenario.xml
-
+        already defined in the scenario.xml (interventions section, see add_many). It can also be a dictionary
+        {"GVI": xml snippet, "ITN": xml snippet, "IRS": xml snippet} with a section for every intervention type.
         """
-        # TODO
-        # 1. If there are GVI interventions, for every GVI, add anophelesParams section.
-        # (gvi_anophelesParams field in AnophelesSnippets models)
-        # 2. If there are ITN interventions, for every ITN, add anophelesParams section
-        # (itn_anophelesParams field in AnophelesSnippets models)
-        # 3. If there are IRS interventions, for every IRS section add anophelesParams section
-        # (irs_anophelesParams field in AnophelesSnippets models)
+        if InterventionAnophelesParams is None:
+            InterventionAnophelesParams = {}
+        elif not isinstance(InterventionAnophelesParams, dict):
+            InterventionAnophelesParams = dict((name, InterventionAnophelesParams)
+                                               for name in INTERVENTIONS_WITH_ANOPHELES_PARAMS)
+        self.add_many([dict(InterventionAnophelesParams, anopheles=vector)], interventions)
 
+    def _parse_vector(self, vector):
         assert isinstance(vector, (str, unicode))
-        et = ElementTree.fromstring(vector)
+        et = fromstring(vector, self.et)
         # check if it is valid vector
         mosquito = Vector(et)
         assert isinstance(mosquito.mosquito, str)
         assert isinstance(mosquito.propInfected, float)
         assert len(mosquito.seasonality.monthlyValues) == 12
-        index = len(self.et.findall("anopheles"))
-        self.et.insert(index, et)
+        return et
+
+    def add_many(self, vectors, interventions=None):
+        """
+        Add several vectors to entomology section.
+        All snippets are parsed and validated before the scenario is changed.
+
+        vectors is a list of anopheles xml snippets or dictionaries
+        {"anopheles": xml snippet, "GVI": xml snippet, "ITN": xml snippet, "IRS": xml snippet}.
+        GVI, ITN and IRS are optional anophelesParams snippets. A copy of the snippet is added to every intervention
+        of this type in interventions section (scenario.interventions or /scenario/interventions element),
+        replacing anophelesParams for the same mosquito. mosquito attribute of the snippet is set to the name of
+        the vector.
+        :raises: ValueError if a vector is already in the scenario or is repeated, or if anophelesParams snippets are
+        given without interventions
+        """
+        existing = self._index()
+        anopheles_elements = []
+        # intervention type -> list of anophelesParams elements
+        intervention_params = dict((name, []) for name in INTERVENTIONS_WITH_ANOPHELES_PARAMS)
+        species = set()
+        for vector in vectors:
+            if not isinstance(vector, dict):
+                vector = {"anopheles": vector}
+            et = self._parse_vector(vector["anopheles"])
+            mosquito = et.attrib["mosquito"]
+            if mosquito in species or mosquito in existing:
+                raise ValueError("Vector %s is added twice" % mosquito)
+            species.add(mosquito)
+            anopheles_elements.append(et)
+            for name in INTERVENTIONS_WITH_ANOPHELES_PARAMS:
+                if vector.get(name) is None:
+                    continue
+                if interventions is None:
+                    raise ValueError("%s anophelesParams of %s can't be added without interventions section"
+                                     % (name, mosquito))
+                params = fromstring(vector[name], self.et)
+                assert params.tag == "anophelesParams"
+                params.attrib["mosquito"] = mosquito
+                intervention_params[name].append(params)
+
+        if interventions is not None:
+            interventions = getattr(interventions, "et", interventions)
+            human = interventions.find("human")
+            for component in (human if human is not None else []):
+                for name in INTERVENTIONS_WITH_ANOPHELES_PARAMS:
+                    intervention = component.find(name)
+                    if intervention is None or not intervention_params[name]:
+                        continue
+                    for params in intervention.findall("anophelesParams"):
+                        if params.attrib.get("mosquito") in species:
+                            intervention.remove(params)
+                    intervention.extend([copy.deepcopy(params) for params in intervention_params[name]])
+
+        vectors = self._index()
+        # New species go right after the last <anopheles> element (there may be duplicate names in the file)
+        index = 0
+        for position, child in enumerate(self.et):
+            if child.tag == "anopheles":
+                index = position + 1
+        self.et[index:index] = anopheles_elements
+        for et in anopheles_elements:
+            vectors[et.attrib["mosquito"]] = Vector(et)
 
     @property
     def vectors(self):
         """
         :rtype: dict
         """
-        vectors = {}
-        for anopheles in self.et.findall("anopheles"):
-            vectors[anopheles.attrib["mosquito"]] = Vector(anopheles)
-        return vectors
+        return dict(self._index())
 
     def __getitem__(self, item):
         """
         :rtype: Vector
         """
-        return self.vectors[item]
+        return self._index()[item]
 
     def __getattr__(self, item):
         """
         :rtype: Vector
         """
-        return self.vectors[item]
+        if item.startswith("_"):
+            raise AttributeError(item)
+        return self._index()[item]
 
     def __len__(self):
-        return len(self.vectors)
+        return len(self._index())
 
     def __delitem__(self, key):
         # TODO:
         #  1. For every GVI intervention, remove respective anophelesParams section
         #  2. For every ITN intervention, remove respective anophelesParams section
         #  3. For every IRS intervention, remove respective anophelesParams section
-        for anopheles in self.et.findall("anopheles"):
-            if anopheles.attrib['mosquito'] == key:
-                self.et.remove(anopheles)
-                return
-        raise KeyError(key)
+        vector = self._index().pop(key)
+        self.et.remove(vector.et)
 
     def __iter__(self):
         """
@@ -266,14 +460,18 @@ class Vectors():
 
         :rtype: Vector
         """
-        for vector in self.vectors:
-            yield self.vectors[vector]
+        for vector in self._index().values():
+            yield vector
 
     def __str__(self):
         return self.mosquito
 
 
 class Entomology(Section):
+    def __init__(self, et):
+        super(Entomology, self).__init__(et)
+        self._vectors = None
+
     @property  # name
     @attribute
     def name(self):
@@ -304,7 +502,14 @@ class Entomology(Section):
 
     @property
     def vectors(self):
-        return Vectors(self.et.find("vector"))
+        """
+        The same Vectors object is returned while the <vector> element is not replaced, so species are indexed once
+        :rtype: Vectors
+        """
+        vector = self.et.find("vector")
+        if self._vectors is None or self._vectors.et is not vector:
+            self._vectors = Vectors(vector)
+        return self._vectors
 
     def __str__(self):
         return self.name
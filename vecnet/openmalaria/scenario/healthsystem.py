@@ -8,7 +8,7 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License (MPL), version 2.0.  If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
-from xml.etree import ElementTree
+from collections import OrderedDict
 
 from vecnet.openmalaria.scenario.core import Section, tag_value, tag_value_setter, attribute, attribute_setter, section
 
@@ -25,6 +25,35 @@ drug_tag_order = {
 }
 
 
+def _drug_rank(name):
+    rank = 0
+    while drug_tag_order[name]:
+        name = drug_tag_order[name]
+        rank += 1
+    return rank
+
+# Position of every drug in drug_tag_order
+drug_rank = dict((name, _drug_rank(name)) for name in drug_tag_order)
+
+# Sections of ImmediateOutcomes that have a value for every drug
+drug_sections = ("initialACR", "compliance", "nonCompliersEffective")
+
+
+def drug_insert_index(names, name):
+    """
+    Position of a new drug in a section with the list of drugs names, so the drug follows all drugs that go before it
+    in drug_tag_order. Returns -1 if the drug is already in the section.
+    """
+    rank = drug_rank[name]
+    index = 0
+    for position, other in enumerate(names):
+        if other == name:
+            return -1
+        if drug_rank.get(other, rank) < rank:
+            index = position + 1
+    return index
+
+
 class Deploy():
     def __init__(self, et):
         self.et = et
@@ -107,17 +136,12 @@ class TreatmentAction(object):
 
     @classmethod
     def create(cls, et, name, value):
-        tag = drug_tag_order[name]
-
-        index = 0
         treatment_actions = et.find("treatmentActions")
-        for treatment in treatment_actions:
-            if treatment.tag == name:
-                return False
-            if treatment.tag == tag:
-                index = list(treatment_actions).index(treatment) + 1
+        index = drug_insert_index([treatment.tag for treatment in treatment_actions], name)
+        if index == -1:
+            return False
 
-        treatment_action = ElementTree.Element(name)
+        treatment_action = treatment_actions.makeelement(name, {})
         treatment_action.attrib["name"] = value
         treatment_actions.insert(index, treatment_action)
 
@@ -137,7 +161,7 @@ class TreatmentAction(object):
         clear_infections = self.et.find("clearInfections")
 
         if clear_infections is None:
-            self.et.append(ElementTree.Element("clearInfections"))
+            self.et.append(self.et.makeelement("clearInfections", {}))
             clear_infections = self.et.find("clearInfections")
 
         clear_infections.attrib["timesteps"] = str(value)
@@ -151,7 +175,7 @@ class TreatmentAction(object):
         clear_infections = self.et.find("clearInfections")
 
         if clear_infections is None:
-            self.et.append(ElementTree.Element("clearInfections"))
+            self.et.append(self.et.makeelement("clearInfections", {}))
             clear_infections = self.et.find("clearInfections")
 
         clear_infections.attrib["stage"] = value
@@ -204,63 +228,76 @@ class Drug(object):
 
 
 class Drugs():
+    """
+    Drugs defined in initialACR, compliance and nonCompliersEffective sections of ImmediateOutcomes
+
+    Drugs are indexed on first use, the index is updated by add. Changes made through other objects are not
+    tracked - use scenario.healthSystem.ImmediateOutcomes.drugs again after such changes.
+    """
     def __init__(self, et):
         self.et = et
+        # drug name -> Drug
+        self._drugs = None
+        # section -> list of drug names in the section
+        self._sections = None
+
+    def _index(self):
+        if self._drugs is None:
+            self._drugs = OrderedDict()
+            self._sections = {}
+            if self.et is None:
+                return self._drugs
+            for section in drug_sections:
+                elem_list = self.et.find(section)
+                names = [elem.tag for elem in elem_list] if elem_list is not None else []
+                self._sections[section] = names
+                for name in names:
+                    if name not in self._drugs:
+                        self._drugs[name] = Drug(self.et, name)
+        return self._drugs
 
     def add(self, name, value, sections):
         assert isinstance(name, (str, unicode))
-        drug = ElementTree.Element(name)
-        drug.attrib["value"] = str(value)
-
-        tag = drug_tag_order[name]
 
+        drugs = self._index()
         for section in sections:
-            index = 0
             elem_list = self.et.find(section)
-            for el in elem_list:
-                if el.tag == name:
-                    index = -1
-                    break
-                if el.tag == tag:
-                    index = list(elem_list).index(el) + 1
+            names = self._sections.get(section)
+            if names is None:
+                # Sections other than drug_sections are scanned (and then tracked) on first use
+                if elem_list is None:
+                    raise ValueError("Section %s not found, expected one of %s" % (section, ", ".join(drug_sections)))
+                names = self._sections[section] = [elem.tag for elem in elem_list]
+            index = drug_insert_index(names, name)
 
             if index > -1:
+                # Each section gets its own element - an element can't have more than one parent in lxml
+                drug = elem_list.makeelement(name, {"value": str(value)})
                 elem_list.insert(index, drug)
+                names.insert(index, name)
+                if name not in drugs:
+                    drugs[name] = Drug(self.et, name)
 
     @property
     def drugs(self):
-        drugs = {}
-
-        if self.et is None:
-            return drugs
-
-        for elem in self.et.find("initialACR"):
-            drugs[elem.tag] = Drug(self.et, elem.tag)
-
-        for elem in self.et.find("compliance"):
-            if elem.tag not in drugs:
-                drugs[elem.tag] = Drug(self.et, elem.tag)
-
-        for elem in self.et.find("nonCompliersEffective"):
-            if elem.tag not in drugs:
-                drugs[elem.tag] = Drug(self.et, elem.tag)
-
-        return drugs
+        return dict(self._index())
 
     def __getitem__(self, item):
         """
         :rtype: Drug
         """
-        return self.drugs[item]
+        return self._index()[item]
 
     def __getattr__(self, item):
         """
         :rtype: Drug
         """
-        return self.drugs[item]
+        if item.startswith("_"):
+            raise AttributeError(item)
+        return self._index()[item]
 
     def __len__(self):
-        return len(self.drugs)
+        return len(self._index())
 
     # def __delitem__(self, key):
     #     # TODO:
@@ -275,8 +312,8 @@ class Drugs():
 
         :rtype: Drug
         """
-        for drug in self.drugs:
-            yield self.drugs[drug]
+        for drug in self._index().values():
+            yield drug
 
     def __str__(self):
         return self.name
@@ -9,11 +9,12 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License (MPL), version 2.0.  If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
-from xml.etree.ElementTree import Element
-from xml.etree import ElementTree
+from collections import OrderedDict
 
+from vecnet.openmalaria.scenario.backend import fromstring
 from vecnet.openmalaria.scenario.core import Section, attribute, attribute_setter, section, tag_value, tag_value_setter
 from vecnet.openmalaria.scenario.healthsystem import HealthSystem
+from vecnet.openmalaria.scenario.schedule import Schedule
 
 
 class Deploy(Section):
@@ -44,9 +45,19 @@ class Deploy(Section):
 
 class Deployment(Section):
     """ /scenario/intervention/human/deployment (multiple)
+
+    Timed deploys are parsed once and cached. The cache is updated by timesteps and schedule setters, changes made
+    through other objects are not tracked. schedule property returns a copy of the cache, and the setter stores a
+    copy of the assigned schedule, so changing a Schedule object never changes the deployment.
+    on_change is called when components of the deployment are replaced (used by HumanInterventions index).
     """
+    def __init__(self, et, on_change=None):
+        super(Deployment, self).__init__(et)
+        self._schedule = None
+        self._on_change = on_change
+
     def create_from_xml(self, xml):
-        et = ElementTree.fromstring(xml)
+        et = fromstring(xml)
         self.et = et
 
     @property
@@ -71,36 +82,57 @@ class Deployment(Section):
             self.et.remove(component)
 
         for index, component_id in enumerate(value):
-            component = Element("component")
+            component = self.et.makeelement("component", {})
             component.attrib["id"] = component_id
             self.et.insert(index, component)
+        if self._on_change is not None:
+            self._on_change()
 
     @property
     def timesteps(self):
-        deployments = []
-        for deploy in self.et.find("timed").findall("deploy"):
-            deployments.append(
-                {"time":    int(deploy.attrib["time"]),
-                 "coverage": float(deploy.attrib["coverage"])}
-            )
-        return deployments
+        schedule = self._cached_schedule()
+        return [{"time": time, "coverage": coverage} for time, coverage in zip(schedule.time, schedule.coverage)]
     @timesteps.setter
     def timesteps(self, value):
+        timed = self._clear_timed()
+        timed.extend([timed.makeelement("deploy", {"time": str(deploy["time"]), "coverage": str(deploy["coverage"])})
+                      for deploy in value])
+        self._schedule = None
+
+    def _clear_timed(self):
         timed = self.et.find("timed")
 
         if timed is not None:
             for deploy in timed.findall("deploy"):
                 timed.remove(deploy)
         else:
-            timed = Element("timed")
+            timed = self.et.makeelement("timed", {})
             self.et.append(timed)
-            timed = self.et.find("timed")
+        return timed
 
-        for deploy in value:
-            deploy_element = Element("deploy")
-            deploy_element.attrib["time"] = deploy["time"]
-            deploy_element.attrib["coverage"] = deploy["coverage"]
-            timed.append(deploy_element)
+    def _cached_schedule(self):
+        if self._schedule is None:
+            self._schedule = Schedule.from_elements(self.et.find("timed").findall("deploy"))
+        return self._schedule
+
+    @property
+    def schedule(self):
+        """
+        Timed deploys as columns (time, coverage, minAge, maxAge). Changes of the returned object are not saved,
+        assign it back to the schedule property.
+        :rtype: Schedule
+        """
+        return self._cached_schedule().copy()
+    @schedule.setter
+    def schedule(self, value):
+        """
+        Replace timed deploys. value is a Schedule or a list of dictionaries (see Schedule.from_rows)
+        """
+        if not isinstance(value, Schedule):
+            value = Schedule.from_rows(value)
+        timed = self._clear_timed()
+        timed.extend(value.to_elements(timed))
+        self._schedule = value.copy()
 
     @property
     def continuous(self):
@@ -123,18 +155,18 @@ class Deployment(Section):
             for deploy in continuous:
                 continuous.remove(deploy)
         else:
-            continuous = Element("continuous")
+            continuous = self.et.makeelement("continuous", {})
             index = len(self.et.findall("component"))
             self.et.insert(index, continuous)
             continuous = self.et.find("continuous")
 
         for deploy in value:
-            deploy_element = Element("deploy")
-            deploy_element.attrib["targetAgeYrs"] = deploy["targetAgeYrs"]
+            deploy_element = continuous.makeelement("deploy", {})
+            deploy_element.attrib["targetAgeYrs"] = str(deploy["targetAgeYrs"])
             if "begin" in deploy:
-                deploy_element.attrib["begin"] = deploy["begin"]
+                deploy_element.attrib["begin"] = str(deploy["begin"])
             if "end" in deploy:
-                deploy_element.attrib["end"] = deploy["end"]
+                deploy_element.attrib["end"] = str(deploy["end"])
 
             continuous.append(deploy_element)
 
@@ -150,6 +182,10 @@ class Deployments(Section):
     """
     Deployments defined in /scenario/interventions/human section
     """
+    def __init__(self, et, on_change=None):
+        super(Deployments, self).__init__(et)
+        self._on_change = on_change
+
     @property
     def deployments(self):
         if self.et is None or self.et.find("deployment") is None:
@@ -157,7 +193,7 @@ class Deployments(Section):
 
         deployments = []
         for deployment in self.et.findall("deployment"):
-            deployments.append(Deployment(deployment))
+            deployments.append(Deployment(deployment, self._on_change))
 
         return deployments
 
@@ -177,6 +213,10 @@ class Interventions(Section):
     Inverventions section in OpenMalaria xml input file
     https://github.com/SwissTPH/openmalaria/wiki/GeneratedSchema32Doc#preventative-interventions
     """
+    def __init__(self, et):
+        super(Interventions, self).__init__(et)
+        self._human = None
+
     @property  # changeHS
     def changeHS(self):
         """
@@ -204,7 +244,15 @@ class Interventions(Section):
 
     @property  # human
     def human(self):
-        return HumanInterventions(self.et.find("human"))
+        """
+        The same HumanInterventions object is returned while the <human> element is not replaced, so its index is
+        built once
+        :rtype: HumanInterventions
+        """
+        human = self.et.find("human")
+        if self._human is None or self._human.et is not human:
+            self._human = HumanInterventions(human)
+        return self._human
 
     @property  # vectorPop
     def vectorPop(self):
@@ -226,7 +274,7 @@ class Interventions(Section):
         raise KeyError
 
     def add_section(self, name):
-        elem = Element(name)
+        elem = self.et.makeelement(name, {})
         self.et.append(elem)
 
     def remove_section(self, name):
@@ -342,7 +390,7 @@ class ITN(Component):
     @usage.setter
     def usage(self, value):
         assert isinstance(value, float)
-        self.itn.find("usage").attrib["value"] = value
+        self.itn.find("usage").attrib["value"] = str(value)
 
     @property
     # Same approach as with scenario.entomology.vectors may work here too
@@ -361,7 +409,7 @@ class ITN(Component):
 
         for a_param in anopheles_params:
             assert isinstance(a_param, (str, unicode))
-            et = ElementTree.fromstring(a_param)
+            et = fromstring(a_param, self.et)
             anopheles = AnophelesParams(et)
             assert isinstance(anopheles.mosquito, (str, unicode))
             assert isinstance(anopheles.propActive, float)
@@ -384,7 +432,7 @@ class ITN(Component):
     def set_attrition_in_years(self, years):
         attrition_of_nets = self.itn.find("attritionOfNets")
         attrition_of_nets.attrib["function"] = "step"
-        attrition_of_nets.attrib["L"] = years
+        attrition_of_nets.attrib["L"] = str(years)
 
 
 class Decay(Section):
@@ -467,7 +515,7 @@ class GVI(Component):
                 break
 
         if et is None:
-            et = ElementTree.fromstring(self.anopheles_xml_snippet)
+            et = fromstring(self.anopheles_xml_snippet, self.et)
 
         anopheles = AnophelesParams(et)
 
@@ -527,7 +575,7 @@ class GVI(Component):
 
         for a_param in anopheles_params:
             assert isinstance(a_param, (str, unicode))
-            et = ElementTree.fromstring(a_param)
+            et = fromstring(a_param, self.et)
             anopheles = AnophelesParams(et)
             assert isinstance(anopheles.mosquito, (str, unicode))
             assert isinstance(anopheles.propActive, float)
@@ -557,7 +605,7 @@ class MDA(Component):
         effects = self.mda.find("effects")
 
         if effects is None:
-            new_effects = Element("effects")
+            new_effects = self.mda.makeelement("effects", {})
             self.mda.append(new_effects)
             effects = self.mda.find("effects")
 
@@ -568,13 +616,13 @@ class MDA(Component):
                 break
 
         if et is None:
-            et = ElementTree.fromstring(self.treatment_option_xml_snippet)
+            et = fromstring(self.treatment_option_xml_snippet, self.et)
 
         treatment_option = et
 
         treatment_option.attrib["name"] = str(params["name"])
         if "pSelection" in params and params["pSelection"] is not None:
-            treatment_option.attrib["pSelection"] = params["pSelection"]
+            treatment_option.attrib["pSelection"] = str(params["pSelection"])
 
         for deploy in treatment_option.findall("deploy"):
             treatment_option.remove(deploy)
@@ -583,13 +631,13 @@ class MDA(Component):
 
         if "deploys" in params and params["deploys"] is not None:
             for deploy in params["deploys"]:
-                deploy_element = Element("deploy")
-                deploy_element.attrib["maxAge"] = deploy["maxAge"]
-                deploy_element.attrib["minAge"] = deploy["minAge"]
-                deploy_element.attrib["p"] = deploy["p"]
+                deploy_element = treatment_option.makeelement("deploy", {})
+                deploy_element.attrib["maxAge"] = str(deploy["maxAge"])
+                deploy_element.attrib["minAge"] = str(deploy["minAge"])
+                deploy_element.attrib["p"] = str(deploy["p"])
 
                 for component_id in deploy["components"]:
-                    component = Element("component")
+                    component = deploy_element.makeelement("component", {})
                     component.attrib["id"] = component_id
                     deploy_element.append(component)
 
@@ -597,9 +645,9 @@ class MDA(Component):
 
         if "clearInfections" in params and params["clearInfections"] is not None:
             for clear_infection in params["clearInfections"]:
-                clear_infection_element = Element("clearInfections")
+                clear_infection_element = treatment_option.makeelement("clearInfections", {})
                 clear_infection_element.attrib["stage"] = clear_infection["stage"]
-                clear_infection_element.attrib["timesteps"] = clear_infection["timesteps"]
+                clear_infection_element.attrib["timesteps"] = str(clear_infection["timesteps"])
 
                 treatment_option.append(clear_infection_element)
 
@@ -677,15 +725,71 @@ class Vaccine(Component):
         for initial_efficacy in self.vaccine.findall("initialEfficacy"):
             self.vaccine.remove(initial_efficacy)
         for new_value in value:
-            initial_efficacy = Element("initialEfficacy")
+            initial_efficacy = self.vaccine.makeelement("initialEfficacy", {})
             initial_efficacy.attrib["value"] = str(new_value)
             self.vaccine.append(initial_efficacy)
 
 
+def _component_class(et):
+    """
+    Returns class that represents <component> element (ITN, GVI, MDA or Vaccine), None for unsupported components
+    """
+    if et.find("TBV") is not None or et.find("PEV") is not None or et.find("BSV") is not None:
+        return Vaccine
+    if et.find("MDA") is not None:
+        return MDA
+    if et.find("GVI") is not None:
+        return GVI
+    if et.find("ITN") is not None:
+        return ITN
+    return None
+
+
 class HumanInterventions(Section):
     """
     List of human interventions
+
+    Components and deployments that reference them are indexed on first use. The index is kept by the scenario
+    (scenario.interventions.human returns the same object), updated by add, __delitem__ and deployments setter, and
+    dropped when components of a deployment are replaced (Deployment.components) or the scenario is patched
+    (Scenario.apply_patch). Call invalidate() after changing the <human> element directly.
     """
+    def __init__(self, et):
+        super(HumanInterventions, self).__init__(et)
+        # component id -> (<component> element, class)
+        self._components = None
+        # component id -> list of <deployment> elements that reference this component
+        self._deployments = None
+
+    def _index(self):
+        if self._components is not None:
+            return self._components
+        self._components = OrderedDict()
+        self._deployments = {}
+        if self.et is None:
+            return self._components
+        for element in self.et:
+            if element.tag == "component":
+                component_id = element.attrib["id"]
+                if component_id not in self._components:
+                    self._components[component_id] = (element, _component_class(element))
+            elif element.tag == "deployment":
+                self._index_deployment(element)
+        return self._components
+
+    def invalidate(self):
+        """
+        Drop the index, it is built again on next use
+        """
+        self._components = None
+        self._deployments = None
+
+    def _index_deployment(self, deployment):
+        for component in deployment.findall("component"):
+            deployments = self._deployments.setdefault(component.attrib["id"], [])
+            if deployment not in deployments:
+                deployments.append(deployment)
+
     def add(self, intervention, id=None):
         """
         Add an intervention to intervention/human section.
@@ -695,19 +799,12 @@ class HumanInterventions(Section):
             return
 
         assert isinstance(intervention, (str, unicode))
-        et = ElementTree.fromstring(intervention)
-        component = None
-
-        if et.find("ITN") is not None:
-            component = ITN(et)
-        elif et.find("GVI") is not None:
-            component = GVI(et)
-        elif et.find("MDA") is not None:
-            component = MDA(et)
-        elif et.find("TBV") is not None or et.find("PEV") is not None or et.find("BSV") is not None:
-            component = Vaccine(et)
-        else:
+        et = fromstring(intervention, self.et)
+
+        component_class = _component_class(et)
+        if component_class is None:
             return
+        component = component_class(et)
 
         assert isinstance(component.name, (str, unicode))
 
@@ -715,51 +812,52 @@ class HumanInterventions(Section):
             assert isinstance(id, (str, unicode))
             et.attrib["id"] = id
 
-        index = len(self.et.findall("component"))
-        self.et.insert(index, et)
+        components = self._index()
+        # <component> elements go before <deployment> elements
+        position = 0
+        for index, element in enumerate(self.et):
+            if element.tag == "component":
+                position = index + 1
+        self.et.insert(position, et)
+        if et.attrib["id"] not in components:
+            components[et.attrib["id"]] = (et, component_class)
 
     @property
     def components(self):
         human_interventions = {}
-        if self.et is None:
-            # No /scenario/interventions/human section
-            return {}
-        for component in self.et.findall("component"):
-            if component.find("ITN") is not None:
-                human_interventions[component.attrib["id"]] = ITN(component)
-            if component.find("GVI") is not None:
-                human_interventions[component.attrib["id"]] = GVI(component)
-            if component.find("MDA") is not None:
-                human_interventions[component.attrib["id"]] = MDA(component)
-            if component.find("TBV") is not None or component.find("PEV") is not None or component.find("BSV") is not None:
-                human_interventions[component.attrib["id"]] = Vaccine(component)
+        for component_id, (et, component_class) in self._index().iteritems():
+            if component_class is not None:
+                human_interventions[component_id] = component_class(et)
         return human_interventions
 
     @property  # deployment
     def deployments(self):
-        return Deployments(self.et)
+        return Deployments(self.et, on_change=self.invalidate)
     @deployments.setter
     def deployments(self, value):
         if self.et is None or value is None:
             return
 
+        components = self._index()
         for deployment in self.et.findall("deployment"):
             self.et.remove(deployment)
+        self._deployments = {}
 
         for deploy in value:
             if "xml" in deploy:
                 # Preserve deployment section as is
-                deployment = Deployment(None)
-                deployment.create_from_xml(deploy["xml"])
-                self.et.append(deployment.et)
+                deployment_element = fromstring(deploy["xml"], self.et)
+                self.et.append(deployment_element)
+                self._index_deployment(deployment_element)
                 continue
 
             if "components" not in deploy or len(deploy["components"]) == 0:
                 continue
 
-            component_ids = [id for id in deploy["components"] if id in self.components]
+            component_ids = [id for id in deploy["components"]
+                             if id in components and components[id][1] is not None]
 
-            deployment_element = Element("deployment")
+            deployment_element = self.et.makeelement("deployment", {})
 
             if "name" in deploy:
                 deployment_element.attrib["name"] = deploy["name"]
@@ -773,42 +871,45 @@ class HumanInterventions(Section):
                 deployment.timesteps = deploy["continuous"]
 
             self.et.append(deployment.et)
+            self._index_deployment(deployment.et)
+
+    def _get_component(self, item):
+        et, component_class = self._index().get(item, (None, None))
+        if component_class is None:
+            raise KeyError(item)
+        return component_class(et)
 
     def __getitem__(self, item):
         """
         :rtype: Intervention
         """
-        return self.components[item]
+        return self._get_component(item)
 
     def __getattr__(self, item):
         """
         :rtype: Intervention
         """
-        return self.components[item]
+        if item.startswith("_"):
+            raise AttributeError(item)
+        return self._get_component(item)
 
     def __len__(self):
         return len(self.components)
 
     def __delitem__(self, key):
-        for component in self.et.findall("component"):
-            component_id = component.attrib["id"]
-            if component_id == key:
-                deployments_to_delete = []
-
-                for deployment in self.deployments:
-                    if deployment.delete_component(component_id) == 0:
-                        # Prepare deployment for removal.
-                        deployments_to_delete.append(deployment.et)
+        components = self._index()
+        if key not in components:
+            raise KeyError(key)
+        component = components.pop(key)[0]
 
-                for deployment_to_delete in deployments_to_delete:
-                    self.et.remove(deployment_to_delete)
+        for deployment in self._deployments.pop(key, []):
+            if Deployment(deployment).delete_component(key) == 0:
+                # Last component of the deployment has been removed, remove the deployment too
+                self.et.remove(deployment)
 
-                self.et.remove(component)
+        self.et.remove(component)
 
-                # TODO: Remove entire <human> section if this is the only component.
-
-                return
-        raise KeyError(key)
+        # TODO: Remove entire <human> section if this is the only component.
 
     def __iter__(self):
         """
@@ -819,10 +920,9 @@ class HumanInterventions(Section):
 
         :rtype: Vector
         """
-        if not self.components:
-            return
-        for intervention_name, intervention in self.components.iteritems():
-            yield intervention
+        for component_id, (et, component_class) in self._index().items():
+            if component_class is not None:
+                yield component_class(et)
 
 
 class Anopheles(Section):
@@ -914,7 +1014,7 @@ class VectorPopIntervention(Section):
                     break
 
         if et is None:
-            et = ElementTree.fromstring(self.anopheles_xml_snippet)
+            et = fromstring(self.anopheles_xml_snippet, self.et)
 
         anopheles = Anopheles(et)
 
@@ -922,7 +1022,6 @@ class VectorPopIntervention(Section):
             anopheles.mosquito = str(params["mosquito"])
 
         default_decay_string = "<decay L='0.2465753424657534' function='step' />"
-        new_decay_et = ElementTree.fromstring(default_decay_string)
 
         if "seekingDeathRateIncrease" in params and params["seekingDeathRateIncrease"] is not None:
             try:
@@ -930,7 +1029,7 @@ class VectorPopIntervention(Section):
 
                 section = anopheles.et.find("seekingDeathRateIncrease")
                 if section.find("decay") is None:
-                    section.append(new_decay_et)
+                    section.append(fromstring(default_decay_string, self.et))
             except ValueError:
                 pass
         if "probDeathOvipositing" in params and params["probDeathOvipositing"] is not None:
@@ -939,7 +1038,7 @@ class VectorPopIntervention(Section):
 
                 section = anopheles.et.find("probDeathOvipositing")
                 if section.find("decay") is None:
-                    section.append(new_decay_et)
+                    section.append(fromstring(default_decay_string, self.et))
             except ValueError:
                 pass
         if "emergenceReduction" in params and params["emergenceReduction"] is not None:
@@ -948,13 +1047,13 @@ class VectorPopIntervention(Section):
 
                 section = anopheles.et.find("emergenceReduction")
                 if section.find("decay") is None:
-                    section.append(new_decay_et)
+                    section.append(fromstring(default_decay_string, self.et))
             except ValueError:
                 pass
 
         if not is_update:
             if desc is None:
-                new_description_element = ElementTree.Element("description")
+                new_description_element = self.et.makeelement("description", {})
                 self.et.insert(0, new_description_element)
                 desc = self.et.find("description")
 
@@ -1007,7 +1106,7 @@ class VectorPopIntervention(Section):
 
             for a in anopheles:
                 assert isinstance(a, (str, unicode))
-                et = ElementTree.fromstring(a)
+                et = fromstring(a, self.et)
                 anopheles = Anopheles(et)
                 assert isinstance(anopheles.mosquito, (str, unicode))
                 if anopheles.seekingDeathRateIncrease is not None:
@@ -1051,7 +1150,7 @@ class VectorPop(Section):
             return
 
         assert isinstance(intervention, (str, unicode))
-        et = ElementTree.fromstring(intervention)
+        et = fromstring(intervention, self.et)
         vector_pop = VectorPopIntervention(et)
 
         assert isinstance(vector_pop.name, (str, unicode))
@@ -1138,7 +1237,7 @@ class ImportedInfections(Section):
         timed = self.et.find("timed")
 
         if timed is None:
-            timed_element = Element("timed")
+            timed_element = self.et.makeelement("timed", {})
             self.et.append(timed_element)
             timed = self.et.find("timed")
 
@@ -1168,7 +1267,7 @@ class ImportedInfections(Section):
         timed = self.et.find("timed")
 
         if timed is None:
-            timed_element = Element("timed")
+            timed_element = self.et.makeelement("timed", {})
             self.et.append(timed_element)
             timed = self.et.find("timed")
 
@@ -1176,7 +1275,7 @@ class ImportedInfections(Section):
             timed.remove(rate)
 
         for rate in value:
-            rate_element = Element("rate")
+            rate_element = timed.makeelement("rate", {})
             rate_element.attrib["time"] = str(rate["time"])
             rate_element.attrib["value"] = str(rate["value"])
             timed.append(rate_element)
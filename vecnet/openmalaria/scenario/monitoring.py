@@ -8,7 +8,8 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License (MPL), version 2.0.  If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
-from xml.etree.ElementTree import Element
+from array import array
+
 from vecnet.openmalaria.scenario.core import attribute, Section, section
 
 
@@ -39,6 +40,14 @@ class AgeGroup(Section):
 
 
 class Monitoring(Section):
+    """
+    Survey times are parsed once and cached, the cache is updated by surveys setter. Changes made through other
+    objects are not tracked.
+    """
+    def __init__(self, et):
+        super(Monitoring, self).__init__(et)
+        self._survey_times = None
+
     @property
     @section
     def ageGroup(self):
@@ -70,7 +79,7 @@ class Monitoring(Section):
     def continuous(self, list_of_measures):
         if self.et.find("continuous") is None:
             # Add continuous section
-            self.et.append(Element("continuous"))
+            self.et.append(self.et.makeelement("continuous", {}))
         self._replace_measures(self.et.find("continuous"), list_of_measures)
 
     @property  # SurveyOptions
@@ -88,7 +97,7 @@ class Monitoring(Section):
     def SurveyOptions(self, list_of_measures):
         if self.et.find("SurveyOptions") is None:
             # Add SurveyOptions section
-            self.et.append(Element("SurveyOptions"))
+            self.et.append(self.et.makeelement("SurveyOptions", {}))
         self._replace_measures(self.et.find("SurveyOptions"), list_of_measures)
 
     @property  # detectionLimit
@@ -111,10 +120,10 @@ class Monitoring(Section):
     def detectionLimit(self, value):
         surveys_elem = self.et.find("surveys")
         if surveys_elem is None:
-            self.et.append(Element("surveys"))
+            self.et.append(self.et.makeelement("surveys", {}))
             surveys_elem = self.et.find("surveys")
 
-        surveys_elem.attrib["detectionLimit"] = value
+        surveys_elem.attrib["detectionLimit"] = str(value)
 
     @property  # surveys
     def surveys(self):
@@ -124,31 +133,48 @@ class Monitoring(Section):
         xpath: /scenario/monitoring/survey
         https://github.com/SwissTPH/openmalaria/wiki/GeneratedSchema32Doc#survey-times-time-steps
         """
-        survey_time_list = list()
-        # Extract surveyTimes from /scenario/monitoring/surveys section
-        # Using root element instead of xpath to avoid problems with namespaces
-        # (root tag was <scenario> prior to schema 32, and then it was switched to <om:scenario>)
-        try:
-            for item in self.et.find("surveys").findall("surveyTime"):
-                survey_time_list.append(int(item.text))
-        except AttributeError:
+        survey_times = self.survey_times
+        if survey_times is None:
             return None
-        return survey_time_list
+        return list(survey_times)
     @surveys.setter
     def surveys(self, list_of_survey_times):
         surveys_elem = self.et.find("surveys")
         if surveys_elem is None:
             # Add surveys section
-            self.et.append(Element("surveys"))
+            self.et.append(self.et.makeelement("surveys", {}))
             surveys_elem = self.et.find("surveys")
 
-        for time in surveys_elem.findall("surveyTime"):
-            surveys_elem.remove(time)
+        texts = [str(time) for time in list_of_survey_times]
+        survey_time_elements = []
+        for text in texts:
+            tag = surveys_elem.makeelement("surveyTime", {})
+            tag.text = text
+            survey_time_elements.append(tag)
+        # Rebuild children in one pass instead of removing surveyTime elements one by one
+        surveys_elem[:] = [child for child in surveys_elem if child.tag != "surveyTime"] + survey_time_elements
 
-        for time in list_of_survey_times:
-            tag = Element("surveyTime")
-            tag.text = str(time)
-            surveys_elem.append(tag)
+        try:
+            self._survey_times = array("l", [int(text) for text in texts])
+        except ValueError:
+            self._survey_times = None
+
+    @property
+    def survey_times(self):
+        """
+        Survey times as array of integers, None if there is no surveys section.
+        Don't modify the returned array, use surveys setter instead.
+        :rtype: array
+        """
+        if self._survey_times is None:
+            # Extract surveyTimes from /scenario/monitoring/surveys section
+            # Using root element instead of xpath to avoid problems with namespaces
+            # (root tag was <scenario> prior to schema 32, and then it was switched to <om:scenario>)
+            surveys_elem = self.et.find("surveys") if self.et is not None else None
+            if surveys_elem is None:
+                return None
+            self._survey_times = array("l", [int(item.text) for item in surveys_elem.findall("surveyTime")])
+        return self._survey_times
 
     # Internal functions
     def _get_measures(self, et):
@@ -169,7 +195,7 @@ class Monitoring(Section):
             et.remove(measure)
 
         for measure_name in list_of_measures:
-            tag = Element("option")
+            tag = et.makeelement("option", {})
             tag.attrib["name"] = measure_name
             tag.attrib["value"] = "true"
             et.append(tag)
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Bulk modification of scenario files.
+
+Patch is a dictionary of path -> value. Path is relative to the root of the scenario, steps are separated by /.
+Every step is a tag name, optionally followed by [@attribute='value'] predicate and/or [n] position (n-th matching
+element, starting from 1, the same as in XPath). The last step is either @attribute (value of the attribute is
+changed) or a tag name (text of the element is changed). For example:
+
+    {
+        "entomology/@scaledAnnualEIR": 10.0,
+        "entomology/vector/anopheles[@mosquito='gambiae']/seasonality/@annualEIR": 6.1,
+        "entomology/vector/anopheles[@mosquito='gambiae']/mosq/mosqHumanBloodIndex/@value": 0.7,
+        "entomology/vector/anopheles[@mosquito='gambiae']/seasonality/monthlyValues/value[4]": 0.25,
+        "@wuID": 1,
+    }
+
+If more than one element matches the path, all of them are changed.
+"""
+import re
+
+_predicate_re = re.compile(r"""^(?:\[@([^=\]]+)=(?:'([^']*)'|"([^"]*)")\])?(?:\[([1-9][0-9]*)\])?$""")
+
+
+def _split_path(path):
+    """
+    Split path by /, ignoring / in predicates
+    """
+    steps = []
+    step = ""
+    quote = None
+    for char in path:
+        if quote is not None:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == "/":
+            steps.append(step)
+            step = ""
+            continue
+        step += char
+    steps.append(step)
+    return steps
+
+
+def parse_path(path):
+    """
+    Parse patch path
+    Returns a tuple of (steps, attribute), where steps is a tuple of (tag, attribute, value, position) and attribute
+    is None if path points to text of an element
+    """
+    steps = _split_path(path)
+    attribute = None
+    if steps[-1].startswith("@"):
+        attribute = steps.pop()[1:]
+    parsed_steps = []
+    for step in steps:
+        bracket = step.find("[")
+        if bracket == -1:
+            tag, predicate = step, None
+        else:
+            tag, predicate = step[:bracket], step[bracket:]
+        if not tag or "@" in tag or "]" in tag:
+            raise ValueError("Invalid path %s" % path)
+        if predicate is None:
+            parsed_steps.append((tag, None, None, None))
+            continue
+        match = _predicate_re.match(predicate)
+        if match is None:
+            raise ValueError("Invalid path %s" % path)
+        value = match.group(2) if match.group(2) is not None else match.group(3)
+        position = int(match.group(4)) if match.group(4) is not None else None
+        parsed_steps.append((tag, match.group(1), value, position))
+    if not parsed_steps and attribute is None:
+        raise ValueError("Invalid path %s" % path)
+    return tuple(parsed_steps), attribute
+
+
+class _Node(object):
+    """
+    Node of the tree of patch paths. Paths with common prefix share nodes, so the scenario is traversed only once
+    """
+    def __init__(self):
+        # tag -> list of (attribute, value, position, _Node)
+        self.children = {}
+        # paths that end in this node
+        self.paths = []
+
+    def child(self, step):
+        tag, attribute, value, position = step
+        for child_attribute, child_value, child_position, node in self.children.setdefault(tag, []):
+            if (child_attribute, child_value, child_position) == (attribute, value, position):
+                return node
+        node = _Node()
+        self.children[tag].append((attribute, value, position, node))
+        return node
+
+
+def _walk(element, node, found):
+    for path in node.paths:
+        found[path].append(element)
+    if not node.children:
+        return
+    # (tag, attribute, value) -> number of children matching the predicate so far
+    positions = {}
+    for child in element:
+        steps = node.children.get(child.tag)
+        if not steps:
+            continue
+        counted = set()
+        for attribute, value, position, child_node in steps:
+            if attribute is not None and child.get(attribute) != value:
+                continue
+            predicate = (child.tag, attribute, value)
+            if predicate not in counted:
+                counted.add(predicate)
+                positions[predicate] = positions.get(predicate, 0) + 1
+            if position is None or position == positions[predicate]:
+                _walk(child, child_node, found)
+
+
+def find_paths(root, paths):
+    """
+    Find elements for every path with a single traversal of the tree
+    Returns dictionary path -> (list of elements, attribute)
+    """
+    tree = _Node()
+    attributes = {}
+    for path in paths:
+        steps, attributes[path] = parse_path(path)
+        node = tree
+        for step in steps:
+            node = node.child(step)
+        node.paths.append(path)
+
+    found = dict((path, []) for path in paths)
+    _walk(root, tree, found)
+    return dict((path, (found[path], attributes[path])) for path in paths)
+
+
+def apply_patch(root, patch, dry_run=False):
+    """
+    Apply patch (dictionary of path -> value) to the tree.
+
+    All paths are resolved before any change is made. A path doesn't exist if no element matches it, or if the
+    attribute is not defined in matching elements.
+    If dry_run is True, the tree is not changed and the list of paths that don't exist is returned.
+    Otherwise, KeyError is raised if any path doesn't exist (and no changes are made).
+    """
+    resolved = find_paths(root, patch.keys())
+    missing = []
+    for path in patch:
+        elements, attribute = resolved[path]
+        if not elements or (attribute is not None and any(attribute not in el.attrib for el in elements)):
+            missing.append(path)
+    missing.sort()
+    if dry_run:
+        return missing
+    if missing:
+        raise KeyError(", ".join(missing))
+
+    for path, value in patch.items():
+        if not isinstance(value, (str, unicode)):
+            value = str(value)
+        elements, attribute = resolved[path]
+        for element in elements:
+            if attribute is None:
+                element.text = value
+            else:
+                element.attrib[attribute] = value
+    return missing
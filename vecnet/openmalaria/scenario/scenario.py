@@ -8,14 +8,25 @@
 # This Source Code Form is subject to the terms of the Mozilla Public
 # License (MPL), version 2.0.  If a copy of the MPL was not distributed
 # with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+import StringIO
 from xml.etree import ElementTree
 
+from vecnet.openmalaria.scenario.backend import get_backend
 from vecnet.openmalaria.scenario.core import attribute, Section, section, attribute_setter
 from vecnet.openmalaria.scenario.demography import Demography
+from vecnet.openmalaria.scenario.diff import diff
 from vecnet.openmalaria.scenario.entomology import Entomology
 from vecnet.openmalaria.scenario.healthsystem import HealthSystem
 from vecnet.openmalaria.scenario.interventions import Interventions
 from vecnet.openmalaria.scenario.monitoring import Monitoring
+from vecnet.openmalaria.scenario.patch import apply_patch
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n'
+SCENARIO_NAMESPACE = "http://openmalaria.org/schema/scenario_32"
+
+
+# Prefix of scenario namespace, registered once (ElementTree keeps prefixes in a global dictionary)
+ElementTree.register_namespace("om", SCENARIO_NAMESPACE)
 
 
 class Scenario(Section):
@@ -45,20 +56,28 @@ class Scenario(Section):
         return HealthSystem
 
     @property
-    @section
     def entomology(self):
         """
+        The same object is returned while the <entomology> element is not replaced, so the index of vectors is kept
+        between calls.
         :rtype: Entomology
         """
-        return Entomology
+        entomology = self.et.find("entomology")
+        if self._entomology is None or self._entomology.et is not entomology:
+            self._entomology = Entomology(entomology)
+        return self._entomology
 
     @property
-    @section
     def interventions(self):
         """
+        The same object is returned while the <interventions> element is not replaced, so indexes of interventions
+        (i.e. HumanInterventions) are kept between calls.
         :retype: Interventions
         """
-        return Interventions
+        interventions = self.et.find("interventions")
+        if self._interventions is None or self._interventions.et is not interventions:
+            self._interventions = Interventions(interventions)
+        return self._interventions
 
     @property
     @attribute
@@ -111,17 +130,56 @@ class Scenario(Section):
 
     @property
     def xml(self):
-        if self.schemaVersion < 32:
-            ElementTree.register_namespace("", "http://openmalaria.org/schema/scenario_32")
-        else:
-            ElementTree.register_namespace("om", "http://openmalaria.org/schema/scenario_32")
+        fp = StringIO.StringIO()
+        self.write(fp)
+        return fp.getvalue()
 
-        return '<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n' + ElementTree.tostring(self.root)
+    def write(self, fp):
+        """
+        Write xml document to a file-like object (anything with write method, i.e. open file or socket.makefile()).
+        The document is written piece by piece, output is identical to Scenario.xml
+        """
+        fp.write(XML_DECLARATION)
+        ElementTree.ElementTree(self.root).write(fp)
+
+    def apply_patch(self, patch, dry_run=False):
+        """
+        Change many values at once. patch is a dictionary of path -> value, for example
+        {"entomology/vector/anopheles[@mosquito='gambiae']/seasonality/@annualEIR": 6.1, "@wuID": 1}
+        All paths are resolved with a single traversal of the scenario. See vecnet.openmalaria.scenario.patch for
+        the path syntax.
 
-    def __init__(self, xml):
+        :returns: list of paths that don't exist in this scenario (dry_run=True, no changes are made)
+        :raises: KeyError if some paths don't exist (dry_run=False, no changes are made)
+        """
+        missing = apply_patch(self.root, patch, dry_run=dry_run)
+        if not dry_run:
+            # Patched values may include ids of intervention components and names of vectors
+            self._interventions = None
+            self._entomology = None
+        return missing
+
+    def diff(self, other):
+        """
+        Compare this scenario with another one (Scenario, root element or xml string)
+        Use vecnet.openmalaria.scenario.diff.Differ to compare many scenarios against the same base.
+
+        :returns: list of vecnet.openmalaria.scenario.diff.Change
+        """
+        return diff(self, other)
+
+    def __init__(self, xml, backend=None):
+        """
+        xml - content of scenario file
+        backend - xml tree backend ("lxml" or "etree"), default backend is used if None.
+        See vecnet.openmalaria.scenario.backend for details
+        """
         # self.xml = xml
+        self.backend = get_backend(backend)
+        self._interventions = None
+        self._entomology = None
         # Parsed xml file (as ElementTree)
-        self.root = ElementTree.fromstring(xml)
+        self.root = self.backend.fromstring(xml)
         super(self.__class__, self).__init__(self.root)
 
     def __str__(self):
@@ -130,5 +188,5 @@ class Scenario(Section):
     def load_xml(self, xml):
         # self.xml = xml
         # Parsed xml file (as ElementTree)
-        self.root = ElementTree.fromstring(xml)
+        self.root = self.backend.fromstring(xml)
         super(self.__class__, self).__init__(self.root)
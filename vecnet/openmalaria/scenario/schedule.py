@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Column-oriented schedules of timed deployments (<timed><deploy .../></timed>).
+
+Columns are stored in array.array objects. They support buffer protocol, so numpy.frombuffer(schedule.coverage) can
+be used to get a numpy array without copying, but numpy is not required.
+
+    # Explicit columns (scalars are repeated for every deploy)
+    schedule = Schedule(time=[73, 146, 219], coverage=[0.5, 0.6, 0.7], maxAge=5)
+    # Every 73 time steps starting from 730, coverage is a function of time
+    schedule = Schedule.periodic(730, 73, count=20, coverage=lambda t: min(0.8, (t - 657) / 730.0))
+
+    scenario.interventions.human.deployments[0].schedule = schedule
+"""
+from array import array
+
+# Optional attributes of <deploy> element, missing values are stored as nan
+OPTIONAL_COLUMNS = ("minAge", "maxAge")
+NAN = float("nan")
+
+
+def _column(value, count, typecode, name):
+    """
+    Convert scalar, sequence or function of time to array of count elements
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, long, float)):
+        return array(typecode, [value]) * count
+    values = array(typecode, value)
+    if len(values) != count:
+        raise ValueError("%s has %s values, expected %s" % (name, len(values), count))
+    return values
+
+
+class Schedule(object):
+    """
+    Schedule of timed deployments.
+    time - array of time steps (integers)
+    coverage - array of coverages
+    minAge, maxAge - arrays of ages in years, or None if not defined. nan means "not defined for this deploy".
+    """
+    def __init__(self, time, coverage, minAge=None, maxAge=None):
+        self.time = array("l", time)
+        count = len(self.time)
+        if callable(coverage):
+            coverage = [coverage(t) for t in self.time]
+        self.coverage = _column(coverage, count, "d", "coverage")
+        self.minAge = _column(minAge, count, "d", "minAge")
+        self.maxAge = _column(maxAge, count, "d", "maxAge")
+
+    @classmethod
+    def periodic(cls, start, interval, count=None, end=None, coverage=1.0, minAge=None, maxAge=None):
+        """
+        Deploy every interval time steps starting from start, count times or until end (exclusive).
+        coverage can be a number, a sequence or a function of time step.
+        """
+        assert interval > 0
+        if count is None:
+            if end is None:
+                raise ValueError("Either count or end should be specified")
+            count = max(0, (end - start + interval - 1) // interval)
+        return cls(xrange(start, start + count * interval, interval), coverage, minAge, maxAge)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """
+        Create schedule from a list of dictionaries with "time", "coverage" and optionally "minAge", "maxAge" keys
+        """
+        rows = list(rows)
+        columns = {}
+        for name in OPTIONAL_COLUMNS:
+            if any(name in row for row in rows):
+                columns[name] = [row.get(name, NAN) for row in rows]
+        return cls([row["time"] for row in rows], [row["coverage"] for row in rows], **columns)
+
+    @classmethod
+    def from_elements(cls, elements):
+        """
+        Create schedule from <deploy> elements
+        """
+        time = array("l")
+        coverage = array("d")
+        optional = dict((name, array("d")) for name in OPTIONAL_COLUMNS)
+        defined = set()
+        for element in elements:
+            attrib = element.attrib
+            time.append(int(attrib["time"]))
+            coverage.append(float(attrib["coverage"]))
+            for name in OPTIONAL_COLUMNS:
+                value = attrib.get(name)
+                if value is None:
+                    optional[name].append(NAN)
+                else:
+                    optional[name].append(float(value))
+                    defined.add(name)
+        schedule = cls(time, coverage)
+        for name in defined:
+            setattr(schedule, name, optional[name])
+        return schedule
+
+    def copy(self):
+        """
+        Copy of the schedule, columns are copied too
+        """
+        schedule = Schedule(self.time, self.coverage)
+        for name in OPTIONAL_COLUMNS:
+            column = getattr(self, name)
+            if column is not None:
+                setattr(schedule, name, array("d", column))
+        return schedule
+
+    def __len__(self):
+        return len(self.time)
+
+    def __iter__(self):
+        """
+        Iterate over deploys as dictionaries, the same format as Deployment.timesteps
+        """
+        for index in xrange(len(self.time)):
+            yield self.row(index)
+
+    def row(self, index):
+        row = {"time": self.time[index], "coverage": self.coverage[index]}
+        for name in OPTIONAL_COLUMNS:
+            column = getattr(self, name)
+            if column is not None and column[index] == column[index]:  # skip nan
+                row[name] = column[index]
+        return row
+
+    def attributes(self):
+        """
+        Generator. Yields attribute dictionary of every <deploy> element
+        """
+        optional = [(name, getattr(self, name)) for name in OPTIONAL_COLUMNS if getattr(self, name) is not None]
+        for index in xrange(len(self.time)):
+            attrib = {"time": str(self.time[index]), "coverage": str(self.coverage[index])}
+            for name, column in optional:
+                value = column[index]
+                if value == value:  # skip nan
+                    attrib[name] = str(value)
+            yield attrib
+
+    def to_elements(self, parent):
+        """
+        Create list of <deploy> elements using the same backend as parent element (elements are not attached)
+        """
+        makeelement = parent.makeelement
+        return [makeelement("deploy", attrib) for attrib in self.attributes()]
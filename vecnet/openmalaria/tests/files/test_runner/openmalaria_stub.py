@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Fake OpenMalaria executable for test_runner. Writes output.txt and ctsout.txt from test_output_parser directory.
+Behaviour is controlled by markers in the scenario file:
+stub:fail - exit with code 1
+stub:sleep - sleep for 30 seconds
+stub:flaky - fail on the first run in this directory
+"""
+import os
+import shutil
+import sys
+import time
+
+output_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "test_output_parser")
+
+with open(sys.argv[sys.argv.index("--scenario") + 1]) as fp:
+    scenario = fp.read()
+
+if "stub:fail" in scenario:
+    sys.exit(1)
+if "stub:sleep" in scenario:
+    time.sleep(30)
+if "stub:flaky" in scenario and not os.path.exists("attempt"):
+    open("attempt", "w").close()
+    sys.exit(2)
+
+shutil.copy(os.path.join(output_dir, "output.txt"), "output.txt")
+shutil.copy(os.path.join(output_dir, "ctsout.txt"), "ctsout.txt")
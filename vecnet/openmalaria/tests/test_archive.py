@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from vecnet.openmalaria.archive import ScenarioArchive
+from vecnet.openmalaria.experiment import ExperimentSpecification
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestScenarioArchive(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "archive.sqlite")
+        with open(os.path.join(base_dir, "files", "test_output_parser", "scenario.xml")) as fp:
+            xml = fp.read()
+        model = os.path.join(self.directory, "model.txt")
+        with open(model, "w") as fp:
+            fp.write("model from file")
+        self.experiment = {
+            "base": xml.replace('seed="0"', 'seed="@seed@"').replace('popSize="100"', 'popSize="@pop@"')
+                       .replace("?>", "?><!-- @model@ @eir@ -->", 1),
+            "sweeps": {
+                "pop": {"range": {"placeholder": "@pop@", "start": 100, "stop": 5100, "step": 100}},
+                "model": {"model1": {"@model@": "model 1"}, "model2": {"@model@": "file://%s" % model}}
+            },
+            "sampling": {"method": "lhs", "samples": 5, "parameters": {"eir": {"min": 1, "max": 100}}}
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_archive(self):
+        scenarios = list(ExperimentSpecification(self.experiment).scenarios(generate_seed=True))
+        self.assertEqual(len(scenarios), 500)
+        archive = ScenarioArchive.create(self.path, ExperimentSpecification(self.experiment), generate_seed=True)
+        self.assertEqual(len(archive), 500)
+        for index in (1, 2, 137, 500):
+            scenario = archive[index]
+            self.assertEqual(scenario.xml, scenarios[index - 1].xml)
+            self.assertEqual(scenario.parameters, scenarios[index - 1].parameters)
+            self.assertEqual(scenario.seed, scenarios[index - 1].seed)
+        self.assertEqual([scenario.xml for scenario in archive], [scenario.xml for scenario in scenarios])
+        self.assertEqual(str(archive.scenario(3).demography.popSize), scenarios[2].parameters["pop"])
+        self.assertRaises(IndexError, archive.xml, 501)
+        archive.close()
+
+        # Archive is much smaller than copies of scenarios
+        size = sum(len(scenario.xml) for scenario in scenarios)
+        self.assertLess(os.path.getsize(self.path) * 50, size)
+
+        # Archive doesn't depend on external files
+        os.remove(os.path.join(self.directory, "model.txt"))
+        archive = ScenarioArchive(self.path)
+        self.assertEqual([scenario.xml for scenario in archive], [scenario.xml for scenario in scenarios])
+        archive.close()
+
+    def test_resume(self):
+        ScenarioArchive.create(self.path, ExperimentSpecification(self.experiment), generate_seed=True).close()
+        connection = sqlite3.connect(self.path)
+        with connection:
+            connection.execute("DELETE FROM scenarios WHERE id > 123")
+        connection.close()
+        archive = ScenarioArchive.create(self.path, ExperimentSpecification(self.experiment), generate_seed=True,
+                                         chunk_size=100)
+        scenarios = ExperimentSpecification(self.experiment).scenarios(generate_seed=True)
+        self.assertEqual([scenario.xml for scenario in archive], [scenario.xml for scenario in scenarios])
+        archive.close()
+
+        self.experiment["sweeps"]["model"]["model1"]["@model@"] = "model 3"
+        self.assertRaises(ValueError, ScenarioArchive.create, self.path, ExperimentSpecification(self.experiment))
+
+
+if __name__ == "__main__":
+    unittest.main()
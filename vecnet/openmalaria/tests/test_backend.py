@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+import os
+import warnings
+from xml.etree.ElementTree import ParseError
+
+from vecnet.openmalaria.scenario import Scenario
+from vecnet.openmalaria.scenario import backend
+from vecnet.openmalaria.scenario.backend import get_backend, set_default_backend, lxml_etree
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestBackend(unittest.TestCase):
+    def setUp(self):
+        self.default_backend = get_backend()
+        with open(os.path.join(base_dir, "input", "scenario70k60c.xml")) as fp:
+            self.xml = fp.read()
+
+    def tearDown(self):
+        set_default_backend(self.default_backend)
+
+    def test_get_backend(self):
+        self.assertEqual(get_backend("etree").name, "etree")
+        self.assertRaises(ValueError, get_backend, "unknown")
+        variable = os.environ.pop(backend.BACKEND_VARIABLE, None)
+        try:
+            # lxml is used if it is installed
+            automatic = "etree" if lxml_etree is None else "lxml"
+            self.assertEqual(backend._environment_backend().name, automatic)
+            os.environ[backend.BACKEND_VARIABLE] = "etree"
+            self.assertEqual(backend._environment_backend().name, "etree")
+            # Invalid value doesn't break the import
+            os.environ[backend.BACKEND_VARIABLE] = "unknown"
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always")
+                self.assertEqual(backend._environment_backend().name, automatic)
+            self.assertEqual(len(caught), 1)
+        finally:
+            os.environ.pop(backend.BACKEND_VARIABLE, None)
+            if variable is not None:
+                os.environ[backend.BACKEND_VARIABLE] = variable
+        set_default_backend("etree")
+        self.assertEqual(get_backend().name, "etree")
+        self.assertEqual(Scenario(self.xml).backend.name, "etree")
+
+    def test_parse_error(self):
+        for name in backend.backends:
+            self.assertRaises(ParseError, Scenario, "<scenario>", backend=name)
+
+    @unittest.skipIf(lxml_etree is None, "lxml is not installed")
+    def test_lxml(self):
+        set_default_backend("etree")
+        scenario = Scenario(self.xml, backend="lxml")
+        self.assertEqual(scenario.backend.name, "lxml")
+        self.assertEqual(scenario.xml, Scenario(self.xml).xml)
+
+        # Same modifications should produce the same xml with both backends
+        results = []
+        for name in ["etree", "lxml"]:
+            scenario = Scenario(self.xml, backend=name)
+            scenario.monitoring.surveys = [73, 146]
+            scenario.entomology.vectors["gambiae"].seasonality.monthlyValues = range(12)
+            scenario.healthSystem.ImmediateOutcomes.drugs.add("CQ", 0.5, ["initialACR", "compliance"])
+            with open(os.path.join(base_dir, "files", "test_scenario", "ddt_snippet.xml")) as fp:
+                scenario.interventions.human.add(fp.read())
+            scenario.interventions.human.deployments = [
+                {"name": "Test", "components": ["DDT"], "timesteps": [{"time": 730, "coverage": 0.8}]}
+            ]
+            results.append(scenario.xml)
+        self.assertEqual(results[0], results[1])
+        self.assertEqual(Scenario(results[1], backend="lxml").monitoring.surveys, [73, 146])
+
+
+if __name__ == "__main__":
+    unittest.main()
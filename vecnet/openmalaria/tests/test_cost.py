@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+import os
+
+from vecnet.openmalaria.cost import CostEstimator, balanced_bins, longest_first, scenario_features
+from vecnet.openmalaria.experiment import Scenario
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestCost(unittest.TestCase):
+    def setUp(self):
+        with open(os.path.join(base_dir, "files", "test_output_parser", "scenario.xml")) as fp:
+            self.xml = fp.read()
+        with open(os.path.join(base_dir, "files", "test_scenario", "vaccine_interventions.xml")) as fp:
+            self.interventions_xml = fp.read()
+
+    def test_features(self):
+        self.assertEqual(scenario_features(self.xml), (100, 1095, 4, 0))
+        self.assertEqual(scenario_features(Scenario(self.interventions_xml)), (100, 1460, 4, 2))
+        xml = self.xml.replace('popSize="100"', 'popSize="5000"')
+        self.assertEqual(scenario_features(xml), (5000, 1095, 4, 0))
+
+    def test_estimate(self):
+        estimator = CostEstimator()
+        small = estimator.estimate(self.xml)
+        large = estimator.estimate(self.xml.replace('popSize="100"', 'popSize="1000"'))
+        self.assertAlmostEqual(large, small * 10)
+        self.assertAlmostEqual(small, 100 * 1095 * (1 + 0.5 * 4))
+
+    def test_calibrate(self):
+        coefficients = (2.0, 1e-5, 2e-6, 1e-6)
+        features = [(population, timesteps, vectors, interventions)
+                    for population in (1000, 5000) for timesteps in (730, 1460)
+                    for vectors in (1, 3) for interventions in (0, 4)]
+        estimator = CostEstimator(coefficients)
+        timings = [(feature, estimator.estimate_features(feature)) for feature in features]
+
+        estimator = CostEstimator()
+        estimator.calibrate_features(timings)
+        for expected, coefficient in zip(coefficients, estimator.coefficients):
+            self.assertAlmostEqual(coefficient / expected, 1.0)
+
+        # Not enough scenarios to fit all coefficients - default model is scaled
+        estimator = CostEstimator()
+        estimator.calibrate([(self.xml, 33.0)])
+        self.assertAlmostEqual(estimator.estimate(self.xml), 33.0)
+        self.assertAlmostEqual(estimator.estimate(self.xml.replace('popSize="100"', 'popSize="200"')), 66.0)
+        self.assertRaises(ValueError, estimator.calibrate, [])
+
+    def test_scheduling(self):
+        costs = [5, 1, 8, 3, 8, 2, 4]
+        self.assertEqual(longest_first(costs), [2, 4, 0, 6, 3, 5, 1])
+        bins = balanced_bins(costs, 3)
+        self.assertEqual(sorted(sum(bins, [])), range(len(costs)))
+        self.assertEqual(sorted(sum(costs[i] for i in indices) for indices in bins), [10, 10, 11])
+        self.assertEqual(bins, [[2, 3], [4, 5], [0, 6, 1]])
+        self.assertEqual(balanced_bins(costs, 10)[9], [])
+        self.assertRaises(ValueError, balanced_bins, costs, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
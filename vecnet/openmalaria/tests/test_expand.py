@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+import json
+import os
+import shutil
+import tempfile
+
+from vecnet.openmalaria.bin import expand
+from vecnet.openmalaria.experiment import ExperimentSpecification
+
+experiment = {
+    "base": "<xml>@itn@ @irs@ @eir@ @seed@</xml>",
+    "sweeps": {
+        "itn": {"range": {"placeholder": "@itn@", "linspace": [0, 1], "count": 5}},
+        "irs": {"irs 0": {"@irs@": "0"}, "irs 50": {"@irs@": "50"}}
+    },
+    "sampling": {"method": "lhs", "samples": 3, "parameters": {"eir": {"min": 1, "max": 100}}}
+}
+
+
+class Interrupted(Exception):
+    pass
+
+
+class TestExpand(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "experiment.json")
+        with open(self.filename, "w") as fp:
+            json.dump(experiment, fp)
+        self.cwd = os.getcwd()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def expand(self, name, **kwargs):
+        os.mkdir(os.path.join(self.directory, name))
+        os.chdir(os.path.join(self.directory, name))
+        return expand.main(self.filename, generate_seed=True, **kwargs)
+
+    def files(self, name):
+        files = {}
+        for filename in os.listdir(os.path.join(self.directory, name)):
+            with open(os.path.join(self.directory, name, filename)) as fp:
+                files[filename] = fp.read()
+        return files
+
+    def test_resume_scenarios(self):
+        exp = ExperimentSpecification(experiment)
+        scenarios = list(exp.scenarios(generate_seed=True))
+        self.assertEqual(len(scenarios), 30)
+        for start in (0, 4, 9, 29, 30):
+            resumed = list(exp.scenarios(generate_seed=True, start=start))
+            self.assertEqual([s.xml for s in resumed], [s.xml for s in scenarios[start:]])
+            if start:
+                resumed = exp.scenarios(generate_seed=True, start=start, seed_start=scenarios[start - 1].seed + 1)
+                self.assertEqual([s.xml for s in resumed], [s.xml for s in scenarios[start:]])
+
+    def test_resume(self):
+        self.assertEqual(self.expand("complete"), 0)
+        complete = self.files("complete")
+        self.assertEqual(len(complete), 31)
+
+        scenarios = ExperimentSpecification.scenarios
+
+        def interrupted(exp, *args, **kwargs):
+            for i, scenario in enumerate(scenarios(exp, *args, **kwargs)):
+                if i == 10:
+                    raise Interrupted()
+                yield scenario
+
+        ExperimentSpecification.scenarios = interrupted
+        try:
+            self.assertRaises(Interrupted, self.expand, "resumed", checkpoint_interval=4)
+        finally:
+            ExperimentSpecification.scenarios = scenarios
+        with open(expand.CHECKPOINT_FILE) as fp:
+            checkpoint = json.load(fp)
+        self.assertEqual(checkpoint["scenarios"], 8)
+        self.assertEqual(checkpoint["seed"], 1049)
+
+        self.assertEqual(expand.main(self.filename, generate_seed=True, resume=True, checkpoint_interval=4), 0)
+        self.assertEqual(self.files("resumed"), complete)
+
+    def test_resume_without_checkpoint(self):
+        self.assertEqual(self.expand("complete"), 0)
+        self.assertRaises(RuntimeError, expand.main, self.filename, resume=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
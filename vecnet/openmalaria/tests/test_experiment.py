@@ -14,7 +14,7 @@ import unittest
 import json
 import os
 
-from vecnet.openmalaria.experiment import ExperimentSpecification
+from vecnet.openmalaria.experiment import ExperimentSpecification, RangeSweep
 
 base_dir = os.path.dirname(os.path.abspath(__file__))
 
@@ -434,6 +434,132 @@ class TestExperimentDescription(unittest.TestCase):
         exp.add_sweep("test")
         self.assertIn("test", exp.experiment["sweeps"])
 
+    def test_range_sweeps(self):
+        experiment = {"base": "<xml>@eir@ @coverage@ @itn@</xml>",
+                      "sweeps": {
+                          "eir": {"range": {"placeholder": "@eir@", "start": 5, "stop": 20, "step": 5}},
+                          "coverage": {"range": {"placeholder": "@coverage@", "linspace": [0, 1], "count": 3,
+                                                 "format": "%.2f", "name": "coverage %s"}},
+                          "itn": {"itn 80": {"@itn@": "80"}}
+                      }
+                      }
+        exp = ExperimentSpecification(experiment)
+        self.assertEqual(len(exp.sweep("eir")), 3)
+        self.assertEqual(list(exp.sweep("coverage")), ["coverage 0.00", "coverage 0.50", "coverage 1.00"])
+        self.assertEqual(exp.sweep("coverage")["coverage 0.50"], {"@coverage@": "0.50"})
+        result = self.do_test(exp)
+        self.assertEqual(len(result), 9)
+        self.assertEqual(len(set(result)), 9)
+        self.assertIn("<xml>15 1.00 80</xml>", result)
+        self.assertRaises(TypeError, exp.add_arm, "eir", "eir 100", {"@eir@": "100"})
+
+        # Range arms can be used in combinations
+        experiment["combinations"] = [["eir", "itn"], ["10", "itn 80"]]
+        result = self.do_test(ExperimentSpecification(experiment))
+        self.assertEqual(sorted(result), ["<xml>10 0.00 80</xml>", "<xml>10 0.50 80</xml>", "<xml>10 1.00 80</xml>"])
+
+    def test_range_sweep_count(self):
+        self.assertEqual(len(RangeSweep({"placeholder": "@x@", "start": 0, "stop": 1.1, "step": 0.1})), 11)
+        self.assertEqual(len(RangeSweep({"placeholder": "@x@", "start": 0, "stop": 1000000, "step": 3})), 333334)
+        self.assertEqual(len(RangeSweep({"placeholder": "@x@", "start": 10, "stop": 0, "step": -5})), 2)
+        self.assertEqual(len(RangeSweep({"placeholder": "@x@", "start": 10, "stop": 0})), 0)
+        sweep = RangeSweep({"placeholder": "@x@", "logspace": [1, 1000], "count": 4, "format": "%.6g"})
+        self.assertEqual(list(sweep), ["1", "10", "100", "1000"])
+        self.assertRaises(IndexError, sweep.value, 4)
+        sweep = RangeSweep({"placeholder": "@x@", "linspace": [0, 1], "count": 3, "format": "%.0f"})
+        self.assertRaises(ValueError, sweep.__getitem__, "0")
+
+    def test_range_sweep_lookup(self):
+        sweep = RangeSweep({"placeholder": "@x@", "start": 0, "stop": 100, "step": 0.01, "format": "%.2f",
+                            "name": "x=%s"})
+        calls = []
+        arm_name = sweep.arm_name
+        sweep.arm_name = lambda index: calls.append(index) or arm_name(index)
+        # Index is calculated from the value, not by generating names of all arms
+        self.assertEqual(sweep["x=57.31"], {"@x@": "57.31"})
+        self.assertEqual(sweep.index("x=99.99"), 9999)
+        self.assertNotIn("x=100.00", sweep)
+        self.assertNotIn("y=1.00", sweep)
+        self.assertRaises(KeyError, sweep.__getitem__, "x=1.005")
+        self.assertLess(len(calls), 30)
+        sweep = RangeSweep({"placeholder": "@x@", "logspace": [0.1, 1000], "count": 50, "format": "%.4g"})
+        self.assertEqual([sweep.index(arm_name) for arm_name in sweep], range(50))
+        # Names that don't contain the value are found by scanning the arms
+        sweep = RangeSweep({"placeholder": "@x@", "start": 1, "stop": 4, "name": "arm %s%%"})
+        self.assertEqual(sweep["arm 3%"], {"@x@": "3"})
+
+    def test_len(self):
+        experiment = {"base": "<xml>@itn@ @irs@ @model@ @eir@</xml>",
+                      "sweeps": {
+                          "itn": {"range": {"placeholder": "@itn@", "linspace": [0, 1], "count": 5}},
+                          "irs": {"irs 0": {"@irs@": "0"}, "irs 0.5": {"@irs@": 0.5}, "irs 1": {"@irs@": "1.0"}},
+                          "model": {"model1": {"@model@": "m1"}, "model2": {"@model@": "m2"}}
+                      }
+                      }
+        self.assertEqual(len(ExperimentSpecification(experiment)), 30)
+        experiment["combinations"] = {"a": [["itn", "irs"], ["0.5", "irs 0"], ["1.0", "irs 1"]]}
+        self.assertEqual(len(ExperimentSpecification(experiment)), 4)
+        del experiment["combinations"]
+        experiment["constraints"] = [{"exclude": ["@itn@", "<", "@irs@"]}]
+        experiment["sampling"] = {"method": "lhs", "samples": 3, "parameters": {"eir": {"min": 1, "max": 100}}}
+        exp = ExperimentSpecification(experiment)
+        self.assertEqual(len(exp), len(list(exp.scenarios())))
+        self.assertEqual(len(exp), 54)
+
+    def test_constraints(self):
+        experiment = {"base": "<xml>@itn@ @irs@ @model@</xml>",
+                      "sweeps": {
+                          "itn": {"range": {"placeholder": "@itn@", "linspace": [0, 1], "count": 5}},
+                          "irs": {"irs 0": {"@irs@": "0"}, "irs 0.5": {"@irs@": 0.5}, "irs 1": {"@irs@": "1.0"}},
+                          "model": {"model1": {"@model@": "m1"}, "model2": {"@model@": "m2"}}
+                      },
+                      "constraints": [
+                          {"exclude": ["@itn@", "<", "@irs@"]},
+                          {"exclude": {"irs": "irs 1", "model": ["model2"]}}
+                      ]
+                      }
+        exp = ExperimentSpecification(experiment)
+        result = self.do_test(exp)
+        expected = set()
+        for itn in ["0.0", "0.25", "0.5", "0.75", "1.0"]:
+            for irs in ["0", "0.5", "1.0"]:
+                for model in ["m1", "m2"]:
+                    if float(itn) >= float(irs) and (irs, model) != ("1.0", "m2"):
+                        expected.add("<xml>%s %s %s</xml>" % (itn, irs, model))
+        self.assertEqual(len(result), len(expected))
+        self.assertEqual(set(result), expected)
+
+        experiment["constraints"] = [{"include": {"model": "model1"}}, {"include": ["@itn@", ">=", 0.75]}]
+        result = self.do_test(ExperimentSpecification(experiment))
+        self.assertEqual(len(result), 6)
+        self.assertTrue(all(xml.endswith(" m1</xml>") for xml in result))
+
+        experiment["constraints"] = [{"exclude": {"vaccine": "vaccine 1"}}]
+        self.assertRaises(ValueError, list, ExperimentSpecification(experiment).scenarios())
+        experiment["constraints"] = [{"exclude": ["@itn@", "~", 1]}]
+        self.assertRaises(ValueError, list, ExperimentSpecification(experiment).scenarios())
+
+    def test_constraints_pruning(self):
+        experiment = {"base": "<xml>@a@ @b@ @c@</xml>",
+                      "sweeps": {
+                          "a": {"range": {"placeholder": "@a@", "start": 0, "stop": 100}},
+                          "b": {"range": {"placeholder": "@b@", "start": 0, "stop": 100}},
+                          "c": {"range": {"placeholder": "@c@", "start": 0, "stop": 100}}
+                      },
+                      "combinations": [["a", "b"], ["1", "1"], ["2", "2"]],
+                      "constraints": [{"include": {"c": "7"}}]
+                      }
+        exp = ExperimentSpecification(experiment)
+        calls = []
+        sweep = exp.sweep("c")
+        arm_name = sweep.arm_name
+        sweep.arm_name = lambda index: calls.append(index) or arm_name(index)
+        sweep_names, combinations = exp.combinations()
+        self.assertEqual(sweep_names, ["a", "b", "c"])
+        self.assertEqual(list(combinations), [["1", "1", "7"], ["2", "2", "7"]])
+        # Every arm of c is generated once per combination of a and b, other values of a and b are not enumerated
+        self.assertEqual(len(calls), 200)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -12,8 +12,9 @@
 
 import unittest
 import os
+import StringIO
 
-from vecnet.openmalaria import get_schema_version_from_xml
+from vecnet.openmalaria import get_schema_version_from_xml, get_schema_versions_from_xml
 
 
 class TestGetSchemaVersion(unittest.TestCase):
@@ -46,6 +47,54 @@ class TestGetSchemaVersion(unittest.TestCase):
         schema_version = get_schema_version_from_xml("abcdef")
         self.assertIsNone(schema_version)
 
+    def test_get_schema_version_from_filename(self):
+        base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "files", "test_get_schema_version")
+        self.assertEqual(get_schema_version_from_xml(os.path.join(base_dir, "scenario30.xml")), "30")
+        self.assertEqual(get_schema_version_from_xml(os.path.join(base_dir, "scenario32.xml")), "32")
+        self.assertIsNone(get_schema_version_from_xml(os.path.join(base_dir, "non_om_xml.xml")))
+        # Non-existing file is treated as a (non-xml) content
+        self.assertIsNone(get_schema_version_from_xml(os.path.join(base_dir, "no_such_file.xml")))
+
+    def test_get_schema_version_from_bytes(self):
+        self.assertEqual(get_schema_version_from_xml(bytearray('<scenario schemaVersion="32"/>')), "32")
+        self.assertEqual(get_schema_version_from_xml(u'<scenario schemaVersion="31"></scenario>'), "31")
+        # Only the root tag is required to get schemaVersion
+        self.assertEqual(get_schema_version_from_xml('<scenario schemaVersion="32"><demography>'), "32")
+        # Truncated document is not an xml file if the whole document is checked, like with ElementTree.parse
+        self.assertIsNone(get_schema_version_from_xml('<scenario schemaVersion="32"><demography>', validate=True))
+        self.assertIsNone(get_schema_version_from_xml('<scenario schemaVersion="32"/><scenario/>', validate=True))
+        self.assertEqual(get_schema_version_from_xml('<scenario schemaVersion="32"/>', validate=True), "32")
+
+    def test_stops_at_root(self):
+        class File(object):
+            def __init__(self, data):
+                self.fp = StringIO.StringIO(data)
+                self.read_size = 0
+
+            def read(self, size):
+                data = self.fp.read(size)
+                self.read_size += len(data)
+                return data
+
+        fp = File('<scenario schemaVersion="32">' + "<a/>" * 1000000 + "</scenario>")
+        self.assertEqual(get_schema_version_from_xml(fp), "32")
+        self.assertLess(fp.read_size, 10000)
+
+    def test_get_schema_versions_from_xml(self):
+        base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "files", "test_get_schema_version")
+        xml_list = [os.path.join(base_dir, "scenario30.xml"),
+                    os.path.join(base_dir, "scenario32.xml"),
+                    os.path.join(base_dir, "non_om_xml.xml"),
+                    "",
+                    '<scenario schemaVersion="33"/>']
+        expected_result = ["30", "32", None, None, "33"]
+        self.assertEqual(get_schema_versions_from_xml(xml_list, processes=1), expected_result)
+        self.assertEqual(get_schema_versions_from_xml(xml_list, processes=2), expected_result)
+        self.assertEqual(get_schema_versions_from_xml([]), [])
+        truncated = ['<scenario schemaVersion="32">'] * 2
+        self.assertEqual(get_schema_versions_from_xml(truncated, processes=2), ["32", "32"])
+        self.assertEqual(get_schema_versions_from_xml(truncated, processes=2, validate=True), [None, None])
+
 
 if __name__ == "__main__":
     unittest.main()
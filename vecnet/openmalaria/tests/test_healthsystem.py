@@ -11,6 +11,8 @@
 
 import unittest
 from vecnet.openmalaria.healthsystem import get_prob_from_percentage, get_percentage_from_prob
+from vecnet.openmalaria.healthsystem import get_probs_from_percentages, get_percentages_from_probs
+from vecnet.openmalaria.healthsystem import Interpolator, probabilities
 
 
 class TestHealthSystem(unittest.TestCase):
@@ -39,4 +41,51 @@ class TestHealthSystem(unittest.TestCase):
         self.assertEqual(get_percentage_from_prob(0.5), 77)
         self.assertEqual(get_percentage_from_prob(0.9984183), 99)
         self.assertEqual(get_percentage_from_prob(0.9984185), 100)
-        self.assertEqual(get_percentage_from_prob(1.00), 100)
\ No newline at end of file
+        self.assertEqual(get_percentage_from_prob(1.00), 100)
+
+    def test_interpolation(self):
+        self.assertRaises(AssertionError, get_prob_from_percentage, 50.5)
+        self.assertAlmostEqual(get_prob_from_percentage(50.5, interpolate=True),
+                               (get_prob_from_percentage(50) + get_prob_from_percentage(51)) / 2)
+        self.assertEqual(get_prob_from_percentage(100.0, interpolate=True), 0.9984184)
+        self.assertAlmostEqual(get_percentage_from_prob(get_prob_from_percentage(77.25, interpolate=True),
+                                                        interpolate=True), 77.25)
+        self.assertEqual(get_percentage_from_prob(1.0, interpolate=True), 100)
+
+    def test_sequences(self):
+        percentages = range(0, 101)
+        probs = get_probs_from_percentages(percentages)
+        self.assertEqual(probs, [get_prob_from_percentage(i) for i in percentages])
+        self.assertEqual(get_percentages_from_probs(probs), percentages)
+        self.assertEqual(get_percentages_from_probs([0.5, 0.01, 1.0]), [77, 2, 100])
+        self.assertEqual(get_probs_from_percentages([]), [])
+        self.assertEqual(get_percentages_from_probs([]), [])
+        self.assertRaises(AssertionError, get_probs_from_percentages, [1, 101])
+        self.assertRaises(AssertionError, get_percentages_from_probs, [0.5, "0.5"])
+        self.assertRaises(ValueError, get_probs_from_percentages, [100.5], interpolate=True)
+
+        # Bulk conversions give exactly the same results as conversions of single values
+        percentages = [i / 4.0 for i in range(401)][::-1] + [3, 50]
+        probs = get_probs_from_percentages(percentages, interpolate=True)
+        self.assertEqual(probs, [get_prob_from_percentage(perc, interpolate=True) for perc in percentages])
+        probs += [0.0, 0.9984184, 0.999, 1]
+        for interpolate in (False, True):
+            self.assertEqual(get_percentages_from_probs(probs, interpolate),
+                             [get_percentage_from_prob(prob, interpolate) for prob in probs])
+
+    def test_interpolator(self):
+        self.assertRaises(ValueError, Interpolator, [0, 1], [1, 0])
+        self.assertRaises(ValueError, Interpolator, [0, 1], [0, 1], method="quadratic")
+        for method in ["linear", "cubic"]:
+            interpolator = Interpolator(range(101), probabilities, method=method)
+            # Table points are preserved
+            self.assertEqual(interpolator(range(101)), probabilities)
+            self.assertEqual(interpolator.inverse(probabilities), range(101))
+            values = interpolator([i / 10.0 for i in range(1001)])
+            self.assertTrue(all(a < b for a, b in zip(values, values[1:])))
+            self.assertAlmostEqual(interpolator.inverse(interpolator(33.3)), 33.3)
+            self.assertEqual(interpolator(33.3), interpolator(33.3))
+            self.assertRaises(ValueError, interpolator, 100.5)
+            self.assertRaises(ValueError, interpolator.inverse, 1.0)
+        # Linear interpolation of two points
+        self.assertEqual(Interpolator([0, 2], [0, 1])(0.5), 0.25)
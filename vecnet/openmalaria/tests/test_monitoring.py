@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+
+from vecnet.openmalaria.monitoring import classify_survey_time, classify_survey_times, get_survey_times, \
+    get_survey_timesteps, set_survey_times
+
+
+class Monitoring(object):
+    def __init__(self, surveys):
+        self.surveys = surveys
+
+
+class TestMonitoring(unittest.TestCase):
+    def test_classify(self):
+        self.assertEqual(classify_survey_time(146), "yearly")
+        self.assertEqual(classify_survey_time(73 + 11), "monthly")
+        self.assertEqual(classify_survey_time(73 + 12), "custom")
+        self.assertEqual(classify_survey_times([73, 146]), "yearly")
+        self.assertEqual(classify_survey_times([]), "yearly")
+        # The last survey that is not at the beginning of a year defines the kind
+        self.assertEqual(classify_survey_times([5, 73 + 6, 146]), "monthly")
+        self.assertEqual(classify_survey_times([6, 73 + 5, 146]), "custom")
+
+    def test_yearly(self):
+        surveys = set_survey_times(2000, 3, 0, 2002, "yearly")
+        self.assertEqual(surveys, ["146", "219", "292", "365"])
+        self.assertEqual(get_survey_times(Monitoring([int(t) for t in surveys]), 2000),
+                         {"type": "yearly", "start_date": 2002, "yrs": 3, "mos": 0, "timesteps": 365})
+
+    def test_monthly(self):
+        timesteps = get_survey_timesteps(2000, 1, 2, 2001, "monthly")
+        self.assertEqual(list(timesteps), [73, 79, 84, 91, 97, 103, 109, 115, 121, 127, 133, 139, 146, 152, 157])
+        self.assertEqual(set_survey_times(2000, 1, 2, 2001, "monthly"), [str(t) for t in timesteps])
+        self.assertEqual(get_survey_times(Monitoring(list(timesteps)), 2000),
+                         {"type": "monthly", "start_date": 2001, "yrs": 1, "mos": 2, "timesteps": 157})
+
+    def test_custom(self):
+        self.assertEqual(set_survey_times(2000, 1, 0, 2000, "custom"), [])
+        self.assertEqual(get_survey_times(Monitoring([10, 20]), 2000),
+                         {"type": "custom", "start_date": 0, "yrs": 0, "mos": 0, "timesteps": 20})
+
+
+if __name__ == "__main__":
+    unittest.main()
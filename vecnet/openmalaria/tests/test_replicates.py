@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+from vecnet.openmalaria.experiment import ExperimentSpecification
+from vecnet.openmalaria.replicates import AdaptiveReplicates, RunningStatistics, survey_measure
+from vecnet.openmalaria.runner import Runner
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+stub = [sys.executable, os.path.join(base_dir, "files", "test_runner", "openmalaria_stub.py")]
+
+
+class FakeOutput(object):
+    def __init__(self, value):
+        self.survey_output_data = {(0, 0): [[73, value / 2.0], [146, value / 2.0]]}
+
+
+class TestReplicates(unittest.TestCase):
+    def test_running_statistics(self):
+        rng = random.Random(1)
+        values = [rng.uniform(0, 10) for i in range(5)] + [3.0, 7.5, 1.25]
+        statistics = RunningStatistics()
+        self.assertIsNone(statistics.variance)
+        for value in values:
+            statistics.add(value)
+        mean = sum(values) / len(values)
+        variance = sum((value - mean) ** 2 for value in values) / (len(values) - 1)
+        self.assertEqual(statistics.count, 8)
+        self.assertAlmostEqual(statistics.mean, mean)
+        self.assertAlmostEqual(statistics.variance, variance)
+        self.assertAlmostEqual(statistics.confidence_interval_width(), 2 * 2.365 * (variance / 8) ** 0.5)
+
+    def test_adaptive_replicates(self):
+        experiment = ExperimentSpecification({
+            "base": "<xml>@noise@ @seed@</xml>",
+            "sweeps": {"noise": {"low": {"@noise@": "1"}, "high": {"@noise@": "100"}}}
+        })
+        replicates = AdaptiveReplicates(experiment, survey_measure(0), target_width=5, batch_size=10,
+                                        max_replicates=40)
+        batches = 0
+        batch = replicates.next_batch()
+        while batch:
+            batches += 1
+            for scenario in batch:
+                noise = float(scenario.xml.split()[0][5:])
+                value = random.Random(scenario.seed).gauss(100, noise)
+                replicates.add_result(scenario, FakeOutput(value))
+            batch = replicates.next_batch()
+        parameter_sets = dict((parameter_set.parameters["noise"], parameter_set)
+                              for parameter_set in replicates.parameter_sets)
+        self.assertEqual(batches, 4)
+        self.assertEqual(len(parameter_sets["low"].seeds), 10)
+        self.assertEqual(parameter_sets["low"].statistics.count, 10)
+        self.assertLess(parameter_sets["low"].width, 5)
+        self.assertAlmostEqual(parameter_sets["low"].statistics.mean, 100, delta=2)
+        self.assertEqual(len(parameter_sets["high"].seeds), 40)
+        self.assertGreater(parameter_sets["high"].width, 5)
+        # Seeds are unique
+        self.assertEqual(len(set(parameter_sets["low"].seeds + parameter_sets["high"].seeds)), 50)
+
+    def test_run(self):
+        with open(os.path.join(base_dir, "files", "test_output_parser", "scenario.xml")) as fp:
+            xml = fp.read().replace('seed="0"', 'seed="@seed@"')
+        experiment = ExperimentSpecification({
+            "base": xml.replace("?>", "?><!-- @marker@ -->", 1),
+            "sweeps": {"marker": {"ok": {"@marker@": "stub:ok"}, "fail": {"@marker@": "stub:fail"}}}
+        })
+        workdir = tempfile.mkdtemp()
+        try:
+            replicates = AdaptiveReplicates(experiment, survey_measure(3, 1, survey=1), target_width=0.1,
+                                            batch_size=3, max_replicates=6)
+            parameter_sets = replicates.run(Runner(stub, workdir))
+            self.assertEqual(len(os.listdir(workdir)), 9)
+        finally:
+            shutil.rmtree(workdir)
+        parameter_sets = dict((parameter_set.parameters["marker"], parameter_set) for parameter_set in parameter_sets)
+        # Identical outputs converge after the first batch
+        self.assertEqual(parameter_sets["ok"].statistics.count, 3)
+        self.assertEqual(parameter_sets["ok"].statistics.mean, 27)
+        self.assertEqual(parameter_sets["ok"].width, 0)
+        self.assertEqual(parameter_sets["fail"].failures, 6)
+        self.assertEqual(parameter_sets["fail"].statistics.count, 0)
+
+    def test_no_seed(self):
+        experiment = ExperimentSpecification({"base": "<xml>@a@</xml>", "sweeps": {"a": {"a1": {"@a@": "1"}}}})
+        replicates = AdaptiveReplicates(experiment, survey_measure(0), target_width=1)
+        self.assertRaises(RuntimeError, replicates.next_batch)
+
+    def test_seed_sweep(self):
+        # A sweep named "seed" is not overwritten by the generated seed
+        experiment = ExperimentSpecification({
+            "base": "<xml>@s@ @seed@</xml>", "sweeps": {"seed": {"s1": {"@s@": "1"}, "s2": {"@s@": "2"}}}
+        })
+        replicates = AdaptiveReplicates(experiment, survey_measure(0), target_width=1, batch_size=2)
+        self.assertEqual(replicates.parameter_sets, [])
+        batch = replicates.next_batch()
+        self.assertEqual(len(replicates.parameter_sets), 2)
+        self.assertEqual(sorted(scenario.parameters["seed"] for scenario in batch), ["s1", "s1", "s2", "s2"])
+        self.assertEqual(len(set(scenario.seed for scenario in batch)), 4)
+        for scenario in batch:
+            self.assertTrue(scenario.xml.endswith(" %s</xml>" % scenario.seed))
+            replicates.add_result(scenario, FakeOutput(1.0))
+        self.assertEqual(replicates.next_batch(), [])
+
+    def test_run_without_output(self):
+        experiment = ExperimentSpecification({"base": "<xml>@seed@</xml>", "sweeps": {}})
+        replicates = AdaptiveReplicates(experiment, survey_measure(0), target_width=1)
+        self.assertRaises(ValueError, replicates.run, Runner(stub, tempfile.gettempdir(), parse_output=False))
+
+
+if __name__ == "__main__":
+    unittest.main()
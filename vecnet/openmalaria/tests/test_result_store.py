@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+
+from vecnet.openmalaria.result_store import ResultStore, scenario_hash
+from vecnet.openmalaria.runner import run_simulations
+from vecnet.openmalaria.scenario import Scenario
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+output_dir = os.path.join(base_dir, "files", "test_output_parser")
+stub = [sys.executable, os.path.join(base_dir, "files", "test_runner", "openmalaria_stub.py")]
+
+
+class TestResultStore(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(output_dir, "scenario.xml")) as fp:
+            self.xml = fp.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_scenario_hash(self):
+        key = scenario_hash(self.xml)
+        self.assertEqual(scenario_hash(Scenario(self.xml)), key)
+        # Formatting and order of attributes doesn't matter
+        self.assertEqual(scenario_hash(self.xml.replace("\n", "\n  ")), key)
+        self.assertEqual(scenario_hash(self.xml.replace('maximumAgeYrs="90" name="Rachuonyo"',
+                                                        'name="Rachuonyo" maximumAgeYrs="90"')), key)
+        self.assertNotEqual(scenario_hash(self.xml.replace('popSize="100"', 'popSize="101"')), key)
+
+    def test_store(self):
+        store = ResultStore(os.path.join(self.directory, "store"))
+        self.assertFalse(self.xml in store)
+        self.assertIsNone(store.load(self.xml))
+        store.put(self.xml, output_dir)
+        self.assertTrue(self.xml in store)
+        self.assertEqual(store.load(self.xml).survey_time_list, [730, 803, 876, 949, 1022, 1095])
+        workdir = os.path.join(self.directory, "workdir")
+        os.mkdir(workdir)
+        self.assertTrue(store.restore(Scenario(self.xml), workdir))
+        self.assertEqual(sorted(os.listdir(workdir)), ["ctsout.txt", "output.txt"])
+        self.assertRaises(IOError, store.put, self.xml, workdir + "missing")
+
+    def test_eviction(self):
+        size = os.path.getsize(os.path.join(output_dir, "output.txt")) + \
+            os.path.getsize(os.path.join(output_dir, "ctsout.txt"))
+        store = ResultStore(self.directory, max_size=size * 2)
+        scenarios = [self.xml.replace('popSize="100"', 'popSize="%s"' % i) for i in range(3)]
+        store.put(scenarios[0], output_dir)
+        store.put(scenarios[1], output_dir)
+        # Use the first scenario, so the second one is evicted
+        os.utime(os.path.join(self.directory, scenario_hash(scenarios[1])), (0, 0))
+        self.assertIsNotNone(store.get(scenarios[0]))
+        store.put(scenarios[2], output_dir)
+        self.assertEqual([scenario in store for scenario in scenarios], [True, False, True])
+        self.assertEqual(store.size(), size * 2)
+
+        # Directory is scanned only once
+        store._entries = None
+        store.put(scenarios[1], output_dir)
+        self.assertEqual([scenario in store for scenario in scenarios], [False, True, True])
+
+    def test_replace(self):
+        store = ResultStore(self.directory, max_size=10 ** 9)
+        broken = os.path.join(self.directory, "broken")
+        os.mkdir(broken)
+        with open(os.path.join(broken, "output.txt"), "w") as fp:
+            fp.write("truncated")
+        key = store.put(self.xml, broken)
+        self.assertEqual(sorted(store.get(self.xml)), ["output.txt"])
+        # Simulated again, broken output is replaced
+        self.assertEqual(store.put(self.xml, output_dir), key)
+        self.assertEqual(store.load(self.xml).survey_time_list, [730, 803, 876, 949, 1022, 1095])
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(["broken", key]))
+        self.assertEqual(store.size(), store._total)
+
+        # Entry without output.txt is a miss
+        os.remove(os.path.join(self.directory, key, "output.txt"))
+        self.assertFalse(self.xml in store)
+        self.assertIsNone(store.get(self.xml))
+        self.assertIsNone(store.load(self.xml))
+
+    def test_runner(self):
+        store = ResultStore(os.path.join(self.directory, "store"))
+        failing = self.xml.replace("?>", "?><!-- stub:fail -->", 1)
+        results = run_simulations([self.xml], stub, os.path.join(self.directory, "run1"), store=store)
+        self.assertFalse(results[0].cached)
+        # Comments are not a part of the hash, so the output is taken from the store and the stub is not started
+        results = run_simulations([self.xml, failing], stub, os.path.join(self.directory, "run2"), store=store)
+        self.assertEqual([result.cached for result in results], [True, True])
+        self.assertEqual([result.attempts for result in results], [0, 0])
+        self.assertEqual(results[1].output.survey_time_list, [730, 803, 876, 949, 1022, 1095])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from vecnet.openmalaria import runner as runner_module
+from vecnet.openmalaria.experiment import ExperimentSpecification
+from vecnet.openmalaria.runner import Runner, run_simulations
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+stub = [sys.executable, os.path.join(base_dir, "files", "test_runner", "openmalaria_stub.py")]
+
+
+class TestRunner(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        with open(os.path.join(base_dir, "files", "test_output_parser", "scenario.xml")) as fp:
+            self.xml = fp.read()
+
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+
+    def scenario(self, marker):
+        # Markers are placed in a comment, they don't change the scenario
+        return self.xml.replace("?>", "?><!-- %s -->" % marker, 1)
+
+    def test_run(self):
+        resource = os.path.join(base_dir, "files", "test_output_parser", "output_nan.txt")
+        results = run_simulations([self.xml, self.scenario("stub:fail"), self.xml], stub, self.workdir,
+                                  resources=[resource], processes=2)
+        self.assertEqual([result.index for result in results], [1, 2, 3])
+        self.assertEqual([result.ok for result in results], [True, False, True])
+        self.assertEqual(results[0].output.survey_time_list, [730, 803, 876, 949, 1022, 1095])
+        self.assertEqual(len(results[2].output.cts_output_data["simulated EIR"]), 1096)
+        self.assertEqual(results[1].returncode, 1)
+        self.assertIsNone(results[1].output)
+        self.assertEqual(results[1].attempts, 1)
+        self.assertTrue(os.path.exists(os.path.join(self.workdir, "scenario3", "output_nan.txt")))
+        with open(os.path.join(self.workdir, "scenario1", "scenario.xml")) as fp:
+            self.assertEqual(fp.read(), self.xml)
+
+    def test_retries_and_timeout(self):
+        runner = Runner(stub, self.workdir, timeout=0.5, retries=1)
+        results = dict((result.index, result) for result in
+                       runner.run([self.scenario("stub:flaky"), self.scenario("stub:sleep")]))
+        self.assertTrue(results[1].ok)
+        self.assertEqual(results[1].attempts, 2)
+        self.assertFalse(results[2].ok)
+        self.assertEqual(results[2].attempts, 2)
+        self.assertIsNone(results[2].returncode)
+        self.assertTrue(results[2].error.startswith("Timeout"))
+
+    def test_experiment(self):
+        experiment = ExperimentSpecification({
+            "name": "Test", "base": self.xml.replace('popSize="100"', 'popSize="@pop@"'),
+            "sweeps": {"pop": {"small": {"@pop@": 100}, "large": {"@pop@": 1000}}}
+        })
+        results = run_simulations(experiment.scenarios(), stub, self.workdir, parse_output=False)
+        self.assertEqual(sorted(result.scenario.parameters["pop"] for result in results), ["large", "small"])
+        self.assertTrue(all(result.ok and result.output is None for result in results))
+
+    def test_missing_executable(self):
+        results = run_simulations([self.xml], os.path.join(self.workdir, "missing"), self.workdir)
+        self.assertFalse(results[0].ok)
+        self.assertTrue(results[0].error.startswith("Can't start"))
+
+    def test_bounded_input(self):
+        consumed = []
+
+        def scenarios():
+            for i in range(200):
+                consumed.append(i)
+                yield self.xml
+
+        results = Runner(stub, self.workdir, processes=1, parse_output=False).run(scenarios())
+        self.assertTrue(next(results).ok)
+        # 2 scenarios are submitted at start, one more after the first result
+        self.assertLessEqual(len(consumed), 3)
+        results.close()
+        self.assertLessEqual(len(consumed), 3)
+
+    def test_stop_kills_simulations(self):
+        results = Runner(stub, self.workdir, processes=2).run([self.xml, self.scenario("stub:sleep")])
+        started = time.time()
+        self.assertEqual(next(results).index, 1)
+        results.close()
+        # Sleeping simulator was killed, not waited for
+        self.assertLess(time.time() - started, 10)
+
+    def test_parser_exception(self):
+        class BrokenParser(object):
+            def __init__(self, *args, **kwargs):
+                raise RuntimeError("broken")
+
+        parser = runner_module.OutputParser
+        runner_module.OutputParser = BrokenParser
+        try:
+            results = run_simulations([self.xml, self.xml], stub, self.workdir)
+        finally:
+            runner_module.OutputParser = parser
+        self.assertEqual([result.error for result in results], ["Can't parse output: broken"] * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+
+from vecnet.openmalaria.experiment import ExperimentSpecification
+from vecnet.openmalaria.sampling import halton, latin_hypercube, sample_parameters, scale_value, sobol
+
+
+class TestSampling(unittest.TestCase):
+    def test_latin_hypercube(self):
+        points = latin_hypercube(10, 3, seed=1)
+        self.assertEqual(len(points), 10)
+        for dimension in range(3):
+            # Exactly one point in every interval
+            self.assertEqual(sorted(int(point[dimension] * 10) for point in points), range(10))
+        self.assertEqual(latin_hypercube(10, 3, seed=1), points)
+
+    def test_sobol(self):
+        self.assertEqual(sobol(8, 3), [(0.0, 0.0, 0.0), (0.5, 0.5, 0.5), (0.75, 0.25, 0.25), (0.25, 0.75, 0.75),
+                                       (0.375, 0.375, 0.625), (0.875, 0.875, 0.125), (0.625, 0.125, 0.875),
+                                       (0.125, 0.625, 0.375)])
+        points = sobol(256, 21)
+        for dimension in range(21):
+            self.assertEqual(sorted(int(point[dimension] * 256) for point in points), range(256))
+        self.assertRaises(ValueError, sobol, 8, 22)
+
+    def test_halton(self):
+        self.assertEqual(halton(4, 2), [(0.5, 1 / 3.0), (0.25, 2 / 3.0), (0.75, 1 / 9.0), (0.125, 4 / 9.0)])
+
+    def test_scale_value(self):
+        self.assertEqual(scale_value(0.5, {"min": 10, "max": 20}), 15)
+        self.assertAlmostEqual(scale_value(0.5, {"min": 1, "max": 100, "scale": "log"}), 10)
+        values = [scale_value(i / 10.0, {"min": 1, "max": 5, "type": "int"}) for i in range(10)]
+        self.assertEqual(values, [1, 1, 2, 2, 3, 3, 4, 4, 5, 5])
+        self.assertRaises(ValueError, sample_parameters, {"method": "grid", "samples": 1, "parameters": {}})
+
+    def test_experiment(self):
+        experiment = ExperimentSpecification({
+            "base": "<xml>@eir@ @coverage@ @nets@ @itn@</xml>",
+            "sweeps": {"itn": {"on": {"@itn@": "1"}, "off": {"@itn@": "0"}}},
+            "sampling": {
+                "method": "sobol",
+                "samples": 4,
+                "parameters": {
+                    "eir": {"min": 1, "max": 100, "scale": "log"},
+                    "coverage": {"min": 0.0, "max": 1.0},
+                    "number_of_nets": {"min": 0, "max": 3, "type": "int", "placeholder": "@nets@"}
+                }
+            }
+        })
+        scenarios = list(experiment.scenarios())
+        self.assertEqual(len(scenarios), 8)
+        xml = set(scenario.xml for scenario in scenarios if scenario.parameters["itn"] == "on")
+        self.assertEqual(xml, {"<xml>1.0 0.0 0 1</xml>", "<xml>10.000000000000002 0.5 2 1</xml>",
+                               "<xml>3.1622776601683795 0.75 1 1</xml>", "<xml>31.622776601683803 0.25 3 1</xml>"})
+        # Values substituted in the scenario are exactly the recorded values
+        for scenario in scenarios:
+            self.assertEqual(float(scenario.xml[5:].split()[0]), scenario.parameters["eir"])
+        self.assertEqual(sorted(scenario.parameters["number_of_nets"] for scenario in scenarios),
+                         [0, 0, 1, 1, 2, 2, 3, 3])
+
+        # Sampling without sweeps
+        del experiment.experiment["sweeps"]
+        self.assertEqual(len(list(experiment.scenarios())), 4)
+
+        experiment.experiment["sampling"]["samples"] = 0
+        self.assertEqual(list(experiment.scenarios(start=2)), [])
+
+    def test_default_seed(self):
+        sampling = {"method": "lhs", "samples": 10, "parameters": {"eir": {"min": 1, "max": 100}}}
+        # Unseeded design is reproducible, so an interrupted expansion can be resumed
+        self.assertEqual(sample_parameters(sampling), sample_parameters(sampling))
+        sampling["seed"] = 1
+        self.assertNotEqual(sample_parameters(sampling), sample_parameters(dict(sampling, seed=2)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -13,8 +13,12 @@ import copy
 
 import unittest
 import os
+import StringIO
+import tempfile
+from xml.etree import ElementTree
 
 from vecnet.openmalaria.scenario import Scenario
+from vecnet.openmalaria.scenario.diff import Change, diff, diff_many
 from vecnet.openmalaria.scenario.entomology import Vector
 from vecnet.openmalaria.scenario.monitoring import Monitoring
 
@@ -55,6 +59,256 @@ class TestScenario(unittest.TestCase):
         self.assertEqual(hasattr(scenario, "monitoring"), True)
         self.assertIsInstance(scenario.monitoring, Monitoring)
 
+    def test_write(self):
+        scenario = self.scenario
+        fp = StringIO.StringIO()
+        scenario.write(fp)
+        self.assertEqual(fp.getvalue(), scenario.xml)
+
+        scenario.name = "Test name"
+        fd, filename = tempfile.mkstemp(suffix=".xml")
+        try:
+            with os.fdopen(fd, "wb") as fp:
+                scenario.write(fp)
+            with open(filename, "rb") as fp:
+                self.assertEqual(fp.read(), scenario.xml)
+        finally:
+            os.remove(filename)
+
+        # Namespaces of schema < 32 documents are kept (elements without namespace stay without namespace)
+        namespace = "http://openmalaria.org/schema/scenario_32"
+        old = Scenario('<om:scenario xmlns:om="%s" schemaVersion="31"><demography/></om:scenario>' % namespace)
+        self.assertEqual([el.tag for el in Scenario(old.xml).root.iter()], ["{%s}scenario" % namespace, "demography"])
+        # Writing doesn't change prefixes registered in ElementTree
+        self.assertTrue(ElementTree.tostring(ElementTree.Element("{%s}scenario" % namespace)).startswith("<om:"))
+
+        # Schema 30 scenario uses default namespace, schema 32 uses om: prefix
+        scenario30 = Scenario(open(os.path.join(base_dir, "files", "test_get_schema_version", "scenario30.xml")).read())
+        self.assertTrue(scenario30.xml.startswith('<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n<scenario '))
+        self.assertTrue(scenario.xml.startswith('<?xml version="1.0" encoding="UTF-8" standalone="no"?>\n<om:scenario '))
+
+    def test_apply_patch(self):
+        scenario = self.scenario
+        patch = {
+            "entomology/@scaledAnnualEIR": 10.0,
+            "entomology/vector/anopheles[@mosquito='gambiae']/seasonality/@annualEIR": 6.1,
+            "entomology/vector/anopheles[@mosquito=\"gambiae\"]/mosq/mosqHumanBloodIndex/@value": 0.7,
+            "monitoring/surveys/surveyTime": 100,
+            "@name": "Patched",
+        }
+        self.assertEqual(scenario.apply_patch(patch, dry_run=True), [])
+        # dry run doesn't change the scenario
+        self.assertEqual(scenario.entomology.scaledAnnualEIR, 25.0)
+
+        scenario.apply_patch(patch)
+        self.assertEqual(scenario.name, "Patched")
+        self.assertEqual(scenario.entomology.scaledAnnualEIR, 10.0)
+        self.assertEqual(scenario.entomology.vectors["gambiae"].seasonality.annualEIR, 6.1)
+        self.assertEqual(scenario.entomology.vectors["gambiae"].mosq.mosqHumanBloodIndex, 0.7)
+        # All matching elements are changed
+        self.assertEqual(scenario.monitoring.surveys, [100, 100, 100, 100])
+
+        bad_patch = {
+            "entomology/@scaledAnnualEIR": 15.0,
+            "entomology/vector/anopheles[@mosquito='funestus']/seasonality/@annualEIR": 6.1,
+            "entomology/@noSuchAttribute": 1,
+        }
+        self.assertEqual(scenario.apply_patch(bad_patch, dry_run=True),
+                         ["entomology/@noSuchAttribute",
+                          "entomology/vector/anopheles[@mosquito='funestus']/seasonality/@annualEIR"])
+        self.assertRaises(KeyError, scenario.apply_patch, bad_patch)
+        # Nothing is changed if some paths don't exist
+        self.assertEqual(scenario.entomology.scaledAnnualEIR, 10.0)
+
+        self.assertRaises(ValueError, scenario.apply_patch, {"entomology/vector[mosquito]/@mode": 1})
+        self.assertRaises(ValueError, scenario.apply_patch, {"": 1})
+
+    def test_human_interventions_index(self):
+        scenario = self.scenario
+        human = scenario.interventions.human
+        self.assertEqual(human["GVI"].name, "Nets")
+        self.assertRaises(KeyError, lambda: human["DDT"])
+        with open(os.path.join(base_dir, "files", "test_scenario", "ddt_snippet.xml")) as fp:
+            human.add(fp.read())
+        self.assertEqual(human["DDT"].id, "DDT")
+        self.assertEqual([component.id for component in human], ["GVI", "DDT"])
+        # New component is inserted before deployments
+        self.assertEqual([el.tag for el in human.et], ["component", "component", "deployment"])
+
+        human.deployments = [
+            {"name": "Both", "components": ["GVI", "DDT"], "timesteps": [{"time": 730, "coverage": 0.8}]},
+            {"name": "DDT only", "components": ["DDT"], "timesteps": [{"time": 73, "coverage": 0.5}]},
+        ]
+        del human["DDT"]
+        self.assertRaises(KeyError, lambda: human["DDT"])
+        self.assertEqual(len(human), 1)
+        self.assertEqual([deployment.name for deployment in human.deployments], ["Both"])
+        self.assertEqual(human.deployments[0].components, ["GVI"])
+
+        # The deployment without components is removed
+        del human["GVI"]
+        self.assertEqual(len(human), 0)
+        self.assertEqual(len(human.deployments), 0)
+        self.assertRaises(KeyError, human.__delitem__, "GVI")
+
+    def test_human_interventions_cache(self):
+        scenario = self.scenario
+        human = scenario.interventions.human
+        self.assertEqual(human["GVI"].name, "Nets")
+        # Index is kept between lookups
+        self.assertIs(scenario.interventions.human, human)
+        self.assertIsNotNone(human._components)
+
+        with open(os.path.join(base_dir, "files", "test_scenario", "ddt_snippet.xml")) as fp:
+            ddt = fp.read()
+        human.add(ddt)
+        human.add(ddt)
+        human.add(ddt, id="IRS")
+        # Duplicate ids don't change position of new components
+        self.assertEqual([el.attrib.get("id") for el in human.et], ["GVI", "DDT", "DDT", "IRS", None])
+
+        # Deployment.components invalidates the index
+        human.deployments[0].components = ["GVI", "IRS"]
+        self.assertIsNone(human._components)
+        del human["IRS"]
+        self.assertEqual(human.deployments[0].components, ["GVI"])
+
+        # apply_patch invalidates the index
+        scenario.apply_patch({"interventions/human/component[@id='GVI']/@id": "Nets"})
+        self.assertRaises(KeyError, lambda: scenario.interventions.human["GVI"])
+        self.assertEqual(scenario.interventions.human["Nets"].name, "Nets")
+
+        # The index is dropped with the scenario tree
+        scenario.load_xml(scenario.xml)
+        self.assertIsNot(scenario.interventions.human, human)
+
+    def test_seasonality(self):
+        seasonality = self.scenario.entomology.vectors["gambiae"].seasonality
+        values = seasonality.monthlyValues
+        self.assertEqual(len(seasonality.daily), 365)
+        self.assertEqual(len(seasonality.timesteps), 73)
+        self.assertTrue(seasonality.daily is seasonality.daily)
+
+        seasonality.smoothing = "none"
+        self.assertEqual(seasonality.daily[0], values[0])
+        self.assertEqual(seasonality.daily[364], values[11])
+        self.assertEqual(seasonality.timesteps[0], values[0])
+        seasonality.monthlyValues = [1.0] * 6 + [3.0] * 6
+        self.assertEqual(list(seasonality.values), [1.0] * 6 + [3.0] * 6)
+        self.assertEqual(seasonality.daily[181], 1.0)
+        self.assertEqual(seasonality.daily[183], 3.0)
+        self.assertEqual(self.scenario.entomology.vectors["gambiae"].seasonality.smoothing, "none")
+
+        seasonality.monthlyValues = [2.0] * 12
+        seasonality.smoothing = "fourier"
+        for value in seasonality.timesteps:
+            self.assertAlmostEqual(value, 2.0)
+        seasonality.monthlyValues = [0.0] * 6 + [3.0] * 6
+        self.assertTrue(all(value > 0 for value in seasonality.daily))
+        seasonality.monthlyValues = [-1.0] + [3.0] * 11
+        self.assertRaises(ValueError, lambda: seasonality.daily)
+
+    def test_fourier_smoothing(self):
+        # Reference: input EIR reported by OpenMalaria for test1.xml (four vectors with monthly values)
+        path = os.path.join(base_dir, "files", "test_output_parser")
+        with open(os.path.join(path, "test1.xml")) as fp:
+            scenario = Scenario(fp.read())
+        with open(os.path.join(path, "test1_ctsout.txt")) as fp:
+            reference = [float(line.split("\t")[1]) for line in fp.readlines()[2:75]]
+        daily = [0.0] * 365
+        for vector in scenario.entomology.vectors:
+            seasonality = vector.seasonality
+            # OpenMalaria scales every vector to its annualEIR
+            scale = seasonality.annualEIR / sum(seasonality.daily)
+            daily = [total + value * scale for total, value in zip(daily, seasonality.daily)]
+        # Time step N reports EIR of the previous five days
+        daily = daily[-5:] + daily[:-5]
+        timesteps = [sum(daily[start:start + 5]) for start in range(0, 365, 5)]
+        # and the total is scaled to scaledAnnualEIR
+        scale = scenario.entomology.scaledAnnualEIR / sum(timesteps)
+        for value, expected in zip(timesteps, reference):
+            self.assertAlmostEqual(value * scale / expected, 1.0, places=5)
+
+    def test_diff(self):
+        xml = self.scenario.xml
+        scenario = Scenario(xml)
+        self.assertEqual(self.scenario.diff(scenario), [])
+
+        scenario.entomology.scaledAnnualEIR = 5.0
+        ddt_xml = open(os.path.join(base_dir, "files", "test_scenario", "ddt_snippet.xml")).read()
+        scenario.interventions.human.add(ddt_xml)
+        deployment = scenario.interventions.human.deployments[0]
+        timesteps = deployment.timesteps
+        timesteps[0]["coverage"] = 0.7
+        deployment.timesteps = timesteps[:-1] + [{"time": 5000, "coverage": 0.1}]
+
+        changes = self.scenario.diff(scenario)
+        self.assertEqual(len(changes), 5)
+        self.assertIn(Change("changed", "entomology/@scaledAnnualEIR", "25", "5.0"), changes)
+        self.assertIn(Change("changed",
+                             "interventions/human/deployment[@name='Nets']/timed/deploy[@time='730']/@coverage",
+                             "0.6", "0.7"),
+                      changes)
+        kinds = dict((change.path, change.kind) for change in changes)
+        self.assertEqual(kinds["interventions/human/component[@id='DDT']"], "added")
+        self.assertEqual(kinds["interventions/human/deployment[@name='Nets']/timed/deploy[@time='5000']"], "added")
+        self.assertEqual(kinds["interventions/human/deployment[@name='Nets']/timed/deploy[@time='1834']"], "removed")
+
+        # Changed values can be reverted by apply_patch
+        scenario.apply_patch(dict((change.path, change.old) for change in changes if change.kind == "changed"))
+        self.assertEqual(scenario.entomology.scaledAnnualEIR, 25)
+
+        # Compare many scenarios against the same base
+        scenario2 = Scenario(xml)
+        scenario2.monitoring.surveys = [730, 736, 742]
+        results = list(diff_many(self.scenario, [xml, scenario2.xml, scenario2]))
+        self.assertEqual(results[0], [])
+        self.assertEqual(len(results[1]), 1)
+        self.assertEqual(results[1][0].kind, "removed")
+        self.assertEqual(results[1][0].path, "monitoring/surveys/surveyTime[4]")
+        self.assertEqual([(c.kind, c.path) for c in results[1]], [(c.kind, c.path) for c in results[2]])
+
+    def test_diff_positional_paths(self):
+        scenario = Scenario(self.scenario.xml)
+        vector = scenario.entomology.vectors.vectors.values()[0]
+        values = vector.et.find("seasonality/monthlyValues").findall("value")
+        values[3].text = "0.5"
+        surveys = scenario.et.find("monitoring/surveys").findall("surveyTime")
+        surveys[3].text = "999"
+        changes = self.scenario.diff(scenario)
+        paths = sorted(change.path for change in changes)
+        self.assertEqual(len(paths), 2)
+        self.assertTrue(paths[0].endswith("/seasonality/monthlyValues/value[4]"))
+        self.assertEqual(paths[1], "monitoring/surveys/surveyTime[4]")
+
+        # Diff paths can be applied by apply_patch in both directions
+        base = Scenario(self.scenario.xml)
+        base.apply_patch(dict((change.path, change.new) for change in changes))
+        self.assertEqual(base.diff(scenario), [])
+        scenario.apply_patch(dict((change.path, change.old) for change in changes))
+        self.assertEqual(self.scenario.diff(scenario), [])
+        self.assertEqual(base.et.find("monitoring/surveys").findall("surveyTime")[3].text, "999")
+        self.assertEqual([el.text for el in base.et.find("monitoring/surveys").findall("surveyTime")[:3]],
+                         [el.text for el in self.scenario.et.find("monitoring/surveys").findall("surveyTime")[:3]])
+
+        # Position is counted among elements matching the predicate
+        patch = {"interventions/human/deployment[@name='Nets']/timed/deploy[2]/@coverage": 0.25}
+        scenario.apply_patch(patch)
+        self.assertEqual(scenario.interventions.human.deployments[0].timesteps[1]["coverage"], 0.25)
+        self.assertEqual(scenario.apply_patch({"monitoring/surveys/surveyTime[99]": 1}, dry_run=True),
+                         ["monitoring/surveys/surveyTime[99]"])
+        self.assertRaises(ValueError, scenario.apply_patch, {"monitoring/surveys/surveyTime[0]": 1})
+
+    def test_diff_repeated_element(self):
+        # An element repeated only on one side is numbered on both sides
+        old = '<scenario><surveys><surveyTime>73</surveyTime><other/></surveys></scenario>'
+        new = '<scenario><surveys><surveyTime>73</surveyTime><surveyTime>146</surveyTime><other/></surveys></scenario>'
+        changes = diff(old, new)
+        self.assertEqual([(change.kind, change.path) for change in changes], [("added", "surveys/surveyTime[2]")])
+        self.assertEqual(changes[0].new.text, "146")
+        changes = diff(new, old)
+        self.assertEqual([(change.kind, change.path) for change in changes], [("removed", "surveys/surveyTime[2]")])
+
     def test_monitoring(self):
         scenario = self.scenario
         self.assertEqual(scenario.monitoring.name, "Monthly Surveys")
@@ -68,6 +322,19 @@ class TestScenario(unittest.TestCase):
         self.assertEqual(scenario.monitoring.continuous, ['simulated EIR', 'GVI coverage', 'Input EIR'])
         self.assertEqual(scenario.monitoring.SurveyOptions, ['nHost', 'nPatent', 'nUncomp', 'simulatedEIR', 'nMassGVI'])
 
+    def test_monitoring_surveys(self):
+        monitoring = self.scenario.monitoring
+        self.assertEqual(list(monitoring.survey_times), [730, 736, 742, 748])
+        self.assertTrue(monitoring.survey_times is monitoring.survey_times)
+        monitoring.surveys = range(73, 73 * 601, 73)
+        self.assertEqual(len(monitoring.survey_times), 600)
+        self.assertEqual(monitoring.surveys[-1], 73 * 600)
+        # Set from strings, other children of <surveys> are preserved
+        monitoring.surveys = ["5", "10"]
+        self.assertEqual(self.scenario.monitoring.surveys, [5, 10])
+        self.assertEqual([el.tag for el in monitoring.et.find("surveys")], ["surveyTime", "surveyTime"])
+        self.assertEqual(Scenario(self.scenario.xml).monitoring.surveys, [5, 10])
+
     def test_healthsystem(self):
         scenario = self.scenario
 
@@ -109,6 +376,29 @@ class TestScenario(unittest.TestCase):
         self.assertEqual(drug.treatmentAction.timesteps, 1)
         self.assertEqual(drug.treatmentAction.stage, 'blood')
 
+    def test_drugs_index(self):
+        drugs = self.scenario.healthSystem.ImmediateOutcomes.drugs
+        self.assertEqual([drug.name for drug in drugs], ["ACT", "QN", "selfTreatment"])
+        drugs.add("SP", 0.5, ["initialACR", "compliance"])
+        # Drugs are inserted after all drugs that go before them in drug_tag_order
+        drugs.add("SPAQ", 0.6, ["initialACR"])
+        drugs.add("CQ", 0.7, ["initialACR"])
+        drugs.add("SPAQ", 0.1, ["initialACR"])
+        self.assertEqual(len(drugs), 6)
+        self.assertEqual(drugs.SPAQ.initialACR, 0.6)
+        self.assertEqual([el.tag for el in drugs.et.find("initialACR")],
+                         ["CQ", "SP", "SPAQ", "ACT", "QN", "selfTreatment"])
+        self.assertEqual([el.tag for el in drugs.et.find("compliance")], ["SP", "ACT", "selfTreatment"])
+        self.assertRaises(KeyError, drugs.add, "XX", 0.5, ["initialACR"])
+        self.assertRaises(AttributeError, getattr, drugs, "_private")
+        # Sections outside drug_sections are scanned on first use
+        custom = drugs.et.makeelement("custom", {})
+        custom.append(custom.makeelement("ACT", {"value": "1"}))
+        drugs.et.append(custom)
+        drugs.add("SP", 0.2, ["custom"])
+        drugs.add("SP", 0.3, ["custom"])
+        self.assertEqual([el.tag for el in custom], ["SP", "ACT"])
+        self.assertRaises(ValueError, drugs.add, "SP", 0.5, ["missing"])
 
     def test_entomology(self):
         scenario = self.scenario
@@ -162,6 +452,78 @@ class TestScenario(unittest.TestCase):
         for vector in scenario3.entomology.vectors:
             print vector
 
+    def test_vectors_add_many(self):
+        scenario = self.scenario
+        gambiae = scenario.entomology.vectors["gambiae"]
+        anopheles_xml = ElementTree.tostring(gambiae.et)
+        vectors = []
+        for mosquito in ["funestus", "arabiensis"]:
+            vectors.append({
+                "anopheles": anopheles_xml.replace('mosquito="gambiae"', 'mosquito="%s"' % mosquito),
+                "GVI": '<anophelesParams propActive="0.5"><deterrency value="0.1"/>'
+                       '<preprandialKillingEffect value="0.2"/><postprandialKillingEffect value="0"/>'
+                       '</anophelesParams>',
+                "ITN": "<anophelesParams/>",
+            })
+        scenario.entomology.vectors.add_many(vectors, scenario.interventions)
+        self.assertEqual(sorted(vector.mosquito for vector in scenario.entomology.vectors),
+                         ["arabiensis", "funestus", "gambiae"])
+        self.assertEqual([el.tag for el in scenario.entomology.vectors.et],
+                         ["anopheles", "anopheles", "anopheles", "nonHumanHosts"])
+        params = scenario.interventions.human["GVI"].anophelesParams
+        self.assertEqual([p.mosquito for p in params], ["gambiae", "funestus", "arabiensis"])
+        self.assertEqual(params[2].propActive, 0.5)
+
+        # Index of the same Vectors object is updated
+        species = scenario.entomology.vectors
+        self.assertEqual([vector.mosquito for vector in species], ["gambiae", "funestus", "arabiensis"])
+        del species["funestus"]
+        self.assertRaises(KeyError, species.__delitem__, "funestus")
+        species.add(anopheles_xml.replace('mosquito="gambiae"', 'mosquito="farauti"'))
+        self.assertEqual(len(species), 3)
+        self.assertEqual(species.farauti.mosquito, "farauti")
+        self.assertEqual([el.attrib["mosquito"] for el in species.et.findall("anopheles")],
+                         ["gambiae", "arabiensis", "farauti"])
+        self.assertRaises(AttributeError, getattr, species, "_private")
+
+        # Invalid snippet, nothing is changed
+        xml = scenario.xml
+        self.assertRaises(AttributeError, scenario.entomology.vectors.add_many,
+                          [vectors[0]["anopheles"], "<anopheles/>"])
+        self.assertEqual(scenario.xml, xml)
+        # Vector is already in the scenario
+        self.assertIs(scenario.entomology.vectors, species)
+        self.assertRaises(ValueError, species.add_many, [anopheles_xml])
+        self.assertRaises(ValueError, species.add_many, [vectors[1]["anopheles"].replace("arabiensis", "minor")] * 2)
+        # anophelesParams without interventions
+        self.assertRaises(ValueError, species.add_many, [dict(vectors[1], anopheles=vectors[1]["anopheles"]
+                                                              .replace("arabiensis", "minor"))])
+        self.assertEqual(scenario.xml, xml)
+
+        # add passes anophelesParams to every GVI, ITN and IRS intervention
+        species.add(anopheles_xml.replace('mosquito="gambiae"', 'mosquito="minor"'),
+                    '<anophelesParams propActive="0.7"><deterrency value="0.1"/>'
+                    '<preprandialKillingEffect value="0.2"/><postprandialKillingEffect value="0"/></anophelesParams>',
+                    scenario.interventions)
+        params = scenario.interventions.human["GVI"].anophelesParams
+        self.assertEqual([(p.mosquito, p.propActive) for p in params][-1], ("minor", 0.7))
+
+    def test_vectors_add_duplicate_names(self):
+        # A file with duplicate mosquito names - new species still go after the last <anopheles> element
+        vectors = self.scenario.entomology.vectors
+        gambiae = vectors["gambiae"].et
+        vectors.et.insert(1, copy.deepcopy(gambiae))
+        vectors.add(ElementTree.tostring(gambiae).replace('mosquito="gambiae"', 'mosquito="funestus"'))
+        self.assertEqual([el.attrib.get("mosquito", el.tag) for el in vectors.et],
+                         ["gambiae", "gambiae", "funestus", "nonHumanHosts"])
+        # Replacing the <vector> element gives a new Vectors object
+        entomology = self.scenario.entomology
+        position = list(entomology.et).index(vectors.et)
+        entomology.et.remove(vectors.et)
+        entomology.et.insert(position, copy.deepcopy(vectors.et))
+        self.assertIsNot(entomology.vectors, vectors)
+        self.assertIs(self.scenario.entomology.vectors, entomology.vectors)
+
     def test_interventions(self):
         scenario = self.scenario
         self.assertEqual(scenario.interventions.changeHS, [])
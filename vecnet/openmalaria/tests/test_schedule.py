@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+import os
+
+from vecnet.openmalaria.scenario import Scenario
+from vecnet.openmalaria.scenario.schedule import Schedule
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+
+
+class TestSchedule(unittest.TestCase):
+    def setUp(self):
+        with open(os.path.join(base_dir, "input", "scenario70k60c.xml")) as fp:
+            self.scenario = Scenario(fp.read())
+
+    def test_columns(self):
+        schedule = Schedule([73, 146, 219], [0.5, 0.6, 0.7], maxAge=5)
+        self.assertEqual(list(schedule.time), [73, 146, 219])
+        self.assertEqual(list(schedule.maxAge), [5.0, 5.0, 5.0])
+        self.assertIsNone(schedule.minAge)
+        self.assertEqual(list(schedule)[1], {"time": 146, "coverage": 0.6, "maxAge": 5.0})
+        self.assertRaises(ValueError, Schedule, [73, 146], [0.5])
+
+    def test_periodic(self):
+        schedule = Schedule.periodic(730, 73, count=3, coverage=lambda t: t / 1000.0)
+        self.assertEqual(list(schedule.time), [730, 803, 876])
+        self.assertEqual(list(schedule.coverage), [0.73, 0.803, 0.876])
+        self.assertEqual(list(Schedule.periodic(0, 73, end=365).time), [0, 73, 146, 219, 292])
+        self.assertEqual(len(Schedule.periodic(0, 73, end=0)), 0)
+        self.assertRaises(ValueError, Schedule.periodic, 0, 73)
+
+    def test_deployment(self):
+        deployment = self.scenario.interventions.human.deployments[0]
+        timesteps = deployment.timesteps
+        self.assertEqual(len(deployment.schedule), len(timesteps))
+        self.assertEqual(list(deployment.schedule.time), [deploy["time"] for deploy in timesteps])
+
+        deployment.schedule = Schedule.periodic(73, 73, count=4, coverage=[0.1, 0.2, 0.3, 0.4], minAge=0.5)
+        self.assertEqual(deployment.timesteps[3], {"time": 292, "coverage": 0.4})
+        deploys = deployment.et.find("timed").findall("deploy")
+        self.assertEqual(len(deploys), 4)
+        self.assertEqual(deploys[0].attrib, {"time": "73", "coverage": "0.1", "minAge": "0.5"})
+
+        # Schedule is parsed from xml by a new Deployment object
+        deployment = self.scenario.interventions.human.deployments[0]
+        self.assertEqual(list(deployment.schedule.minAge), [0.5] * 4)
+        self.assertIsNone(deployment.schedule.maxAge)
+        self.assertEqual(list(deployment.schedule)[0], {"time": 73, "coverage": 0.1, "minAge": 0.5})
+
+        deployment.schedule = [{"time": 10, "coverage": 0.5}, {"time": 20, "coverage": 0.6, "maxAge": 5}]
+        self.assertEqual(list(self.scenario.interventions.human.deployments[0].schedule),
+                         [{"time": 10, "coverage": 0.5}, {"time": 20, "coverage": 0.6, "maxAge": 5.0}])
+        deployment.timesteps = [{"time": 1, "coverage": 1}]
+        self.assertEqual(deployment.timesteps, [{"time": 1, "coverage": 1.0}])
+
+    def test_deployment_mutation(self):
+        deployment = self.scenario.interventions.human.deployments[0]
+        schedule = Schedule([10, 20], [0.5, 0.6], maxAge=[5, 6])
+        deployment.schedule = schedule
+        # Changes of the assigned object don't affect the deployment
+        schedule.coverage[0] = 0.9
+        schedule.maxAge[1] = 1
+        self.assertEqual(deployment.timesteps[0], {"time": 10, "coverage": 0.5})
+        self.assertEqual(list(deployment.schedule.maxAge), [5.0, 6.0])
+        # Neither do changes of the returned object
+        deployment.schedule.time[1] = 999
+        deployment.schedule.coverage[1] = 0.1
+        self.assertEqual(deployment.timesteps[1], {"time": 20, "coverage": 0.6})
+        # Cache matches xml
+        deploys = deployment.et.find("timed").findall("deploy")
+        self.assertEqual([(d.attrib["time"], d.attrib["coverage"]) for d in deploys], [("10", "0.5"), ("20", "0.6")])
+        fresh = self.scenario.interventions.human.deployments[0]
+        self.assertEqual(fresh.timesteps, deployment.timesteps)
+
+
+if __name__ == "__main__":
+    unittest.main()
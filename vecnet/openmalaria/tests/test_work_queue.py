@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+from vecnet.openmalaria.experiment import ExperimentSpecification
+from vecnet.openmalaria.runner import Runner
+from vecnet.openmalaria.work_queue import WorkQueue, process_queue, DONE, FAILED, PENDING, RUNNING
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+stub = [sys.executable, os.path.join(base_dir, "files", "test_runner", "openmalaria_stub.py")]
+
+
+class TestWorkQueue(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "queue.sqlite")
+        self.experiment = ExperimentSpecification({
+            "base": "<xml>@itn@ @seed@</xml>",
+            "sweeps": {"itn": {"range": {"placeholder": "@itn@", "start": 0, "stop": 10}}}
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_publish_and_resume(self):
+        queue = WorkQueue(self.path)
+        scenarios = self.experiment.scenarios(generate_seed=True)
+        self.assertEqual(queue.publish(next(scenarios) for i in range(4)), 4)
+        queue.close()
+
+        # Interrupted publish is resumed, scenarios are not duplicated
+        queue = WorkQueue(self.path)
+        self.assertEqual(queue.publish(self.experiment.scenarios(generate_seed=True), chunk_size=3), 6)
+        self.assertEqual(len(queue), 10)
+        self.assertEqual(queue.publish(self.experiment.scenarios(generate_seed=True)), 0)
+        expected = [scenario.xml for scenario in self.experiment.scenarios(generate_seed=True)]
+        items = [queue.claim("worker") for i in range(10)]
+        self.assertEqual([item.xml for item in items], expected)
+        self.assertEqual([item.id for item in items], range(1, 11))
+        self.assertEqual(items[3].parameters, {"itn": "3"})
+        self.assertIsNone(queue.claim("worker"))
+        queue.close()
+
+    def test_claim(self):
+        queue = WorkQueue(self.path)
+        queue.publish(["<xml>1</xml>", "<xml>2</xml>", "<xml>3</xml>"])
+        other = WorkQueue(self.path)
+        item1 = queue.claim("worker1")
+        item2 = other.claim("worker2")
+        self.assertEqual((item1.id, item2.id), (1, 2))
+        self.assertIsNone(item1.parameters)
+
+        self.assertTrue(queue.done(item1.id, "worker1", ["output.txt"]))
+        self.assertFalse(queue.done(item2.id, "worker1"))  # claimed by another worker
+        self.assertTrue(other.failed(item2.id, "worker2", "Exit code 1", retry=True))
+        self.assertEqual(queue.counts(), {PENDING: 2, RUNNING: 0, DONE: 1, FAILED: 0})
+        self.assertEqual(queue.get(1)["outputs"], ["output.txt"])
+
+        item = other.claim("worker2")
+        self.assertEqual((item.id, item.attempts), (2, 2))
+        item = other.claim("worker2")
+        self.assertEqual(item.id, 3)
+        time.sleep(0.05)
+        # Worker is alive
+        self.assertTrue(other.heartbeat(3, "worker2"))
+        self.assertIsNone(queue.claim("worker1", stale_after=10))
+        # Worker is dead
+        time.sleep(0.05)
+        item = queue.claim("worker1", stale_after=0.01)
+        self.assertEqual(item.id, 2)
+        self.assertFalse(other.heartbeat(2, "worker2"))
+        self.assertEqual(queue.get(2)["worker"], "worker1")
+        self.assertRaises(KeyError, queue.get, 4)
+
+        # Scenario 3 killed two workers
+        time.sleep(0.05)
+        self.assertIsNone(queue.claim("worker1", stale_after=0.01, max_attempts=1))
+        status = queue.get(3)
+        self.assertEqual((status["status"], status["attempts"]), (FAILED, 1))
+        self.assertTrue(status["error"].startswith("No heartbeat"))
+        queue.close()
+        other.close()
+
+    def test_process_queue(self):
+        with open(os.path.join(base_dir, "files", "test_output_parser", "scenario.xml")) as fp:
+            xml = fp.read()
+        queue = WorkQueue(self.path)
+        queue.publish([xml, xml.replace("?>", "?><!-- stub:fail -->", 1), xml])
+        workdir = os.path.join(self.directory, "runs")
+        processed = process_queue(self.path, Runner(stub, workdir), worker="test", max_attempts=2)
+        self.assertEqual(processed, 4)
+        self.assertEqual(queue.counts(), {PENDING: 0, RUNNING: 0, DONE: 2, FAILED: 1})
+        status = queue.get(2)
+        self.assertEqual((status["status"], status["attempts"], status["error"]), (FAILED, 2, "Exit code 1"))
+        self.assertIn(os.path.join(workdir, "scenario3", "output.txt"), queue.get(3)["outputs"])
+        queue.close()
+
+    def test_wait(self):
+        with open(os.path.join(base_dir, "files", "test_output_parser", "scenario.xml")) as fp:
+            xml = fp.read()
+        queue = WorkQueue(self.path)
+        queue.publish([xml])
+        # Worker dies after claiming the first scenario
+        self.assertEqual(queue.claim("dead").id, 1)
+        self.assertFalse(queue.is_complete())
+
+        def scenarios():
+            # The first scenario is already published
+            for i in range(4):
+                time.sleep(0.2)
+                yield xml
+
+        def publisher():
+            publisher_queue = WorkQueue(self.path)
+            publisher_queue.publish(scenarios(), chunk_size=1, complete=True)
+            publisher_queue.close()
+
+        thread = threading.Thread(target=publisher)
+        thread.start()
+        # Worker catches up with the publisher and waits for the rest of the scenarios
+        processed = process_queue(self.path, Runner(stub, os.path.join(self.directory, "runs")), worker="test",
+                                  stale_after=0.5, max_attempts=2, wait=True, poll_interval=0.05)
+        thread.join()
+        self.assertTrue(queue.is_complete())
+        self.assertEqual(processed, 4)
+        self.assertEqual(queue.counts(), {PENDING: 0, RUNNING: 0, DONE: 4, FAILED: 0})
+        self.assertEqual(queue.get(1)["attempts"], 2)
+        queue.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
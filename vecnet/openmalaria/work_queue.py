@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of the vecnet.openmalaria package.
+# For copyright and licensing information about this package, see the
+# NOTICE.txt and LICENSE.txt files in its top-level directory; they are
+# available at https://github.com/vecnet/vecnet.openmalaria
+#
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License (MPL), version 2.0.  If a copy of the MPL was not distributed
+# with this file, You can obtain one at http://mozilla.org/MPL/2.0/.
+"""
+Durable queue of scenarios in a SQLite database.
+
+Scenarios are published by om_expand --queue (or WorkQueue.publish) and claimed by workers on the same host. Every
+change is a single transaction, so the queue survives crashes of both the publisher and the workers: publishing
+resumes after the last stored scenario, and scenarios claimed by a dead worker are claimed again when their heartbeat
+is older than stale_after seconds.
+
+The database must be on a local filesystem. Keeping it on a network filesystem (NFS, SMB) is not supported: SQLite
+file locking is unreliable there, so BEGIN IMMEDIATE doesn't prevent two workers from claiming the same scenario.
+
+    # Publisher
+    queue = WorkQueue("experiment1.sqlite")
+    queue.publish(ExperimentSpecification(fp).scenarios(generate_seed=True), complete=True)
+
+    # Worker, started at the same time as the publisher
+    process_queue("experiment1.sqlite", Runner("openMalaria", "/tmp/experiment1"), stale_after=3600, wait=True)
+
+Scenario status is one of PENDING, RUNNING, DONE, FAILED.
+"""
+import itertools
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS scenarios (
+    id INTEGER PRIMARY KEY,
+    xml TEXT NOT NULL,
+    parameters TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    heartbeat REAL,
+    outputs TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS scenarios_status ON scenarios (status, id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class WorkItem(object):
+    """
+    Scenario claimed by a worker.
+    id - number of the scenario (starting from 1)
+    xml - scenario xml
+    parameters - dictionary of parameters used to generate the scenario (experiment.Scenario.parameters)
+    attempts - number of times the scenario has been claimed, including this one
+    """
+    def __init__(self, id, xml, parameters, attempts):
+        self.id = id
+        self.xml = xml
+        self.parameters = parameters
+        self.attempts = attempts
+
+
+class WorkQueue(object):
+    """
+    path - SQLite database file, created if it doesn't exist
+    timeout - how long to wait for a lock held by another process, in seconds
+    A WorkQueue object (sqlite connection) should only be used by one thread.
+    """
+    def __init__(self, path, timeout=60):
+        self.path = path
+        # Transactions are started explicitly
+        self.connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+        self.connection.executescript(SCHEMA)
+
+    def close(self):
+        self.connection.close()
+
+    def _transaction(self, function, *args):
+        """
+        Run function(cursor, *args) in a write transaction
+        """
+        cursor = self.connection.cursor()
+        # Take the write lock immediately, so claims by concurrent workers never interleave
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            result = function(cursor, *args)
+        except:
+            cursor.execute("ROLLBACK")
+            raise
+        cursor.execute("COMMIT")
+        return result
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM scenarios").fetchone()[0]
+
+    def publish(self, scenarios, chunk_size=1000, complete=False):
+        """
+        Add scenarios (iterable of experiment.Scenario objects or xml strings) to the queue.
+        If the queue already has N scenarios, the first N scenarios are skipped, so an interrupted publish can be
+        resumed by calling it again with the same scenarios. Scenarios are committed in chunks, workers can claim them
+        before all scenarios are published.
+        complete - scenarios are the whole experiment, mark the queue complete after the last one is added
+        :returns: number of added scenarios
+        """
+        start = len(self)
+        scenarios = itertools.islice(scenarios, start, None)
+        added = 0
+        while True:
+            rows = []
+            for index, scenario in enumerate(itertools.islice(scenarios, chunk_size), start + added + 1):
+                parameters = getattr(scenario, "parameters", None)
+                rows.append((index, getattr(scenario, "xml", scenario), json.dumps(parameters)))
+            if not rows:
+                if complete:
+                    self.mark_complete()
+                return added
+            self._transaction(lambda cursor: cursor.executemany(
+                "INSERT INTO scenarios (id, xml, parameters) VALUES (?, ?, ?)", rows))
+            added += len(rows)
+
+    def mark_complete(self):
+        """
+        Tell workers that no more scenarios will be published
+        """
+        self._transaction(lambda cursor: cursor.execute("INSERT OR REPLACE INTO meta VALUES ('complete', '1')"))
+
+    def is_complete(self):
+        return self.connection.execute("SELECT value FROM meta WHERE key = 'complete'").fetchone() is not None
+
+    def claim(self, worker, stale_after=None, max_attempts=None):
+        """
+        Claim the first pending scenario. If stale_after is set, a running scenario without heartbeat for stale_after
+        seconds is claimed too (its worker is considered dead). If max_attempts is set, such scenario is marked as
+        failed instead when it has been claimed max_attempts times.
+        :rtype: WorkItem or None if there are no scenarios to claim
+        """
+        def claim(cursor):
+            now = time.time()
+            while True:
+                if stale_after is None:
+                    cursor.execute("SELECT id, status, attempts FROM scenarios WHERE status = ? ORDER BY id LIMIT 1",
+                                   (PENDING, ))
+                else:
+                    cursor.execute("SELECT id, status, attempts FROM scenarios "
+                                   "WHERE status = ? OR (status = ? AND heartbeat < ?) ORDER BY id LIMIT 1",
+                                   (PENDING, RUNNING, now - stale_after))
+                row = cursor.fetchone()
+                if row is None:
+                    return None
+                if row[1] == RUNNING and max_attempts is not None and row[2] >= max_attempts:
+                    # The scenario keeps killing its workers
+                    cursor.execute("UPDATE scenarios SET status = ?, heartbeat = ?, error = ? WHERE id = ?",
+                                   (FAILED, now, "No heartbeat for %s seconds" % stale_after, row[0]))
+                    continue
+                break
+            cursor.execute("UPDATE scenarios SET status = ?, worker = ?, heartbeat = ?, attempts = attempts + 1 "
+                           "WHERE id = ?", (RUNNING, worker, now, row[0]))
+            cursor.execute("SELECT id, xml, parameters, attempts FROM scenarios WHERE id = ?", (row[0], ))
+            id, xml, parameters, attempts = cursor.fetchone()
+            return WorkItem(id, xml, json.loads(parameters) if parameters else None, attempts)
+        return self._transaction(claim)
+
+    def _update(self, id, worker, assignments, values):
+        """
+        Update a scenario claimed by worker. Returns False if the scenario was claimed by another worker since then.
+        """
+        def update(cursor):
+            cursor.execute("UPDATE scenarios SET %s WHERE id = ? AND worker = ? AND status = ?" % assignments,
+                           tuple(values) + (id, worker, RUNNING))
+            return cursor.rowcount == 1
+        return self._transaction(update)
+
+    def heartbeat(self, id, worker):
+        """
+        Tell other workers that the scenario is still running. Returns False if the claim was lost.
+        """
+        return self._update(id, worker, "heartbeat = ?", (time.time(), ))
+
+    def done(self, id, worker, outputs=None):
+        """
+        Mark scenario as done. outputs - json-serializable description of outputs (i.e. list of file paths)
+        """
+        return self._update(id, worker, "status = ?, heartbeat = ?, outputs = ?",
+                            (DONE, time.time(), json.dumps(outputs)))
+
+    def failed(self, id, worker, error, retry=False):
+        """
+        Mark scenario as failed, or return it to the queue if retry is True
+        """
+        return self._update(id, worker, "status = ?, heartbeat = ?, error = ?",
+                            (PENDING if retry else FAILED, time.time(), error))
+
+    def counts(self):
+        """
+        Number of scenarios in every status, dictionary status -> count
+        """
+        counts = dict((status, 0) for status in (PENDING, RUNNING, DONE, FAILED))
+        for status, count in self.connection.execute("SELECT status, COUNT(*) FROM scenarios GROUP BY status"):
+            counts[status] = count
+        return counts
+
+    def get(self, id):
+        """
+        Status of a scenario: dictionary with status, worker, attempts, outputs and error keys
+        """
+        row = self.connection.execute("SELECT status, worker, attempts, outputs, error FROM scenarios WHERE id = ?",
+                                      (id, )).fetchone()
+        if row is None:
+            raise KeyError(id)
+        status, worker, attempts, outputs, error = row
+        return {"status": status, "worker": worker, "attempts": attempts,
+                "outputs": json.loads(outputs) if outputs else None, "error": error}
+
+
+def _heartbeat(path, item, worker, interval, stop):
+    queue = WorkQueue(path)
+    try:
+        while not stop.wait(interval):
+            queue.heartbeat(item.id, worker)
+    finally:
+        queue.close()
+
+
+def process_queue(path, runner, worker=None, stale_after=None, heartbeat_interval=60, max_attempts=1, wait=False,
+                  poll_interval=10):
+    """
+    Claim and simulate scenarios from the queue until there are no scenarios left.
+    runner - runner.Runner, scenario N is simulated in <runner.workdir>/scenarioN
+    worker - name of the worker, <hostname>:<pid> by default
+    max_attempts - failed scenarios (and scenarios of dead workers) are returned to the queue until they are claimed
+    max_attempts times
+    wait - if there are no scenarios to claim, check again every poll_interval seconds until the queue is complete
+    (see WorkQueue.publish) and there are no pending scenarios. If stale_after is set, the worker also waits for
+    running scenarios, so scenarios of workers that die are claimed again.
+    :returns: number of processed scenarios
+    """
+    if worker is None:
+        worker = "%s:%s" % (socket.gethostname(), os.getpid())
+    queue = WorkQueue(path)
+    processed = 0
+    try:
+        while True:
+            item = queue.claim(worker, stale_after, max_attempts)
+            if item is None:
+                if not wait:
+                    return processed
+                # Check completion before counting, so scenarios published in between are not missed
+                complete = queue.is_complete()
+                counts = queue.counts()
+                if complete and counts[PENDING] == 0 and (stale_after is None or counts[RUNNING] == 0):
+                    return processed
+                time.sleep(poll_interval)
+                continue
+            stop = threading.Event()
+            thread = threading.Thread(target=_heartbeat, args=(path, item, worker, heartbeat_interval, stop))
+            thread.daemon = True
+            thread.start()
+            try:
+                result = runner.run_scenario(item.id, item.xml)
+            finally:
+                stop.set()
+                thread.join()
+            if result.ok:
+                outputs = sorted(os.path.join(result.workdir, filename) for filename in os.listdir(result.workdir))
+                queue.done(item.id, worker, outputs)
+            else:
+                queue.failed(item.id, worker, result.error, retry=item.attempts < max_attempts)
+            processed += 1
+    finally:
+        queue.close()